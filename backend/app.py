@@ -1,25 +1,70 @@
 from __future__ import annotations
 
+import math
 import os
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from .models.response_models import PlaylistResponse
 from .routers import auth, moods, playlists
 from .services.gemini_client import GeminiClient
 from .services.google_auth import GoogleAuthService
 from .services.muse_agent import MuseAgent
+from .services.sqlite_user_store import SQLiteUserStore
+from .services.track_catalog import TrackCatalog
 from .services.user_store import UserStore
 from .services.youtube_music import YouTubeMusicService
-from .utils.cache import DeviceCache
+from .utils.cache import DeviceCache, SharedDeviceCache
 from .utils.config import Settings, get_settings
+from .utils.http import build_http_client
 from .utils.logger import get_logger
-from .utils.rate_limiter import RateLimiter
+from .utils.rate_limiter import RateLimit, RateLimiter
+from .utils.scheduler import UpstreamBusy, build_upstream_schedulers
+from .utils.state_backend import RedisStateBackend, SQLiteStateBackend, StateBackend
 
 logger = get_logger()
 
 
+def build_user_store(settings: Settings, catalog: TrackCatalog) -> UserStore | SQLiteUserStore:
+    if settings.user_store_backend == "sqlite":
+        return SQLiteUserStore(settings.user_store_sqlite_path, migrate_from=settings.user_store_path)
+    if settings.user_store_backend != "json":
+        raise RuntimeError(f"Unknown USER_STORE_BACKEND: {settings.user_store_backend}")
+    return UserStore(
+        settings.user_store_path,
+        compact_threshold=settings.user_store_compact_threshold,
+        compact_interval=settings.user_store_compact_interval,
+        flush_interval=settings.user_store_flush_interval_ms / 1000,
+        flush_max_pending=settings.user_store_flush_max_pending,
+        history_cache_users=settings.user_store_history_cache_users,
+        catalog=catalog,
+    )
+
+
+def build_state_backend(settings: Settings) -> StateBackend | None:
+    if settings.state_backend == "memory":
+        return None
+    if settings.state_backend == "sqlite":
+        return SQLiteStateBackend(settings.state_sqlite_path)
+    if settings.state_backend == "redis":
+        return RedisStateBackend(settings.state_redis_url)
+    raise RuntimeError(f"Unknown STATE_BACKEND: {settings.state_backend}")
+
+
+def build_device_cache(settings: Settings, backend: StateBackend | None) -> DeviceCache | SharedDeviceCache:
+    if backend is not None:
+        return SharedDeviceCache(backend, settings.cache_ttl_seconds, settings.cache_max_entries)
+    return DeviceCache(
+        settings.cache_ttl_seconds,
+        settings.cache_max_entries,
+        max_total_entries=settings.cache_max_total_entries,
+        max_total_bytes=settings.cache_max_total_bytes,
+        sweep_interval=settings.cache_sweep_interval,
+    )
+
+
 def create_app(settings: Settings | None = None, *, bootstrap_clients: bool = True) -> FastAPI:
     settings = settings or get_settings()
     app = FastAPI(title=settings.app_name, version=settings.version)
@@ -40,25 +85,68 @@ def create_app(settings: Settings | None = None, *, bootstrap_clients: bool = Tr
     )
 
     app.state.settings = settings
-    app.state.rate_limiter = RateLimiter(settings.rate_limit_requests, settings.rate_limit_window)
-    app.state.device_cache = DeviceCache(settings.cache_ttl_seconds, settings.cache_max_entries)
+    app.state.upstreams = build_upstream_schedulers(settings)
+    app.state.state_backend = build_state_backend(settings)
+    app.state.rate_limiter = RateLimiter(
+        settings.rate_limit_requests,
+        settings.rate_limit_window,
+        routes={
+            "stream": RateLimit(settings.rate_limit_stream_requests, settings.rate_limit_window),
+            "history": RateLimit(settings.rate_limit_history_requests, settings.rate_limit_window),
+            "auth": RateLimit(settings.rate_limit_auth_requests, settings.rate_limit_window),
+        },
+        sweep_interval=settings.rate_limit_sweep_interval,
+        backend=app.state.state_backend,
+    )
+    app.state.device_cache = build_device_cache(settings, app.state.state_backend)
     app.state.muse_agent = MuseAgent(settings.agent_memory)
     app.state.google_auth = GoogleAuthService(settings)
-    app.state.user_store = UserStore()
+    app.state.track_catalog = TrackCatalog(settings.track_catalog_path)
+    app.state.user_store = build_user_store(settings, app.state.track_catalog)
+    app.state.user_store.add_credentials_listener(app.state.google_auth.forget_access_token)
 
     if bootstrap_clients:
 
         @app.on_event("startup")
         async def startup() -> None:
             logger.info("Starting Muse backend")
-            app.state.gemini_client = GeminiClient(settings)
-            app.state.youtube_service = YouTubeMusicService(settings)
+            app.state.gemini_client = GeminiClient(settings, scheduler=app.state.upstreams["gemini"])
+            app.state.http_client = build_http_client(settings)
+            app.state.youtube_service = YouTubeMusicService(
+                settings, http=app.state.http_client, scheduler=app.state.upstreams["youtube"]
+            )
+            app.state.user_store.add_credentials_listener(app.state.youtube_service.forget_credentials)
+            await app.state.user_store.start()
+            if app.state.state_backend is not None:
+                await app.state.state_backend.start()
+            await app.state.device_cache.start()
+            await app.state.rate_limiter.start()
 
         @app.on_event("shutdown")
         async def shutdown() -> None:
             logger.info("Shutting down Muse backend")
             if client := getattr(app.state, "gemini_client", None):
                 await client.close()
+            if youtube := getattr(app.state, "youtube_service", None):
+                await youtube.close()
+            await app.state.google_auth.close()
+            if http_client := getattr(app.state, "http_client", None):
+                await http_client.aclose()
+            await app.state.device_cache.stop()
+            await app.state.rate_limiter.stop()
+            await app.state.user_store.stop()
+            if app.state.state_backend is not None:
+                await app.state.state_backend.stop()
+            app.state.track_catalog.close()
+
+    @app.exception_handler(UpstreamBusy)
+    async def upstream_busy(request: Request, exc: UpstreamBusy) -> JSONResponse:
+        logger.warning("Turned away %s %s: %s", request.method, request.url.path, exc)
+        return JSONResponse(
+            {"detail": "Muse is at capacity right now. Please try again shortly."},
+            status_code=exc.status_code,
+            headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        )
 
     app.include_router(moods.router)
     app.include_router(playlists.router)
@@ -68,6 +156,19 @@ def create_app(settings: Settings | None = None, *, bootstrap_clients: bool = Tr
     async def healthcheck() -> dict[str, str]:
         return {"status": "ok", "version": settings.version}
 
+    @app.get("/stats")
+    async def stats() -> dict[str, dict]:
+        components = {
+            "device_cache": app.state.device_cache,
+            "google_auth": app.state.google_auth,
+            "rate_limiter": app.state.rate_limiter,
+            "gemini": getattr(app.state, "gemini_client", None),
+            "youtube": getattr(app.state, "youtube_service", None),
+        }
+        stats = {name: component.stats() for name, component in components.items() if hasattr(component, "stats")}
+        stats["upstreams"] = {name: scheduler.stats() for name, scheduler in app.state.upstreams.items()}
+        return stats
+
     return app
 
 
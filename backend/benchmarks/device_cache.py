@@ -0,0 +1,119 @@
+"""Lookup throughput of ``DeviceCache`` across many devices with mixed entry keys.
+
+Run from the repository root::
+
+    python -m backend.benchmarks.device_cache
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import deque
+from typing import Any
+
+from ..utils.cache import CacheEntry, DeviceCache
+
+
+class LegacyDeviceCache:
+    """The pre-indexing cache: one global lock and a linear scan filtering each lookup by key."""
+
+    def __init__(self, ttl_seconds: int, max_entries: int) -> None:
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = asyncio.Lock()
+        self._store: dict[str, deque[CacheEntry]] = {}
+
+    async def remember(self, device_id: str, key: str, value: Any, payload: bytes | None = None) -> None:
+        async with self._lock:
+            queue = self._store.setdefault(device_id, deque(maxlen=self.max_entries))
+            queue.appendleft(CacheEntry(key=key, value=value, expires_at=time.time() + self.ttl, payload=payload))
+
+    async def get_latest(self, device_id: str, key: str | None = None) -> Any | None:
+        async with self._lock:
+            self._prune(device_id)
+            queue = self._store.get(device_id)
+            if not queue:
+                return None
+            if key is None:
+                return queue[0].value
+            for entry in queue:
+                if entry.key == key:
+                    return entry.value
+            return None
+
+    async def history(self, device_id: str, key: str | None = None) -> list[CacheEntry]:
+        async with self._lock:
+            self._prune(device_id)
+            queue = self._store.get(device_id)
+            if not queue:
+                return []
+            if key is None:
+                return list(queue)
+            return [entry for entry in queue if entry.key == key]
+
+    def _prune(self, device_id: str) -> None:
+        queue = self._store.get(device_id)
+        if not queue:
+            return
+        now = time.time()
+        while queue and queue[-1].expires_at < now:
+            queue.pop()
+
+
+async def _run(cache: Any, devices: int, entries: int, workers: int, duration: float) -> list[float]:
+    # Mostly mood entries with a few playlists, so key filtering has something to skip.
+    for i in range(devices):
+        for j in range(entries):
+            key = "playlist" if j % 5 == 0 else "mood"
+            await cache.remember(f"device-{i}", key, {"mood": j}, payload=b"{}")
+    deadline = time.perf_counter() + duration
+    latencies: list[float] = []
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            device_id = f"device-{random.randrange(devices)}"
+            started = time.perf_counter()
+            await asyncio.sleep(0)
+            if random.random() < 0.1:
+                await cache.remember(device_id, "playlist", {"mood": 0}, payload=b"{}")
+            else:
+                await cache.history(device_id, key="playlist")
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return latencies
+
+
+def _report(label: str, latencies: list[float], duration: float) -> None:
+    ordered = sorted(latencies)
+    p99 = ordered[int(len(ordered) * 0.99)]
+    print(
+        f"{label:<10} ops/s={len(ordered) / duration:>10.0f} "
+        f"p50={statistics.median(ordered) * 1e6:8.1f}us p99={p99 * 1e6:8.1f}us"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=10_000)
+    parser.add_argument("--entries", type=int, default=20, help="Entries cached per device")
+    parser.add_argument("--workers", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=3.0)
+    args = parser.parse_args()
+
+    variants = {
+        "legacy": lambda: LegacyDeviceCache(ttl_seconds=1800, max_entries=args.entries),
+        "indexed": lambda: DeviceCache(
+            ttl_seconds=1800, max_entries=args.entries, max_total_entries=args.devices * args.entries
+        ),
+    }
+    for label, factory in variants.items():
+        latencies = asyncio.run(_run(factory(), args.devices, args.entries, args.workers, args.duration))
+        _report(label, latencies, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Per-chunk overhead of reading a Gemini stream: a thread hop per chunk vs the async SDK.
+
+Run from the repository root::
+
+    python -m backend.benchmarks.gemini_stream
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import AsyncIterator, Iterator
+
+from ..services.gemini_client import GeminiClient
+from ..utils.config import Settings
+
+MOOD = {"primary_mood": "nocturnal", "narrative": "Neon and tail lights.", "keywords": ["synthwave"]}
+
+
+def _texts(chunks: int) -> list[str]:
+    return [f"word{i} " for i in range(chunks - 1)] + ["###JSON_SEPARATOR###" + json.dumps(MOOD)]
+
+
+class FakeModels:
+    """Stands in for ``client.models`` (sync) and ``client.aio.models`` (async)."""
+
+    def __init__(self, chunks: int) -> None:
+        self._texts = _texts(chunks)
+
+    def generate_content_stream(self, **_) -> Iterator[SimpleNamespace]:
+        return (SimpleNamespace(text=text) for text in self._texts)
+
+
+class FakeAsyncModels(FakeModels):
+    async def generate_content_stream(self, **_) -> AsyncIterator[SimpleNamespace]:
+        async def stream() -> AsyncIterator[SimpleNamespace]:
+            for text in self._texts:
+                yield SimpleNamespace(text=text)
+
+        return stream()
+
+
+async def _thread_per_chunk(models: FakeModels) -> int:
+    """The previous loop: every ``next()`` on the sync SDK iterator ran in the default executor."""
+    iterator = iter(await asyncio.to_thread(models.generate_content_stream))
+
+    def safe_next():
+        try:
+            return next(iterator)
+        except StopIteration:
+            return None
+
+    received = 0
+    while await asyncio.to_thread(safe_next) is not None:
+        received += 1
+    return received
+
+
+async def _native_async(client: GeminiClient) -> int:
+    received = 0
+    async for _ in client._analyze_mood_stream("late night drive"):
+        received += 1
+    return received
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    client = GeminiClient(Settings(gemini_api_key="benchmark", gemini_requests_per_minute=0))
+    client._client = SimpleNamespace(aio=SimpleNamespace(models=FakeAsyncModels(args.chunks)))
+    variants = {
+        "thread hop per chunk": lambda: _thread_per_chunk(FakeModels(args.chunks)),
+        "native async": lambda: _native_async(client),
+    }
+    for label, run in variants.items():
+
+        async def rounds() -> float:
+            started = time.perf_counter()
+            for _ in range(args.rounds):
+                await run()
+            return time.perf_counter() - started
+
+        elapsed = asyncio.run(rounds())
+        per_chunk = elapsed / (args.rounds * args.chunks)
+        print(f"{label:<22} {per_chunk * 1e6:8.2f}us/chunk  ({args.chunks} chunks x {args.rounds} rounds)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""How many labelled paraphrases share a mood, by cache key, and whether any distinct pair does.
+
+Run from the repository root::
+
+    python -m backend.benchmarks.prompt_similarity
+"""
+from __future__ import annotations
+
+import argparse
+from typing import Callable, Hashable
+
+from ..services.gemini_client import canonical_prompt
+from ..services.prompt_index import paraphrase_key
+
+# Pairs that should reuse one mood profile.
+PARAPHRASES = [
+    ("chill focus music", "chill music for focus"),
+    ("chill focus music", "chill focus music please"),
+    ("gym hype", "gym hype playlist"),
+    ("songs for a rainy day", "songs for a rainy afternoon"),
+    ("late night drive", "late night driving"),
+    ("late night drive", "music for a late night drive"),
+    ("sad breakup songs", "sad songs for a breakup"),
+    ("upbeat morning run", "upbeat music for my morning run"),
+    ("study music lofi", "lofi study music"),
+    ("happy summer vibes", "summer happy vibes"),
+    ("dinner party jazz", "jazz for a dinner party"),
+    ("90s hip hop throwback", "90s hiphop throwbacks"),
+    ("relaxing piano to sleep", "relaxing piano for sleep"),
+    ("road trip singalong", "road trip sing along songs"),
+]
+
+# Pairs that look alike but must not share a profile.
+DISTINCT = [
+    ("songs by drake", "songs by adele"),
+    ("sad breakup songs", "happy wedding songs"),
+    ("chill focus music", "hype gym music"),
+    ("late night drive", "early morning coffee"),
+    ("80s rock", "90s rock"),
+    ("taylor swift folklore", "taylor swift reputation"),
+    ("jazz for dinner", "metal for the gym"),
+    ("rainy day blues", "sunny day pop"),
+    ("study music lofi", "party music edm"),
+    ("kendrick lamar deep cuts", "kanye west deep cuts"),
+    # One word apart, so they score high, but the word is a negation or a qualifier.
+    ("not sad songs", "sad songs"),
+    ("unhappy music", "happy music"),
+    ("taylor swift covers", "taylor swift"),
+    ("kanye west old", "kanye west"),
+    ("songs without lyrics", "songs with lyrics"),
+    ("no rap", "rap"),
+]
+
+
+KEYS: dict[str, Callable[[str], Hashable]] = {
+    "canonical prompt": canonical_prompt,
+    "paraphrase key": lambda prompt: paraphrase_key(canonical_prompt(prompt)),
+}
+
+
+def shared(key: Callable[[str], Hashable], pairs: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    return [(a, b) for a, b in pairs if key(a) is not None and key(a) == key(b)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="List the paraphrases each key misses")
+    args = parser.parse_args()
+
+    print(f"{'key':>16} {'reused':>7} {'false matches':>14}")
+    for name, key in KEYS.items():
+        reused = shared(key, PARAPHRASES)
+        print(f"{name:>16} {len(reused) / len(PARAPHRASES):>7.2f} {len(shared(key, DISTINCT)):>14}")
+        if args.verbose:
+            for a, b in PARAPHRASES:
+                if (a, b) not in reused:
+                    print(f"{'':>16} missed: {a!r} / {b!r}")
+
+
+if __name__ == "__main__":
+    main()
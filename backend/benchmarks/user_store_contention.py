@@ -0,0 +1,91 @@
+"""Read latency of ``UserStore`` while other users' history is being written.
+
+Run from the repository root::
+
+    python -m backend.benchmarks.user_store_contention
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+
+from ..services.user_store import UserProfile, UserStore
+
+PLAYLIST = {
+    "prompt": "late night drive",
+    "mood": {"primary_mood": "nocturnal", "narrative": "Neon and tail lights."},
+    "tracks": [{"title": f"Song {i}", "artist": "Muse", "video_id": f"vid{i}"} for i in range(15)],
+}
+
+
+class GlobalLockUserStore(UserStore):
+    """The pre-striping behaviour: one lock shared by every reader and writer."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, lock_stripes=1, **kwargs)
+
+    async def get_profile(self, user_id: str):
+        async with self._locks[0]:
+            return self._store.get(user_id)
+
+
+async def _run(store: UserStore, users: int, writers: int, readers: int, duration: float) -> list[float]:
+    for i in range(users):
+        await store.upsert_profile(UserProfile(user_id=f"user-{i}", email="", name=f"User {i}", picture=None))
+    deadline = time.perf_counter() + duration
+    latencies: list[float] = []
+
+    async def writer() -> None:
+        while time.perf_counter() < deadline:
+            await store.add_history(f"user-{random.randrange(users)}", PLAYLIST)
+            await asyncio.sleep(0)
+
+    async def reader() -> None:
+        while time.perf_counter() < deadline:
+            # Measured from the moment the read is issued, so time spent queued behind
+            # writers (on a lock or on the event loop itself) counts towards latency.
+            started = time.perf_counter()
+            await asyncio.sleep(0)
+            await store.get_youtube_credentials(f"user-{random.randrange(users)}")
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(writer() for _ in range(writers)), *(reader() for _ in range(readers)))
+    await store.stop()
+    return latencies
+
+
+def _report(label: str, latencies: list[float]) -> None:
+    ordered = sorted(latencies)
+    p99 = ordered[int(len(ordered) * 0.99)]
+    print(
+        f"{label:<28} reads={len(ordered):>8} "
+        f"p50={statistics.median(ordered) * 1e6:8.1f}us p99={p99 * 1e6:8.1f}us max={ordered[-1] * 1e6:8.1f}us"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--writers", type=int, default=50)
+    parser.add_argument("--readers", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=3.0)
+    args = parser.parse_args()
+
+    variants = {
+        "global lock": lambda path: GlobalLockUserStore(path),
+        "striped": lambda path: UserStore(path),
+        "striped + write-behind": lambda path: UserStore(path, flush_interval=0.05),
+    }
+    for label, factory in variants.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            store = factory(f"{tmp}/users.json")
+            latencies = asyncio.run(_run(store, args.users, args.writers, args.readers, args.duration))
+        _report(label, latencies)
+
+
+if __name__ == "__main__":
+    main()
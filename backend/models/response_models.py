@@ -30,6 +30,7 @@ class PlaylistSegment(BaseModel):
 
 
 class PlaylistResponse(BaseModel):
+    id: Optional[str] = Field(None, description="Stable history item identifier, set once stored")
     prompt: str
     mood: MoodProfile
     transitions: List[str]
@@ -5,9 +5,9 @@ from fastapi import APIRouter, HTTPException, Request, status
 from ..models.auth_models import GoogleAuthRequest, GoogleAuthResponse, SessionResponse, YoutubeAuthRequest
 from ..services.google_auth import GoogleAuthService, GoogleProfile
 from ..services.user_store import UserProfile, UserStore
-from .dependencies import RateLimited
+from .dependencies import AuthRateLimited
 
-router = APIRouter(prefix="/auth", tags=["auth"], dependencies=[RateLimited])
+router = APIRouter(prefix="/auth", tags=["auth"], dependencies=[AuthRateLimited])
 
 
 def get_services(request: Request) -> tuple[GoogleAuthService, UserStore]:
@@ -17,7 +17,7 @@ def get_services(request: Request) -> tuple[GoogleAuthService, UserStore]:
 @router.post("/google", response_model=GoogleAuthResponse)
 async def google_sign_in(payload: GoogleAuthRequest, request: Request) -> GoogleAuthResponse:
     google_auth, store = get_services(request)
-    profile: GoogleProfile = google_auth.verify_id_token(payload.id_token)
+    profile: GoogleProfile = await google_auth.verify_id_token(payload.id_token)
     stored = await store.upsert_profile(
         UserProfile(
             user_id=profile.user_id,
@@ -1,13 +1,36 @@
 from __future__ import annotations
 
+from typing import Any
+
 from fastapi import Depends, Request
 
 from ..utils.rate_limiter import RateLimiter
+from ..utils.scheduler import Priority, set_priority
+
+
+def rate_limited(route: str = "default") -> Any:
+    """Dependency enforcing the limit configured for ``route`` (see ``Settings.rate_limit_*``)."""
+
+    async def enforce_rate_limit(request: Request) -> None:
+        limiter: RateLimiter = request.app.state.rate_limiter
+        await limiter(request, route)
+
+    return Depends(enforce_rate_limit)
+
+
+def upstream_priority(priority: Priority) -> Any:
+    """Dependency setting the scheduler priority of the Gemini/YouTube calls a route makes."""
+
+    async def set_upstream_priority() -> None:
+        set_priority(priority)
 
+    return Depends(set_upstream_priority)
 
-async def enforce_rate_limit(request: Request) -> None:
-    limiter: RateLimiter = request.app.state.rate_limiter
-    await limiter(request)
 
+RateLimited = rate_limited()
+StreamRateLimited = rate_limited("stream")
+HistoryRateLimited = rate_limited("history")
+AuthRateLimited = rate_limited("auth")
 
-RateLimited = Depends(enforce_rate_limit)
+Interactive = upstream_priority(Priority.INTERACTIVE)
+Background = upstream_priority(Priority.BACKGROUND)
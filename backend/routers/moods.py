@@ -7,12 +7,12 @@ from ..models.response_models import MoodProfile
 from ..services.gemini_client import GeminiClient
 from ..services.muse_agent import MuseAgent
 from ..utils.cache import DeviceCache
-from .dependencies import RateLimited
+from .dependencies import Background, RateLimited
 
 router = APIRouter(prefix="/moods", tags=["moods"])
 
 
-@router.post("/analyze", response_model=MoodProfile, dependencies=[RateLimited])
+@router.post("/analyze", response_model=MoodProfile, dependencies=[RateLimited, Background])
 async def analyze_mood(payload: MoodRequest, request: Request) -> MoodProfile:
     gemini: GeminiClient = request.app.state.gemini_client
     agent: MuseAgent = request.app.state.muse_agent
@@ -1,64 +1,111 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException, Request, status
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+import hashlib
 import json
 import asyncio
+from typing import Optional
 
 from pydantic import BaseModel
 from ..models.request_models import PlaylistRequest
 from ..models.response_models import MoodProfile, PlaylistResponse, Track
 from ..services.gemini_client import GeminiClient
 from ..services.muse_agent import MuseAgent
-from ..services.user_store import UserStore
+from ..services.playlist_history import build_delta
+from ..services.user_store import HISTORY_LIMIT, UserStore
 from ..services.youtube_music import YouTubeMusicService
 from ..utils.cache import DeviceCache
-from .dependencies import RateLimited
+from ..utils.scheduler import UpstreamBusy
+from .dependencies import HistoryRateLimited, Interactive, RateLimited, StreamRateLimited
 
 router = APIRouter(prefix="/playlists", tags=["playlists"])
 
 
-@router.post("/generate/stream", dependencies=[RateLimited])
+async def _remember_playlist(cache: DeviceCache, device_id: str, response: PlaylistResponse, rendered: str) -> None:
+    # Only the mood is needed to build later responses; the rest is replayed as rendered JSON.
+    await cache.remember(device_id, "playlist", {"mood": response.mood}, payload=rendered.encode())
+
+
+async def _search_tracks(request: Request, user_id: str | None, keywords: list[str], genres: list[str]) -> list[Track]:
+    youtube: YouTubeMusicService = request.app.state.youtube_service
+    user_store: UserStore = request.app.state.user_store
+    user_credentials = None
+    if user_id:
+        user_credentials = await user_store.get_youtube_credentials(user_id)
+    if request.app.state.settings.youtube_search_mode == "fanout":
+        return await youtube.search_fan_out([*keywords, *genres], limit=50, user_credentials=user_credentials)
+    return await youtube.search_tracks(keywords, limit=50, user_credentials=user_credentials)
+
+
+@router.post("/generate/stream", dependencies=[StreamRateLimited, Interactive])
 async def generate_playlist_stream(payload: PlaylistRequest, request: Request):
     gemini: GeminiClient = request.app.state.gemini_client
-    youtube: YouTubeMusicService = request.app.state.youtube_service
     agent: MuseAgent = request.app.state.muse_agent
     cache: DeviceCache = request.app.state.device_cache
     user_store: UserStore = request.app.state.user_store
+    # Once the stream has started the status code is sent; turn a saturated upstream away
+    # now, unless the mood is cached and the stream needs no Gemini call at all.
+    if not gemini.has_cached_mood(payload.prompt):
+        request.app.state.upstreams["gemini"].check()
 
     async def event_generator():
         # 1. Stream Narrative & Mood Analysis
         mood = None
         current_narrative = ""
-        
-        async for chunk in gemini.analyze_mood_stream(payload.prompt):
-            if chunk["type"] == "narrative_chunk":
-                current_narrative += chunk["text"]
-                # SSE Format: event: narrative\ndata: <text>\n\n
-                yield f"event: narrative\ndata: {chunk['text']}\n\n"
-            elif chunk["type"] == "json_full":
-                try:
-                    mood = MoodProfile(**chunk["data"])
-                    # Fallback: if narrative was empty in stream but present in json
-                    if not current_narrative and mood.narrative:
-                         yield f"event: narrative\ndata: {mood.narrative}\n\n"
-                except Exception as e:
-                    yield f"event: error\ndata: Failed to validate mood profile: {str(e)}\n\n"
-                    return
-        
-        if not mood:
-            yield f"event: error\ndata: Failed to generate mood profile\n\n"
+        # The track search starts as soon as the keywords have streamed, overlapping with
+        # the rest of the mood JSON; it is reused if the final profile asks for the same
+        # searches. In fan-out mode it at least warms the per-keyword search cache.
+        speculative_keywords: list[str] | None = None
+        speculative_search: asyncio.Task | None = None
+
+        try:
+            async for chunk in gemini.analyze_mood_stream(payload.prompt):
+                if chunk["type"] == "narrative_chunk":
+                    current_narrative += chunk["text"]
+                    # SSE Format: event: narrative\ndata: <text>\n\n
+                    yield f"event: narrative\ndata: {chunk['text']}\n\n"
+                elif chunk["type"] == "keywords_ready" and speculative_search is None:
+                    speculative_keywords = chunk["keywords"]
+                    speculative_search = asyncio.create_task(
+                        _search_tracks(request, payload.user_id, speculative_keywords, [])
+                    )
+                    # Retrieve the outcome even if the speculative result is never used.
+                    speculative_search.add_done_callback(lambda task: task.cancelled() or task.exception())
+                elif chunk["type"] == "json_full":
+                    try:
+                        mood = MoodProfile(**chunk["data"])
+                        # Fallback: if narrative was empty in stream but present in json
+                        if not current_narrative and mood.narrative:
+                             yield f"event: narrative\ndata: {mood.narrative}\n\n"
+                    except Exception as e:
+                        yield f"event: error\ndata: Failed to validate mood profile: {str(e)}\n\n"
+                        return
+            
+            if not mood:
+                yield f"event: error\ndata: Failed to generate mood profile\n\n"
+                return
+
+            # 2. Search Tracks
+            yield f"event: status\ndata: Scouring the crate for {mood.primary_mood} tracks...\n\n"
+            
+            agent.remember_prompt(payload.prompt)
+            fan_out = request.app.state.settings.youtube_search_mode == "fanout"
+            if (
+                speculative_search is not None
+                and speculative_keywords == mood.keywords
+                and not (fan_out and mood.recommended_genres)
+            ):
+                tracks = await speculative_search
+            else:
+                tracks = await _search_tracks(request, payload.user_id, mood.keywords, mood.recommended_genres)
+        except UpstreamBusy as e:
+            yield f"event: error\ndata: {e}\n\n"
             return
+        finally:
+            if speculative_search is not None:
+                speculative_search.cancel()
 
-        # 2. Search Tracks
-        yield f"event: status\ndata: Scouring the crate for {mood.primary_mood} tracks...\n\n"
-        
-        agent.remember_prompt(payload.prompt)
-        user_credentials = None
-        if payload.user_id:
-            user_credentials = await user_store.get_youtube_credentials(payload.user_id)
-
-        tracks = await youtube.search_tracks(mood.keywords, limit=50, user_credentials=user_credentials)
         if not tracks:
             yield f"event: error\ndata: No tracks found on YouTube Music\n\n"
             return
@@ -78,7 +125,7 @@ async def generate_playlist_stream(payload: PlaylistRequest, request: Request):
         if payload.device_id:
             try:
                 history_entries = await cache.history(payload.device_id, key="playlist")
-                history_profiles = [entry.value.mood for entry in history_entries if hasattr(entry.value, "mood")]
+                history_profiles = [entry.value["mood"] for entry in history_entries]
             except Exception:
                 pass # ignore cache errors during stream
 
@@ -91,14 +138,15 @@ async def generate_playlist_stream(payload: PlaylistRequest, request: Request):
             history=history_profiles,
         )
 
+        rendered = response.model_dump_json()
         if payload.device_id and payload.include_history:
-            await cache.remember(payload.device_id, "playlist", response)
+            await _remember_playlist(cache, payload.device_id, response, rendered)
         
         if payload.user_id:
             await user_store.add_history(payload.user_id, response.model_dump())
 
         # Yield final result
-        yield f"event: result\ndata: {response.model_dump_json()}\n\n"
+        yield f"event: result\ndata: {rendered}\n\n"
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -106,7 +154,6 @@ async def generate_playlist_stream(payload: PlaylistRequest, request: Request):
 @router.post("/generate", response_model=PlaylistResponse, dependencies=[RateLimited])
 async def generate_playlist(payload: PlaylistRequest, request: Request) -> PlaylistResponse:
     gemini: GeminiClient = request.app.state.gemini_client
-    youtube: YouTubeMusicService = request.app.state.youtube_service
     agent: MuseAgent = request.app.state.muse_agent
     cache: DeviceCache = request.app.state.device_cache
     user_store: UserStore = request.app.state.user_store
@@ -114,11 +161,7 @@ async def generate_playlist(payload: PlaylistRequest, request: Request) -> Playl
     mood = await gemini.analyze_mood(payload.prompt)
     agent.remember_prompt(payload.prompt)
 
-    user_credentials = None
-    if payload.user_id:
-        user_credentials = await user_store.get_youtube_credentials(payload.user_id)
-
-    tracks = await youtube.search_tracks(mood.keywords, limit=50, user_credentials=user_credentials)
+    tracks = await _search_tracks(request, payload.user_id, mood.keywords, mood.recommended_genres)
     if not tracks:
         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="No tracks returned from YouTube Music")
 
@@ -132,7 +175,7 @@ async def generate_playlist(payload: PlaylistRequest, request: Request) -> Playl
     history_profiles: list[MoodProfile] = []
     if payload.device_id:
         history_entries = await cache.history(payload.device_id, key="playlist")
-        history_profiles = [entry.value.mood for entry in history_entries if hasattr(entry.value, "mood")]
+        history_profiles = [entry.value["mood"] for entry in history_entries]
 
     response = PlaylistResponse(
         prompt=payload.prompt,
@@ -143,44 +186,91 @@ async def generate_playlist(payload: PlaylistRequest, request: Request) -> Playl
         history=history_profiles,
     )
 
+    rendered = response.model_dump_json()
     if payload.device_id and payload.include_history:
-        await cache.remember(payload.device_id, "playlist", response)
+        await _remember_playlist(cache, payload.device_id, response, rendered)
     
     if payload.user_id:
         await user_store.add_history(payload.user_id, response.model_dump())
 
-    return response
+    # Already validated and rendered once for the cache; don't serialize it again.
+    return Response(content=rendered, media_type="application/json")
 
 
-@router.get("/history/{device_id}", response_model=list[PlaylistResponse], dependencies=[RateLimited])
-async def playlist_history(device_id: str, request: Request) -> list[PlaylistResponse]:
+@router.get("/history/{device_id}", response_model=list[PlaylistResponse], dependencies=[HistoryRateLimited])
+async def playlist_history(device_id: str, request: Request) -> Response:
     # Try user history first if user_id is passed as query param (not ideal but quick fix)
     # Better: Add a separate endpoint or header. For now, we stick to device_id for anonymous
     # and add a new endpoint for user history.
     cache: DeviceCache = request.app.state.device_cache
     entries = await cache.history(device_id, key="playlist")
-    return [entry.value for entry in entries if isinstance(entry.value, PlaylistResponse)]
-
-
-@router.get("/user/history", response_model=list[PlaylistResponse], dependencies=[RateLimited])
-async def user_history(user_id: str, request: Request) -> list[PlaylistResponse]:
+    # Entries hold the JSON rendered when the playlist was generated, so replaying them
+    # is a byte join rather than a validation and serialization pass per item.
+    body = b"[" + b",".join(entry.payload for entry in entries if entry.payload is not None) + b"]"
+    return Response(content=body, media_type="application/json")
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _history_etag(version: int, limit: int, cursor: str | None, since: int | None, expand_history: bool) -> str:
+    """The history version plus the query parameters that shape the body."""
+    shape = hashlib.sha1(f"{limit}|{cursor}|{since}|{int(expand_history)}".encode()).hexdigest()[:8]
+    return f'"{version}-{shape}"'
+
+
+@router.get("/user/history", dependencies=[HistoryRateLimited])
+async def user_history(
+    user_id: str,
+    request: Request,
+    limit: int = Query(HISTORY_LIMIT, ge=1, le=HISTORY_LIMIT),
+    cursor: str | None = Query(None, description="Id of the last item of the previous page"),
+    since: int | None = Query(None, ge=0, description="Return only the changes after this history version"),
+    expand_history: bool = False,
+) -> Response:
     user_store: UserStore = request.app.state.user_store
-    profile = await user_store.get_profile(user_id)
-    if not profile:
-        # User might not be in store yet (e.g. after restart). Return empty history.
-        return []
-    # Convert dicts back to PlaylistResponse
-    return [PlaylistResponse(**item) for item in profile.history]
-
-
-@router.delete("/user/history", dependencies=[RateLimited])
+    # Unknown users (e.g. not signed in yet) simply have an empty history at version 0.
+    # The ETag is built from the version, so a poll that finds nothing new costs no item reads.
+    version = await user_store.get_history_version(user_id)
+    etag = _history_etag(version, limit, cursor, since, expand_history)
+    headers = {"ETag": etag, "X-History-Version": str(version)}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # Each item's nested mood history is only resolved when the client asks for it.
+    # Stored items were validated when they were generated, so they are sent as-is.
+    view = await user_store.get_history_view(user_id, expand_history=expand_history)
+    headers = {
+        "ETag": _history_etag(view.version, limit, cursor, since, expand_history),
+        "X-History-Version": str(view.version),
+    }
+    if since is not None:
+        return JSONResponse(build_delta(view.items, view.version, view.changes, since), headers=headers)
+
+    start = 0
+    if cursor is not None:
+        ids = [item.get("id") for item in view.items]
+        if cursor not in ids:
+            raise HTTPException(status_code=400, detail="Unknown history cursor")
+        start = ids.index(cursor) + 1
+    page = view.items[start : start + limit]
+    if start + limit < len(view.items):
+        headers["X-Next-Cursor"] = page[-1]["id"]
+    return JSONResponse(page, headers=headers)
+
+
+@router.delete("/user/history", dependencies=[HistoryRateLimited])
 async def clear_user_history(user_id: str, request: Request):
     user_store: UserStore = request.app.state.user_store
     await user_store.clear_history(user_id)
     return {"status": "cleared"}
 
 
-@router.delete("/user/history/{index}", dependencies=[RateLimited])
+@router.delete("/user/history/{index}", dependencies=[HistoryRateLimited])
 async def delete_user_history_item(index: int, user_id: str, request: Request):
     user_store: UserStore = request.app.state.user_store
     await user_store.remove_history_item(user_id, index)
@@ -191,6 +281,8 @@ class CreatePlaylistRequest(BaseModel):
     user_id: str
     title: str
     video_ids: list[str]
+    # Set to resume an earlier, partially filled playlist with the same video_ids.
+    playlist_id: Optional[str] = None
 
 
 @router.post("/create", dependencies=[RateLimited])
@@ -202,13 +294,15 @@ async def create_yt_playlist(payload: CreatePlaylistRequest, request: Request):
     if not creds:
         raise HTTPException(status_code=400, detail="User not connected to YouTube Music")
 
-    # Manually refresh token to ensure valid auth
+    # Cached per user until shortly before expiry; refreshed off the event loop.
     google_auth = request.app.state.google_auth
     try:
-        access_token = google_auth.refresh_access_token(creds)
+        access_token = await google_auth.get_access_token(payload.user_id, creds)
         auth_headers = {"Authorization": f"Bearer {access_token}"}
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Failed to refresh YouTube Music token: {str(e)}")
 
-    playlist_id = await youtube.create_playlist(payload.title, payload.video_ids, auth_headers=auth_headers)
-    return {"playlist_id": playlist_id}
+    created = await youtube.create_playlist(
+        payload.title, payload.video_ids, auth_headers=auth_headers, playlist_id=payload.playlist_id
+    )
+    return {"playlist_id": created.playlist_id, "added": created.added, "failed": created.failed}
@@ -1,26 +1,98 @@
 from __future__ import annotations
 
-import asyncio
 import json
+import re
+import unicodedata
+from dataclasses import dataclass
 from typing import Any, Dict, List
 
 from google import genai
 
 from ..models.response_models import MoodProfile, Track
+from ..utils.cache import TTLCache
 from ..utils.config import Settings
 from ..utils.logger import get_logger
+from ..utils.scheduler import UpstreamScheduler, build_upstream_schedulers
+from ..utils.single_flight import SingleFlight
+from .mood_stream import MoodStreamParser
+from .prompt_index import paraphrase_key
 
 logger = get_logger()
 
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+
+def canonical_prompt(prompt: str) -> str:
+    """Fold case, width/compatibility forms, punctuation and whitespace so that trivially
+    different spellings of a prompt share a cache entry."""
+    folded = unicodedata.normalize("NFKC", prompt).casefold()
+    return " ".join(_PUNCTUATION.sub(" ", folded).split())
+
+
+@dataclass(frozen=True)
+class CachedMood:
+    mood: MoodProfile
+    # Narrative as it was streamed, replayed chunk by chunk on a streaming cache hit.
+    narrative_chunks: tuple[str, ...] = ()
+
 
 class GeminiClient:
-    def __init__(self, settings: Settings) -> None:
+    def __init__(self, settings: Settings, *, scheduler: UpstreamScheduler | None = None) -> None:
         if not settings.gemini_api_key:
             raise RuntimeError("Gemini API key missing. Set GEMINI_API_KEY.")
         self.settings = settings
         self._client = genai.Client(api_key=settings.gemini_api_key)
+        self._scheduler = scheduler or build_upstream_schedulers(settings)["gemini"]
+        self._mood_cache: TTLCache[CachedMood] = TTLCache(
+            settings.gemini_cache_ttl_seconds, settings.gemini_cache_max_entries
+        )
+        self._mood_flights: SingleFlight[CachedMood] = SingleFlight()
+        # Moods by paraphrase key, for rewordings of a cached prompt; 0 entries disables it.
+        self._paraphrases: TTLCache[CachedMood] | None = None
+        if settings.gemini_paraphrase_cache_max_entries > 0:
+            self._paraphrases = TTLCache(
+                settings.gemini_cache_ttl_seconds, settings.gemini_paraphrase_cache_max_entries
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"mood_cache": self._mood_cache.stats(), "mood_flights": self._mood_flights.stats()}
+        if self._paraphrases is not None:
+            stats["paraphrases"] = self._paraphrases.stats()
+        return stats
+
+    def has_cached_mood(self, prompt: str) -> bool:
+        """Whether ``prompt`` can be answered without calling Gemini."""
+        key = canonical_prompt(prompt)
+        if key in self._mood_cache:
+            return True
+        words = paraphrase_key(key) if self._paraphrases is not None else None
+        return words is not None and words in self._paraphrases
+
+    def _cached_mood(self, key: str) -> CachedMood | None:
+        cached = self._mood_cache.get(key)
+        if cached is None and self._paraphrases is not None and (words := paraphrase_key(key)) is not None:
+            cached = self._paraphrases.get(words)
+        return cached
+
+    def _remember_mood(self, key: str, cached: CachedMood) -> None:
+        self._mood_cache.set(key, cached)
+        if self._paraphrases is not None and (words := paraphrase_key(key)) is not None:
+            self._paraphrases.set(words, cached)
 
     async def analyze_mood(self, prompt: str) -> MoodProfile:
+        key = canonical_prompt(prompt)
+        cached = self._cached_mood(key)
+        if cached is None:
+            # Concurrent misses for the same prompt share one Gemini call.
+            cached = await self._mood_flights.do(key, lambda: self._analyze_and_remember(key, prompt))
+        return cached.mood.model_copy(deep=True)
+
+    async def _analyze_and_remember(self, key: str, prompt: str) -> CachedMood:
+        cached = CachedMood(await self._analyze_mood(prompt))
+        self._remember_mood(key, cached)
+        return cached
+
+    async def _analyze_mood(self, prompt: str) -> MoodProfile:
         system_prompt = (
             "You are The Plug, an AI DJ. Given a user prompt, output a JSON object with "
             "primary_mood, secondary_mood, playlist_title (creative, abstract, unique, 2-4 words), "
@@ -89,14 +161,46 @@ class GeminiClient:
         if system_instruction:
             kwargs["config"] = {"system_instruction": system_instruction}
         
-        return await asyncio.to_thread(
-            self._client.models.generate_content,
-            model=self.settings.gemini_model,
-            contents=contents,
-            **kwargs,
-        )
+        async with self._scheduler.slot():
+            return await self._client.aio.models.generate_content(
+                model=self.settings.gemini_model,
+                contents=contents,
+                **kwargs,
+            )
 
     async def analyze_mood_stream(self, prompt: str):
+        key = canonical_prompt(prompt)
+        if (cached := self._cached_mood(key)) is not None:
+            for text in cached.narrative_chunks or (cached.mood.narrative,):
+                yield {"type": "narrative_chunk", "text": text}
+            yield {"type": "keywords_ready", "keywords": list(cached.mood.keywords)}
+            yield {"type": "json_full", "data": cached.mood.model_dump()}
+            return
+
+        narrative_chunks: list[str] = []
+        async for chunk in self._analyze_mood_stream(prompt):
+            if chunk["type"] == "narrative_chunk":
+                narrative_chunks.append(chunk["text"])
+            elif chunk["type"] == "json_full":
+                try:
+                    mood = MoodProfile(**chunk["data"])
+                except Exception:
+                    pass  # the caller reports the invalid profile; just don't cache it
+                else:
+                    self._remember_mood(key, CachedMood(mood, tuple(narrative_chunks)))
+            yield chunk
+
+    async def _analyze_mood_stream(self, prompt: str):
+        # The scheduler slot is held until the stream has been read to the end. A refusal
+        # raises UpstreamBusy out of the iteration; the stream route reports it as an event.
+        await self._scheduler.acquire()
+        try:
+            async for event in self._stream_mood(prompt):
+                yield event
+        finally:
+            self._scheduler.release()
+
+    async def _stream_mood(self, prompt: str):
         system_prompt = (
             "You are The Plug, an AI DJ. I need you to generate a playlist based on the user's request. "
             "First, acknowledge the vibe and talk to the user directly in a cool, confident, empathetic tone (max 2 sentences). "
@@ -105,13 +209,10 @@ class GeminiClient:
             "keywords (list of max 6), narrative (the same text you spoke), and recommended_genres (max 4). "
         )
         
-        # We need to run the blocking sync generator in a thread
-        # But we need to yield chunks.
-        # Solution: Use an iterator wrapper that runs `next()` in a thread
-        
+        # The SDK's async client streams over the event loop itself, so reading a chunk
+        # costs no thread dispatch and a slow stream holds no worker thread.
         try:
-            response_stream = await asyncio.to_thread(
-                self._client.models.generate_content_stream,
+            response_stream = await self._client.aio.models.generate_content_stream(
                 model=self.settings.gemini_model,
                 contents=[{"role": "user", "parts": [{"text": prompt}]}],
                 config={"system_instruction": system_prompt}
@@ -121,44 +222,19 @@ class GeminiClient:
             yield {"type": "error", "data": str(e)}
             return
 
-        iterator = iter(response_stream)
-        
-        def safe_next():
-            try:
-                return next(iterator)
-            except StopIteration:
-                return None
-        
-        json_buffer = ""
-        collecting_json = False
-        
-        while True:
-            try:
-                chunk = await asyncio.to_thread(safe_next)
-                if chunk is None:
-                    break
-                    
-                text = chunk.text or ""
-                
-                if "###JSON_SEPARATOR###" in text:
-                    parts = text.split("###JSON_SEPARATOR###")
-                    narrative = parts[0]
-                    if narrative:
-                         yield {"type": "narrative_chunk", "text": narrative}
-                    
-                    collecting_json = True
-                    # Append the rest to json buffer
-                    json_buffer += parts[1]
-                elif collecting_json:
-                    json_buffer += text
-                else:
-                    # Pure narrative chunk
-                    yield {"type": "narrative_chunk", "text": text}
-                    
-            except Exception as e:
-                logger.error("Error reading from Gemini stream: %s", e)
-                break
-        
+        # Narrative chunks are passed on as they arrive; keywords_ready fires as soon as the
+        # keywords array in the JSON tail is complete, ahead of the full profile.
+        parser = MoodStreamParser()
+        try:
+            async for chunk in response_stream:
+                for event in parser.feed(chunk.text or ""):
+                    yield event
+        except Exception as e:
+            logger.error("Error reading from Gemini stream: %s", e)
+        for event in parser.close():
+            yield event
+
+        json_buffer = parser.json_text
         if json_buffer:
             try:
                 parsed = self._parse_json_text_raw(json_buffer)
@@ -199,4 +275,4 @@ class GeminiClient:
 
     async def close(self):
         """Cleanup resources."""
-        pass
+        await self._mood_flights.cancel_all()
@@ -1,17 +1,41 @@
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
+import time
 from dataclasses import dataclass
+from datetime import timezone
 from typing import Any, Dict, Optional, Tuple
 
+import httpx
+from google.auth import exceptions, jwt
 from google.auth.transport import requests
-from google.oauth2 import id_token
 from google_auth_oauthlib.flow import Flow
 
+from ..utils.cache import TTLCache
 from ..utils.config import Settings
+from ..utils.logger import get_logger
+from ..utils.single_flight import SingleFlight
+from .google_certs import GoogleCertCache
+from .user_store import credentials_fingerprint
 
 
 from google.oauth2.credentials import Credentials
 
+logger = get_logger()
+
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+
+@dataclass(slots=True)
+class AccessToken:
+    token: str
+    expires_at: float
+    # Fingerprint of the credentials the token was issued for.
+    fingerprint: str
+
+
 @dataclass(slots=True)
 class GoogleProfile:
     user_id: str
@@ -21,7 +45,7 @@ class GoogleProfile:
 
 
 class GoogleAuthService:
-    def __init__(self, settings: Settings) -> None:
+    def __init__(self, settings: Settings, *, http: httpx.AsyncClient | None = None) -> None:
         if not settings.google_client_id or not settings.google_client_secret:
             raise RuntimeError("Google OAuth client configuration missing.")
         self.settings = settings
@@ -34,15 +58,43 @@ class GoogleAuthService:
                 "token_uri": "https://oauth2.googleapis.com/token",
             }
         }
+        self._access_tokens: Dict[str, AccessToken] = {}
+        self._token_flights: SingleFlight[AccessToken] = SingleFlight()
+        self._certs = GoogleCertCache(settings.google_certs_url, http=http)
+        # sha256(ID token) -> (profile, token expiry); a repeated sign-in skips verification.
+        self._verified_tokens: TTLCache[tuple[GoogleProfile, float]] = TTLCache(
+            settings.google_id_token_cache_ttl_seconds, settings.google_id_token_cache_max_entries
+        )
 
-    def verify_id_token(self, token: str) -> GoogleProfile:
-        info = id_token.verify_oauth2_token(token, self._request, audience=self.settings.google_client_id)
-        return GoogleProfile(
+    async def verify_id_token(self, token: str) -> GoogleProfile:
+        """Verify a Google ID token against the cached signing certificates.
+
+        Signature checks run in a worker thread. A token seen again while it is still valid
+        is answered from a short-lived cache of verified tokens.
+        """
+        key = hashlib.sha256(token.encode()).hexdigest()
+        cached = self._verified_tokens.get(key)
+        if cached is not None and cached[1] > time.time():
+            return cached[0]
+        certs = await self._certs.get()
+        if jwt.decode_header(token).get("kid") not in certs:
+            # Signed with a key newer than the cached set.
+            certs = await self._certs.get(force=True)
+        info = await asyncio.to_thread(self._decode_id_token, token, certs)
+        profile = GoogleProfile(
             user_id=info["sub"],
             email=info.get("email", ""),
             name=info.get("name", info.get("given_name", "Muse Listener")),
             picture=info.get("picture"),
         )
+        self._verified_tokens.set(key, (profile, float(info["exp"])))
+        return profile
+
+    def _decode_id_token(self, token: str, certs: Dict[str, str]) -> Dict[str, Any]:
+        info = jwt.decode(token, certs=certs, audience=self.settings.google_client_id)
+        if info.get("iss") not in GOOGLE_ISSUERS:
+            raise exceptions.GoogleAuthError(f"Wrong issuer. 'iss' should be one of {GOOGLE_ISSUERS}")
+        return info
 
     def exchange_code(self, code: str) -> Dict[str, Any]:
         flow = Flow.from_client_config(self._client_config, scopes=list(self.settings.google_scopes))
@@ -60,7 +112,52 @@ class GoogleAuthService:
             "scope": " ".join(credentials.scopes or self.settings.google_scopes),
         }
 
-    def refresh_access_token(self, credentials_dict: Dict[str, Any]) -> str:
+    async def get_access_token(self, user_id: str, credentials_dict: Dict[str, Any]) -> str:
+        """Return a cached access token for the user, refreshing it off the event loop.
+
+        A token is reused until it expires. Within ``google_token_refresh_margin_seconds`` of
+        expiry it is still returned, while a refresh starts in the background. Concurrent
+        refreshes for one user share a single token request.
+        """
+        fingerprint = credentials_fingerprint(credentials_dict)
+        refresh = functools.partial(self._refresh_token, user_id, credentials_dict, fingerprint)
+        cached = self._access_tokens.get(user_id)
+        now = time.time()
+        if cached is not None and cached.fingerprint == fingerprint and cached.expires_at > now:
+            if cached.expires_at - now < self.settings.google_token_refresh_margin_seconds:
+                self._token_flights.start((user_id, fingerprint), refresh)
+            return cached.token
+        return (await self._token_flights.do((user_id, fingerprint), refresh)).token
+
+    async def close(self) -> None:
+        await self._token_flights.cancel_all()
+        await self._certs.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "access_tokens": len(self._access_tokens),
+            "certs": self._certs.stats(),
+            "verified_tokens": self._verified_tokens.stats(),
+        }
+
+    async def _refresh_token(self, user_id: str, credentials_dict: Dict[str, Any], fingerprint: str) -> AccessToken:
+        try:
+            token, expires_at = await asyncio.to_thread(self._fetch_access_token, credentials_dict)
+        except Exception as e:
+            logger.warning("Access token refresh for %s failed: %s", user_id, e)
+            raise
+        access_token = AccessToken(token, expires_at, fingerprint)
+        self._access_tokens[user_id] = access_token
+        return access_token
+
+    def forget_access_token(
+        self, user_id: str, previous: Optional[Dict[str, Any]], credentials: Dict[str, Any]
+    ) -> None:
+        """``UserStore`` credentials listener: the cached token belongs to the old grant."""
+        self._access_tokens.pop(user_id, None)
+
+    def _fetch_access_token(self, credentials_dict: Dict[str, Any]) -> Tuple[str, float]:
+        """Blocking token refresh; returns the token and its expiry as a Unix timestamp."""
         creds = Credentials(
             token=None,
             refresh_token=credentials_dict["refresh_token"],
@@ -70,4 +167,7 @@ class GoogleAuthService:
             scopes=credentials_dict.get("scopes"),
         )
         creds.refresh(self._request)
-        return creds.token
+        if creds.expiry is None:
+            return creds.token, time.time() + 3600
+        # google-auth reports expiry as a naive UTC datetime.
+        return creds.token, creds.expiry.replace(tzinfo=timezone.utc).timestamp()
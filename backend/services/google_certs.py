@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import re
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from ..utils.logger import get_logger
+from ..utils.single_flight import SingleFlight
+
+logger = get_logger()
+
+GOOGLE_OAUTH2_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+
+_MAX_AGE = re.compile(r"max-age\s*=\s*(\d+)")
+
+
+def cache_lifetime(headers: httpx.Headers, default: float) -> float:
+    """Seconds a response may be reused: ``Cache-Control`` max-age minus its ``Age``."""
+    match = _MAX_AGE.search(headers.get("cache-control", ""))
+    if match is None:
+        return default
+    try:
+        age = float(headers.get("age", "0"))
+    except ValueError:
+        age = 0.0
+    return max(float(match.group(1)) - age, 0.0)
+
+
+class GoogleCertCache:
+    """Google's ID-token signing certificates, kept for as long as Google says they are valid.
+
+    The certificate endpoint sends ``Cache-Control: max-age``; certificates are reused until
+    then. Within ``refresh_margin_seconds`` of expiry they are still served while a refresh
+    runs in the background, and if a refresh fails the previous set keeps being served, since
+    Google publishes new keys well before it retires the old ones. Concurrent fetches share
+    one request.
+    """
+
+    def __init__(
+        self,
+        certs_url: str = GOOGLE_OAUTH2_CERTS_URL,
+        *,
+        http: httpx.AsyncClient | None = None,
+        refresh_margin_seconds: float = 300.0,
+        default_max_age: float = 3600.0,
+    ) -> None:
+        self.certs_url = certs_url
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.default_max_age = default_max_age
+        self._owns_http = http is None
+        self._http = http or httpx.AsyncClient(timeout=10.0)
+        self._certs: Optional[Dict[str, str]] = None
+        self._expires_at = 0.0
+        self._flights: SingleFlight[Dict[str, str]] = SingleFlight()
+        self._fetches = 0
+        self._failures = 0
+
+    async def get(self, *, force: bool = False) -> Dict[str, str]:
+        """Return the current ``{key id: certificate}`` mapping.
+
+        ``force`` fetches a new set regardless of max-age, e.g. for a token signed with a
+        key id that is not in the cached set yet.
+        """
+        now = time.time()
+        if self._certs is not None and not force and now < self._expires_at:
+            if self._expires_at - now < self.refresh_margin_seconds:
+                self._flights.start("certs", self._refresh)
+            return self._certs
+        return await self._flights.do("certs", self._refresh)
+
+    async def _refresh(self) -> Dict[str, str]:
+        self._fetches += 1
+        try:
+            response = await self._http.get(self.certs_url)
+            response.raise_for_status()
+            certs = response.json()
+        except Exception as e:
+            self._failures += 1
+            if self._certs is None:
+                raise
+            logger.warning("Refreshing Google certificates failed, keeping the current set: %s", e)
+            return self._certs
+        self._certs = certs
+        self._expires_at = time.time() + cache_lifetime(response.headers, self.default_max_age)
+        return certs
+
+    async def close(self) -> None:
+        await self._flights.cancel_all()
+        if self._owns_http:
+            await self._http.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._certs or ()),
+            "expires_in": max(self._expires_at - time.time(), 0.0),
+            "fetches": self._fetches,
+            "failures": self._failures,
+        }
+
+
+__all__ = ["GOOGLE_OAUTH2_CERTS_URL", "GoogleCertCache", "cache_lifetime"]
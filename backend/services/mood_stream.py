@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional
+
+JSON_SEPARATOR = "###JSON_SEPARATOR###"
+
+
+class MoodStreamParser:
+    """Incrementally split a streamed mood answer into narrative text and its JSON tail.
+
+    Gemini streams a spoken narrative, then ``###JSON_SEPARATOR###``, then the mood JSON.
+    Chunk boundaries fall anywhere, including inside the separator, so the parser holds
+    back any narrative suffix that could still turn out to be the start of it. The JSON tail
+    is scanned as it arrives and a ``keywords_ready`` event is emitted as soon as the
+    top-level ``keywords`` array is complete, before the rest of the object has streamed.
+    Each character is scanned once.
+    """
+
+    def __init__(self) -> None:
+        self._pending = ""  # narrative text that may be the start of the separator
+        self._in_json = False
+        self._json: List[str] = []
+        self._json_length = 0
+        # JSON scanner state.
+        self._text = ""
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = -1
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None
+        self._keywords_start = -1
+        self._keywords: Optional[List[str]] = None
+
+    @property
+    def json_text(self) -> str:
+        return "".join(self._json)
+
+    @property
+    def keywords(self) -> Optional[List[str]]:
+        return self._keywords
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        if self._in_json:
+            return self._feed_json(text)
+        text = self._pending + text
+        self._pending = ""
+        index = text.find(JSON_SEPARATOR)
+        if index != -1:
+            events = self._narrative(text[:index])
+            self._in_json = True
+            return events + self._feed_json(text[index + len(JSON_SEPARATOR) :])
+        keep = self._separator_prefix_length(text)
+        if keep:
+            text, self._pending = text[:-keep], text[-keep:]
+        return self._narrative(text)
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Flush held-back narrative when the stream ended without a separator."""
+        events = self._narrative(self._pending)
+        self._pending = ""
+        return events
+
+    @staticmethod
+    def _narrative(text: str) -> List[Dict[str, Any]]:
+        return [{"type": "narrative_chunk", "text": text}] if text else []
+
+    @staticmethod
+    def _separator_prefix_length(text: str) -> int:
+        for length in range(min(len(JSON_SEPARATOR) - 1, len(text)), 0, -1):
+            if JSON_SEPARATOR.startswith(text[-length:]):
+                return length
+        return 0
+
+    def _feed_json(self, text: str) -> List[Dict[str, Any]]:
+        if not text:
+            return []
+        self._json.append(text)
+        if self._keywords is not None:
+            return []
+        self._text += text
+        offset = self._json_length
+        self._json_length += len(text)
+        for position in range(offset, self._json_length):
+            if self._scan(self._text[position], position):
+                return [{"type": "keywords_ready", "keywords": self._keywords}]
+        return []
+
+    def _scan(self, char: str, position: int) -> bool:
+        """Advance the scanner by one character; True once ``keywords`` has been parsed."""
+        if self._in_string:
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+                try:
+                    self._last_string = json.loads(self._text[self._string_start : position + 1])
+                except ValueError:
+                    self._last_string = None
+            return False
+        if char == '"':
+            self._in_string = True
+            self._string_start = position
+        elif char == ":" and self._depth == 1:
+            self._key = self._last_string
+        elif char == "," and self._depth == 1:
+            self._key = None
+        elif char in "{[":
+            if char == "[" and self._depth == 1 and self._key == "keywords":
+                self._keywords_start = position
+            self._depth += 1
+        elif char in "}]":
+            self._depth -= 1
+            if char == "]" and self._depth == 1 and self._keywords_start != -1:
+                try:
+                    keywords = json.loads(self._text[self._keywords_start : position + 1])
+                except ValueError:
+                    keywords = None
+                self._keywords_start = -1
+                if isinstance(keywords, list) and all(isinstance(keyword, str) for keyword in keywords):
+                    self._keywords = keywords
+                    self._text = ""
+                    return True
+        return False
+
+
+__all__ = ["JSON_SEPARATOR", "MoodStreamParser"]
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List
+
+# Number of history versions whose changes are kept for ``since`` delta queries.
+CHANGE_LOG_LIMIT = 100
+
+# (version, op, item_id) with op one of "add", "remove", "clear"; item_id is None for "clear".
+HistoryChange = List[Any]
+
+
+def new_item_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def legacy_item_id(item: Dict[str, Any]) -> str:
+    """Stable id for items stored before ids existed, so every read agrees on it."""
+    encoded = json.dumps(item, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def with_item_id(item: Dict[str, Any], *, fresh: bool) -> Dict[str, Any]:
+    if item.get("id"):
+        return item
+    return {**item, "id": new_item_id() if fresh else legacy_item_id(item)}
+
+
+def mood_key(mood: Dict[str, Any]) -> str:
+    encoded = json.dumps(mood, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def compact_item(item: Dict[str, Any]) -> tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """Replace an item's embedded ``history`` moods with ``history_refs`` into a mood table.
+
+    Returns the compact item and the table rows it references. Already compact items are
+    returned unchanged.
+    """
+    if "history" not in item:
+        return item, {}
+    moods: Dict[str, Dict[str, Any]] = {}
+    refs: List[str] = []
+    for mood in item["history"] or []:
+        key = mood_key(mood)
+        moods[key] = mood
+        refs.append(key)
+    compact = {key: value for key, value in item.items() if key != "history"}
+    compact["history_refs"] = refs
+    return compact, moods
+
+
+def expand_item(item: Dict[str, Any], moods: Dict[str, Dict[str, Any]], include_history: bool) -> Dict[str, Any]:
+    """Turn a compact item back into the ``PlaylistResponse`` shape."""
+    expanded = {key: value for key, value in item.items() if key != "history_refs"}
+    refs = item.get("history_refs", ()) if include_history else ()
+    expanded["history"] = [moods[ref] for ref in refs if ref in moods]
+    return expanded
+
+
+def referenced_moods(items: Iterable[Dict[str, Any]]) -> set[str]:
+    return {ref for item in items for ref in item.get("history_refs", ())}
+
+
+def build_delta(items: List[Dict[str, Any]], version: int, changes: List[HistoryChange], since: int) -> Dict[str, Any]:
+    """Describe what changed after version ``since``.
+
+    ``items`` is the current history. When the change log no longer reaches back to
+    ``since`` (or the history was cleared since), the delta is a ``reset`` carrying every
+    current item.
+    """
+    if since == version:
+        return {"version": version, "reset": False, "added": [], "removed": []}
+    relevant = [change for change in changes if change[0] > since]
+    covered = since < version and bool(changes) and changes[0][0] <= since + 1
+    if not covered or any(op == "clear" for _, op, _ in relevant):
+        return {"version": version, "reset": True, "added": items, "removed": []}
+    added: set[str] = set()
+    removed: List[str] = []
+    for _, op, item_id in relevant:
+        if op == "add":
+            added.add(item_id)
+        elif item_id in added:
+            added.discard(item_id)
+        else:
+            removed.append(item_id)
+    return {
+        "version": version,
+        "reset": False,
+        "added": [item for item in items if item["id"] in added],
+        "removed": removed,
+    }
+
+
+def trim_changes(changes: List[HistoryChange], version: int) -> List[HistoryChange]:
+    return [change for change in changes if change[0] > version - CHANGE_LOG_LIMIT]
+
+
+@dataclass(frozen=True)
+class HistoryView:
+    """Expanded history items together with the version and change log they correspond to."""
+
+    items: List[Dict[str, Any]]
+    version: int
+    changes: List[HistoryChange]
+
+
+@dataclass(frozen=True)
+class StoredHistory:
+    """A user's playlist history, newest first, with nested moods stored once per user.
+
+    Every ``PlaylistResponse`` carries the moods of the playlists generated before it, so
+    storing responses verbatim grows quadratically with history depth. Here each item keeps
+    only ``history_refs`` into ``moods``. Instances are never mutated; the update methods
+    return a new value.
+
+    Every item has an ``id``. Each update bumps ``version`` and records its effect in
+    ``changes`` so clients can ask for a delta (see ``build_delta``).
+    """
+
+    items: List[Dict[str, Any]] = field(default_factory=list)
+    moods: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    version: int = 0
+    changes: List[HistoryChange] = field(default_factory=list)
+
+    @classmethod
+    def from_payload(cls, payload: Any) -> StoredHistory:
+        """Accept the ``{"items", "moods", ...}`` layout or a legacy list of full responses."""
+        if isinstance(payload, dict):
+            items, moods = payload.get("items") or [], dict(payload.get("moods") or {})
+            version, changes = int(payload.get("version", 0)), list(payload.get("changes") or [])
+        else:
+            items, moods, version, changes = payload or [], {}, 0, []
+        compacted = []
+        for item in items:
+            compact, item_moods = compact_item(with_item_id(item, fresh=False))
+            moods.update(item_moods)
+            compacted.append(compact)
+        return cls._build(compacted, moods, version, changes)
+
+    @classmethod
+    def _build(
+        cls,
+        items: List[Dict[str, Any]],
+        moods: Dict[str, Dict[str, Any]],
+        version: int,
+        changes: List[HistoryChange],
+    ) -> StoredHistory:
+        referenced = referenced_moods(items)
+        moods = {key: mood for key, mood in moods.items() if key in referenced}
+        return cls(items, moods, version, trim_changes(changes, version))
+
+    def to_payload(self) -> Dict[str, Any]:
+        return {"items": self.items, "moods": self.moods, "version": self.version, "changes": self.changes}
+
+    def add(self, item: Dict[str, Any], limit: int) -> StoredHistory:
+        compact, item_moods = compact_item(with_item_id(item, fresh=True))
+        version = self.version + 1
+        changes = [*self.changes, [version, "add", compact["id"]]]
+        changes += [[version, "remove", dropped["id"]] for dropped in self.items[limit - 1 :]]
+        return self._build([compact, *self.items[: limit - 1]], {**self.moods, **item_moods}, version, changes)
+
+    def remove(self, index: int) -> StoredHistory:
+        version = self.version + 1
+        changes = [*self.changes, [version, "remove", self.items[index]["id"]]]
+        return self._build(self.items[:index] + self.items[index + 1 :], self.moods, version, changes)
+
+    def clear(self) -> StoredHistory:
+        version = self.version + 1
+        return self._build([], {}, version, [*self.changes, [version, "clear", None]])
+
+    def expand(self, include_history: bool = False) -> List[Dict[str, Any]]:
+        return [expand_item(item, self.moods, include_history) for item in self.items]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+__all__ = [
+    "CHANGE_LOG_LIMIT",
+    "HistoryView",
+    "StoredHistory",
+    "build_delta",
+    "compact_item",
+    "expand_item",
+    "mood_key",
+    "referenced_moods",
+    "with_item_id",
+]
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import re
+from typing import Optional, Tuple
+
+_NUMBER = re.compile(r"\d+")
+# Words that never change what a prompt asks for; any other differing word is a new prompt.
+_FILLER = frozenset({"a", "an", "for", "my", "of", "please", "some", "the", "to"})
+
+
+def numbers(text: str) -> frozenset[str]:
+    return frozenset(_NUMBER.findall(text))
+
+
+def paraphrase_key(text: str) -> Optional[Tuple[str, ...]]:
+    """Cache key shared by rewordings of a canonical prompt.
+
+    The key is the prompt's sorted words minus filler, with words that contain digits
+    reduced to their numbers ("80s" -> "80"). Prompts differing only in word order and
+    filler share a key; a negation or qualifier ("not sad songs", "taylor swift covers")
+    never does. ``None`` when nothing but filler is left.
+    """
+    words = {word for word in text.split() if word not in _FILLER and not _NUMBER.search(word)}
+    key = tuple(sorted(words | numbers(text)))
+    return key or None
+
+
+__all__ = ["numbers", "paraphrase_key"]
@@ -0,0 +1,464 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from ..utils.logger import get_logger
+from .playlist_history import (
+    CHANGE_LOG_LIMIT,
+    HistoryView,
+    StoredHistory,
+    compact_item,
+    expand_item,
+    with_item_id,
+)
+from .track_catalog import CatalogTrack, hydrate_tracks, intern_tracks
+from .user_store import (
+    HISTORY_LIMIT,
+    CredentialsListener,
+    UserProfile,
+    apply_record,
+    history_dir_for,
+    notify_credentials_changed,
+    read_history_shard,
+    read_journal,
+    read_snapshot,
+)
+
+logger = get_logger()
+
+T = TypeVar("T")
+
+# 2: nested moods in history_moods and tracks interned in the tracks table.
+# 3: every item carries an ``id``.
+HISTORY_FORMAT = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    name TEXT NOT NULL,
+    picture TEXT,
+    joined_date TEXT NOT NULL,
+    created_on TEXT NOT NULL,
+    updated_on TEXT NOT NULL,
+    youtube_credentials TEXT
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL REFERENCES profiles(user_id) ON DELETE CASCADE,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_user_recent ON history(user_id, id DESC);
+CREATE TABLE IF NOT EXISTS history_moods (
+    user_id TEXT NOT NULL REFERENCES profiles(user_id) ON DELETE CASCADE,
+    mood_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (user_id, mood_key)
+);
+CREATE TABLE IF NOT EXISTS history_changes (
+    user_id TEXT NOT NULL REFERENCES profiles(user_id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    op TEXT NOT NULL,
+    item_id TEXT
+);
+CREATE INDEX IF NOT EXISTS history_changes_user_version ON history_changes(user_id, version);
+CREATE TABLE IF NOT EXISTS tracks (
+    video_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    duration TEXT,
+    thumbnail_url TEXT,
+    energy TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class SQLiteUserStore:
+    """SQLite implementation of the ``UserStore`` interface.
+
+    Profiles and history items live in separate indexed tables, so only the rows a request
+    touches are read. History items are stored compact: nested moods go to a per-user
+    ``history_moods`` table (see ``StoredHistory``) and tracks to a shared ``tracks`` table
+    keyed by ``video_id``, re-hydrated when history is read. Each history update appends to
+    ``history_changes``, whose highest version is the user's history version. The database
+    runs in WAL mode with writes wrapped in ``BEGIN IMMEDIATE`` transactions, which lets
+    several uvicorn workers share one file. Queries run in worker threads, each holding its
+    own connection.
+
+    ``get_profile`` does not populate ``UserProfile.history``; use ``get_history``.
+    """
+
+    def __init__(self, db_path: str = "data/users.db", *, migrate_from: str | None = None) -> None:
+        self._db_path = db_path
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._credentials_listeners: list[CredentialsListener] = []
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        if migrate_from:
+            self._migrate_json(conn, migrate_from)
+        self._compact_stored_history(conn)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        return await asyncio.to_thread(lambda: fn(self._connection()))
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, fn: Callable[[sqlite3.Connection], T]) -> T:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def _migrate_json(self, conn: sqlite3.Connection, json_path: str) -> None:
+        """One-shot import of the JSON snapshot, journal and history shards written by ``UserStore``."""
+
+        def migrate(conn: sqlite3.Connection) -> int:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+                return 0
+            store, seq = read_snapshot(json_path)
+            history_dir = history_dir_for(json_path)
+            for path in (f"{json_path}.journal.compacting", f"{json_path}.journal"):
+                for record in read_journal(path):
+                    if record["seq"] > seq:
+                        apply_record(store, record)
+                        seq = record["seq"]
+            for profile in store.values():
+                conn.execute(
+                    "INSERT OR IGNORE INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        profile.user_id,
+                        profile.email,
+                        profile.name,
+                        profile.picture,
+                        profile.joined_date.isoformat(),
+                        profile.created_on.isoformat(),
+                        profile.updated_on.isoformat(),
+                        json.dumps(profile.youtube_credentials) if profile.youtube_credentials else None,
+                    ),
+                )
+                if profile.history:
+                    history = StoredHistory.from_payload(profile.history)
+                else:
+                    history = read_history_shard(history_dir, profile.user_id)
+                self._insert_moods(conn, profile.user_id, history.moods)
+                for item in reversed(history.items):
+                    conn.execute(
+                        "INSERT INTO history (user_id, payload) VALUES (?, ?)",
+                        (profile.user_id, self._store_item(conn, profile.user_id, item)),
+                    )
+                conn.executemany(
+                    "INSERT INTO history_changes VALUES (?, ?, ?, ?)",
+                    [(profile.user_id, *change) for change in history.changes],
+                )
+            conn.execute("INSERT INTO meta VALUES ('migrated_from_json', ?)", (json_path,))
+            return len(store)
+
+        try:
+            migrated = self._write(conn, migrate)
+        except Exception as e:
+            logger.error("Failed to migrate %s into SQLite user store: %s", json_path, e)
+            return
+        if migrated:
+            logger.info("Migrated %d user profiles from %s", migrated, json_path)
+
+    def _compact_stored_history(self, conn: sqlite3.Connection) -> None:
+        """One-shot rewrite of history rows written in an older, less compact format."""
+
+        def compact(conn: sqlite3.Connection) -> int:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'history_format'").fetchone()
+            if row and int(row["value"]) >= HISTORY_FORMAT:
+                return 0
+            rewritten = 0
+            for row in conn.execute("SELECT id, user_id, payload FROM history").fetchall():
+                payload = self._store_item(conn, row["user_id"], json.loads(row["payload"]))
+                if payload != row["payload"]:
+                    conn.execute("UPDATE history SET payload = ? WHERE id = ?", (payload, row["id"]))
+                    rewritten += 1
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('history_format', ?)", (str(HISTORY_FORMAT),))
+            return rewritten
+
+        try:
+            rewritten = self._write(conn, compact)
+        except Exception as e:
+            logger.error("Failed to compact SQLite user history: %s", e)
+            return
+        if rewritten:
+            logger.info("Compacted %d stored history items", rewritten)
+
+    def _store_item(self, conn: sqlite3.Connection, user_id: str, item: Dict[str, Any], *, fresh: bool = False) -> str:
+        """Compact an item for storage: moods into ``history_moods``, tracks into ``tracks``.
+
+        Items without an ``id`` get a new one when ``fresh``, else the stable legacy id.
+        """
+        item, moods = compact_item(with_item_id(item, fresh=fresh))
+        self._insert_moods(conn, user_id, moods)
+        if "tracks" in item:
+            video_ids = [track["video_id"] for track in item["tracks"] if track.get("video_id")]
+            refs, new_rows = intern_tracks(item["tracks"], self._fetch_tracks(conn, video_ids))
+            conn.executemany(
+                "INSERT OR IGNORE INTO tracks VALUES (?, ?, ?, ?, ?, ?)",
+                [(video_id, *row) for video_id, row in new_rows.items()],
+            )
+            item = {key: value for key, value in item.items() if key != "tracks"}
+            item["track_refs"] = refs
+        return json.dumps(item)
+
+    @staticmethod
+    def _fetch_tracks(conn: sqlite3.Connection, video_ids: list[str]) -> Dict[str, CatalogTrack]:
+        unique_ids = list(dict.fromkeys(video_ids))
+        if not unique_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in unique_ids)
+        rows = conn.execute(
+            "SELECT video_id, title, artist, duration, thumbnail_url, energy FROM tracks "
+            f"WHERE video_id IN ({placeholders})",
+            unique_ids,
+        ).fetchall()
+        return {row["video_id"]: CatalogTrack(*tuple(row)[1:]) for row in rows}
+
+    @staticmethod
+    def _insert_moods(conn: sqlite3.Connection, user_id: str, moods: Dict[str, Dict[str, Any]]) -> None:
+        conn.executemany(
+            "INSERT OR IGNORE INTO history_moods VALUES (?, ?, ?)",
+            [(user_id, key, json.dumps(mood)) for key, mood in moods.items()],
+        )
+
+    @staticmethod
+    def _prune_moods(conn: sqlite3.Connection, user_id: str) -> None:
+        conn.execute(
+            "DELETE FROM history_moods WHERE user_id = ? AND mood_key NOT IN "
+            "(SELECT refs.value FROM history, json_each(history.payload, '$.history_refs') AS refs "
+            "WHERE history.user_id = ?)",
+            (user_id, user_id),
+        )
+
+    @staticmethod
+    def _history_version(conn: sqlite3.Connection, user_id: str) -> int:
+        row = conn.execute(
+            "SELECT COALESCE(MAX(version), 0) AS version FROM history_changes WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row["version"]
+
+    def _record_changes(self, conn: sqlite3.Connection, user_id: str, changes: list[tuple[str, Optional[str]]]) -> None:
+        """Append ``changes`` as the user's next history version and trim the change log."""
+        version = self._history_version(conn, user_id) + 1
+        conn.executemany(
+            "INSERT INTO history_changes VALUES (?, ?, ?, ?)",
+            [(user_id, version, op, item_id) for op, item_id in changes],
+        )
+        conn.execute(
+            "DELETE FROM history_changes WHERE user_id = ? AND version <= ?",
+            (user_id, version - CHANGE_LOG_LIMIT),
+        )
+
+    @staticmethod
+    def _row_to_profile(row: sqlite3.Row) -> UserProfile:
+        return UserProfile(
+            user_id=row["user_id"],
+            email=row["email"],
+            name=row["name"],
+            picture=row["picture"],
+            joined_date=datetime.fromisoformat(row["joined_date"]),
+            created_on=datetime.fromisoformat(row["created_on"]),
+            updated_on=datetime.fromisoformat(row["updated_on"]),
+            youtube_credentials=json.loads(row["youtube_credentials"]) if row["youtube_credentials"] else None,
+        )
+
+    @staticmethod
+    def _touch(conn: sqlite3.Connection, user_id: str) -> bool:
+        cursor = conn.execute(
+            "UPDATE profiles SET updated_on = ? WHERE user_id = ?", (datetime.utcnow().isoformat(), user_id)
+        )
+        return cursor.rowcount > 0
+
+    async def start(self) -> None:
+        return None
+
+    async def stop(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    async def upsert_profile(self, profile: UserProfile) -> UserProfile:
+        def upsert(conn: sqlite3.Connection) -> UserProfile:
+            now = datetime.utcnow().isoformat()
+            row = conn.execute("SELECT * FROM profiles WHERE user_id = ?", (profile.user_id,)).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE profiles SET email = ?, name = ?, picture = ?, updated_on = ? WHERE user_id = ?",
+                    (
+                        profile.email or row["email"],
+                        profile.name or row["name"],
+                        profile.picture or row["picture"],
+                        now,
+                        profile.user_id,
+                    ),
+                )
+            else:
+                conn.execute(
+                    "INSERT INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+                    (profile.user_id, profile.email, profile.name, profile.picture, now, now, now),
+                )
+            row = conn.execute("SELECT * FROM profiles WHERE user_id = ?", (profile.user_id,)).fetchone()
+            return self._row_to_profile(row)
+
+        return await self._run(lambda conn: self._write(conn, upsert))
+
+    async def set_youtube_credentials(self, user_id: str, credentials: Dict[str, Any]) -> None:
+        def update(conn: sqlite3.Connection) -> tuple[bool, Optional[Dict[str, Any]]]:
+            row = conn.execute("SELECT youtube_credentials FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                return False, None
+            conn.execute(
+                "UPDATE profiles SET youtube_credentials = ?, updated_on = ? WHERE user_id = ?",
+                (json.dumps(credentials), datetime.utcnow().isoformat(), user_id),
+            )
+            return True, json.loads(row["youtube_credentials"]) if row["youtube_credentials"] else None
+
+        found, previous = await self._run(lambda conn: self._write(conn, update))
+        if not found:
+            raise KeyError("user not registered")
+        if previous != credentials:
+            notify_credentials_changed(self._credentials_listeners, user_id, previous, credentials)
+
+    def add_credentials_listener(self, listener: CredentialsListener) -> None:
+        self._credentials_listeners.append(listener)
+
+    async def add_history(self, user_id: str, playlist: dict) -> None:
+        def add(conn: sqlite3.Connection) -> None:
+            if not self._touch(conn, user_id):
+                return
+            payload = self._store_item(conn, user_id, playlist, fresh=True)
+            conn.execute("INSERT INTO history (user_id, payload) VALUES (?, ?)", (user_id, payload))
+            trimmed = conn.execute(
+                "DELETE FROM history WHERE user_id = ? AND id NOT IN "
+                "(SELECT id FROM history WHERE user_id = ? ORDER BY id DESC LIMIT ?) "
+                "RETURNING json_extract(payload, '$.id') AS item_id",
+                (user_id, user_id, HISTORY_LIMIT),
+            ).fetchall()
+            changes = [("add", json.loads(payload)["id"])]
+            changes += [("remove", row["item_id"]) for row in trimmed]
+            self._record_changes(conn, user_id, changes)
+            if trimmed:
+                self._prune_moods(conn, user_id)
+
+        await self._run(lambda conn: self._write(conn, add))
+
+    async def remove_history_item(self, user_id: str, index: int) -> None:
+        if index < 0:
+            return
+
+        def remove(conn: sqlite3.Connection) -> None:
+            deleted = conn.execute(
+                "DELETE FROM history WHERE id = "
+                "(SELECT id FROM history WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?) "
+                "RETURNING json_extract(payload, '$.id') AS item_id",
+                (user_id, index),
+            ).fetchall()
+            if deleted:
+                self._touch(conn, user_id)
+                self._record_changes(conn, user_id, [("remove", deleted[0]["item_id"])])
+                self._prune_moods(conn, user_id)
+
+        await self._run(lambda conn: self._write(conn, remove))
+
+    async def clear_history(self, user_id: str) -> None:
+        def clear(conn: sqlite3.Connection) -> None:
+            if self._touch(conn, user_id):
+                conn.execute("DELETE FROM history WHERE user_id = ?", (user_id,))
+                conn.execute("DELETE FROM history_moods WHERE user_id = ?", (user_id,))
+                self._record_changes(conn, user_id, [("clear", None)])
+
+        await self._run(lambda conn: self._write(conn, clear))
+
+    async def get_profile(self, user_id: str) -> Optional[UserProfile]:
+        def fetch(conn: sqlite3.Connection) -> Optional[UserProfile]:
+            row = conn.execute("SELECT * FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+            return self._row_to_profile(row) if row else None
+
+        return await self._run(fetch)
+
+    async def get_history(self, user_id: str, *, expand_history: bool = False) -> list[dict]:
+        return (await self.get_history_view(user_id, expand_history=expand_history)).items
+
+    async def get_history_version(self, user_id: str) -> int:
+        return await self._run(lambda conn: self._history_version(conn, user_id))
+
+    async def get_history_view(self, user_id: str, *, expand_history: bool = False) -> HistoryView:
+        def fetch(conn: sqlite3.Connection) -> HistoryView:
+            conn.execute("BEGIN")
+            try:
+                return read(conn)
+            finally:
+                conn.execute("COMMIT")
+
+        def read(conn: sqlite3.Connection) -> HistoryView:
+            rows = conn.execute(
+                "SELECT payload FROM history WHERE user_id = ? ORDER BY id DESC", (user_id,)
+            ).fetchall()
+            moods: Dict[str, Dict[str, Any]] = {}
+            if expand_history:
+                mood_rows = conn.execute(
+                    "SELECT mood_key, payload FROM history_moods WHERE user_id = ?", (user_id,)
+                ).fetchall()
+                moods = {row["mood_key"]: json.loads(row["payload"]) for row in mood_rows}
+            items = [expand_item(json.loads(row["payload"]), moods, expand_history) for row in rows]
+            video_ids = [ref for item in items for ref in item.get("track_refs", ()) if isinstance(ref, str)]
+            catalog = self._fetch_tracks(conn, video_ids)
+            for item in items:
+                if "track_refs" in item:
+                    item["tracks"] = hydrate_tracks(item.pop("track_refs"), catalog)
+            changes = conn.execute(
+                "SELECT version, op, item_id FROM history_changes WHERE user_id = ? ORDER BY rowid",
+                (user_id,),
+            ).fetchall()
+            return HistoryView(
+                items,
+                changes[-1]["version"] if changes else 0,
+                [list(change) for change in changes],
+            )
+
+        return await self._run(fetch)
+
+    async def get_youtube_credentials(self, user_id: str) -> Optional[Dict[str, Any]]:
+        def fetch(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+            row = conn.execute("SELECT youtube_credentials FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+            return json.loads(row["youtube_credentials"]) if row and row["youtube_credentials"] else None
+
+        return await self._run(fetch)
+
+
+__all__ = ["SQLiteUserStore"]
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Union
+
+from ..utils.logger import get_logger
+
+logger = get_logger()
+
+TrackRef = Union[str, Dict[str, Any]]
+
+
+class CatalogTrack(NamedTuple):
+    """One interned track; the ``video_id`` is the catalog key and is not repeated here."""
+
+    title: str
+    artist: str
+    duration: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    energy: Optional[str] = None
+
+    @classmethod
+    def from_track(cls, track: Mapping[str, Any]) -> CatalogTrack:
+        return cls(
+            track["title"],
+            track["artist"],
+            track.get("duration"),
+            track.get("thumbnail_url"),
+            track.get("energy"),
+        )
+
+    def to_track(self, video_id: str) -> Dict[str, Any]:
+        return {
+            "title": self.title,
+            "artist": self.artist,
+            "video_id": video_id,
+            "duration": self.duration,
+            "thumbnail_url": self.thumbnail_url,
+            "energy": self.energy,
+        }
+
+
+def intern_tracks(
+    tracks: List[Dict[str, Any]], known: Mapping[str, CatalogTrack]
+) -> tuple[List[TrackRef], Dict[str, CatalogTrack]]:
+    """Replace tracks by their ``video_id`` where the catalog can reproduce them exactly.
+
+    Tracks without a ``video_id``, or whose metadata disagrees with the catalog row, stay
+    inline. Returns the refs and the rows that are new to ``known``.
+    """
+    refs: List[TrackRef] = []
+    new_rows: Dict[str, CatalogTrack] = {}
+    for track in tracks:
+        video_id = track.get("video_id")
+        if not video_id:
+            refs.append(track)
+            continue
+        row = CatalogTrack.from_track(track)
+        current = new_rows.get(video_id) or known.get(video_id)
+        if current is None:
+            new_rows[video_id] = row
+            refs.append(video_id)
+        elif current == row:
+            refs.append(video_id)
+        else:
+            refs.append(track)
+    return refs, new_rows
+
+
+def hydrate_tracks(refs: List[TrackRef], rows: Mapping[str, CatalogTrack]) -> List[Dict[str, Any]]:
+    tracks = []
+    for ref in refs:
+        if isinstance(ref, dict):
+            tracks.append(ref)
+        elif (row := rows.get(ref)) is not None:
+            tracks.append(row.to_track(ref))
+        else:
+            logger.warning("Track %s missing from catalog", ref)
+    return tracks
+
+
+class TrackCatalog:
+    """Process-wide, deduplicated track rows keyed by ``video_id``.
+
+    Stored playlists keep ``track_refs`` instead of full ``tracks`` and are re-hydrated at
+    response time. With a ``path`` the catalog is persisted as an append-only JSON-lines file
+    holding each row once. New rows are fsynced before they are published, and a failed
+    write raises, so no stored playlist refers to a row that could be lost in a restart.
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        self._rows: Dict[str, CatalogTrack] = {}
+        self._path = path
+        self._file = None
+        self._load()
+
+    def _load(self) -> None:
+        if not self._path or not os.path.exists(self._path):
+            return
+        try:
+            with open(self._path, "r") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    video_id, *fields = json.loads(line)
+                    self._rows[video_id] = CatalogTrack(*fields)
+        except Exception as e:
+            logger.error("Failed to load track catalog: %s", e)
+
+    def _persist(self, rows: Dict[str, CatalogTrack]) -> None:
+        if not self._path or not rows:
+            return
+        if self._file is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self._path, "a")
+        offset = self._file.tell()
+        try:
+            self._file.write("".join(json.dumps([video_id, *row]) + "\n" for video_id, row in rows.items()))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except Exception as e:
+            logger.error("Failed to persist track catalog: %s", e)
+            # Drop any partial line so the next append starts on a fresh one.
+            try:
+                self._file.truncate(offset)
+            except Exception:
+                pass
+            self.close()
+            raise
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, video_id: str) -> Optional[CatalogTrack]:
+        return self._rows.get(video_id)
+
+    def intern_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Return ``item`` with ``tracks`` replaced by ``track_refs``."""
+        if "tracks" not in item:
+            return item
+        refs, new_rows = intern_tracks(item["tracks"], self._rows)
+        self._persist(new_rows)
+        self._rows.update(new_rows)
+        compact = {key: value for key, value in item.items() if key != "tracks"}
+        compact["track_refs"] = refs
+        return compact
+
+    def hydrate_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        if "track_refs" not in item:
+            return item
+        hydrated = {key: value for key, value in item.items() if key != "track_refs"}
+        hydrated["tracks"] = hydrate_tracks(item["track_refs"], self._rows)
+        return hydrated
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+__all__ = ["CatalogTrack", "TrackCatalog", "hydrate_tracks", "intern_tracks"]
@@ -1,9 +1,27 @@
 from __future__ import annotations
 
 import asyncio
-from dataclasses import dataclass, field
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, replace
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from ..utils.logger import get_logger
+from .playlist_history import HistoryView, StoredHistory
+from .track_catalog import TrackCatalog
+
+logger = get_logger()
+
+# Called with (user_id, previous credentials, new credentials) when a user's YouTube
+# credentials change, so caches keyed on them can drop stale entries.
+CredentialsListener = Callable[[str, Optional[Dict[str, Any]], Dict[str, Any]], None]
+
+HISTORY_LIMIT = 50
+SNAPSHOT_VERSION = 2
 
 
 @dataclass
@@ -19,124 +37,574 @@ class UserProfile:
     history: list[dict] = field(default_factory=list)
 
 
-import json
-import os
-from dataclasses import asdict
+def serialize_profile(profile: UserProfile) -> Dict[str, Any]:
+    data = asdict(profile)
+    data["joined_date"] = profile.joined_date.isoformat()
+    data["created_on"] = profile.created_on.isoformat()
+    data["updated_on"] = profile.updated_on.isoformat()
+    return data
+
+
+def deserialize_profile(data: Dict[str, Any]) -> UserProfile:
+    data = dict(data)
+    for key in ("joined_date", "created_on", "updated_on"):
+        if isinstance(data.get(key), str):
+            data[key] = datetime.fromisoformat(data[key])
+    return UserProfile(**data)
+
+
+def read_snapshot(path: str) -> tuple[Dict[str, UserProfile], int]:
+    """Load a snapshot file, returning profiles and the last journal sequence it covers.
+
+    Accepts both the versioned snapshot layout and the legacy ``{user_id: profile}`` file.
+    """
+    if not os.path.exists(path):
+        return {}, 0
+    with open(path, "r") as f:
+        data = json.load(f)
+    if data.get("version") == SNAPSHOT_VERSION and isinstance(data.get("users"), dict):
+        users, seq = data["users"], int(data.get("seq", 0))
+    else:
+        users, seq = data, 0
+    return {user_id: deserialize_profile(profile) for user_id, profile in users.items()}, seq
+
+
+def write_snapshot(path: str, store: Dict[str, UserProfile], seq: int) -> None:
+    users = {}
+    for user_id, profile in store.items():
+        data = serialize_profile(profile)
+        data.pop("history")
+        users[user_id] = data
+    _write_atomic(path, json.dumps({"version": SNAPSHOT_VERSION, "seq": seq, "users": users}).encode())
+
+
+def read_journal(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield journal records, skipping a torn trailing line left by a crash."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                logger.warning("Ignoring incomplete user store journal record in %s", path)
+                return
+            if line.strip():
+                yield json.loads(line)
+
+
+def credentials_fingerprint(credentials: Dict[str, Any]) -> str:
+    encoded = json.dumps(credentials, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def notify_credentials_changed(
+    listeners: list[CredentialsListener],
+    user_id: str,
+    previous: Optional[Dict[str, Any]],
+    credentials: Dict[str, Any],
+) -> None:
+    for listener in listeners:
+        try:
+            listener(user_id, previous, credentials)
+        except Exception as e:
+            logger.error("Credentials listener failed for %s: %s", user_id, e)
+
+
+def history_dir_for(file_path: str) -> str:
+    return f"{os.path.splitext(file_path)[0]}_history"
+
+
+def history_shard_path(history_dir: str, user_id: str) -> str:
+    digest = hashlib.sha256(user_id.encode()).hexdigest()
+    return os.path.join(history_dir, digest[:2], f"{digest}.json.gz")
+
+
+def read_history_shard(history_dir: str, user_id: str) -> StoredHistory:
+    path = history_shard_path(history_dir, user_id)
+    if not os.path.exists(path):
+        return StoredHistory()
+    with gzip.open(path, "rt") as f:
+        return StoredHistory.from_payload(json.load(f))
+
+
+def write_history_shard(history_dir: str, user_id: str, history: StoredHistory) -> None:
+    path = history_shard_path(history_dir, user_id)
+    if not history.items and not history.version:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    payload = json.dumps(history.to_payload(), separators=(",", ":")).encode()
+    _write_atomic(path, gzip.compress(payload, compresslevel=6))
+
+
+def _write_atomic(path: str, payload: bytes) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def apply_record(store: Dict[str, UserProfile], record: Dict[str, Any]) -> None:
+    """Apply one journal record. Live mutations and replay share this path.
+
+    Profiles are treated as immutable: every change installs a new ``UserProfile`` (and a new
+    history list), so a profile handed out by ``get_profile`` never changes under the reader.
+    The ``history_*`` ops are only found in journals written before history moved to shards.
+    """
+    op = record["op"]
+    user_id = record["user_id"]
+    at = datetime.fromisoformat(record["at"])
+    profile = store.get(user_id)
+
+    if op == "profile":
+        if profile:
+            store[user_id] = replace(
+                profile,
+                email=record["email"] or profile.email,
+                name=record["name"] or profile.name,
+                picture=record["picture"] or profile.picture,
+                updated_on=at,
+            )
+        else:
+            store[user_id] = UserProfile(
+                user_id=user_id,
+                email=record["email"],
+                name=record["name"],
+                picture=record["picture"],
+                joined_date=at,
+                created_on=at,
+                updated_on=at,
+            )
+        return
+
+    if not profile:
+        return
+    if op == "touch":
+        changes: Dict[str, Any] = {}
+    elif op == "credentials":
+        changes = {"youtube_credentials": record["credentials"]}
+    elif op == "history_add":
+        changes = {"history": [record["item"], *profile.history[: HISTORY_LIMIT - 1]]}
+    elif op == "history_remove":
+        index = record["index"]
+        if not 0 <= index < len(profile.history):
+            return
+        changes = {"history": profile.history[:index] + profile.history[index + 1 :]}
+    elif op == "history_clear":
+        changes = {"history": []}
+    else:
+        raise ValueError(f"Unknown user store journal op: {op}")
+    store[user_id] = replace(profile, updated_on=at, **changes)
+
 
 class UserStore:
-    def __init__(self, file_path: str = "data/users.json") -> None:
+    """User profiles persisted as a JSON snapshot plus an append-only mutation journal.
+
+    Every mutation appends a single record to ``<file_path>.journal``; compaction folds the
+    journal into the snapshot in a worker thread, either periodically (see ``start``) or once
+    ``compact_threshold`` records have accumulated.
+
+    Playlist history is kept out of the snapshot: each user's history is a gzip-compressed
+    shard under ``<file_path stem>_history/`` holding a compact ``StoredHistory``, loaded on
+    first access and kept in an LRU of at most ``history_cache_users`` users. With a
+    ``catalog`` the stored items reference their tracks by ``video_id``. ``get_profile`` does not populate
+    ``UserProfile.history``; use ``get_history``.
+
+    With ``flush_interval`` > 0 the journal and history shards are written behind: mutations
+    only update memory and queue their writes, and a background task flushes them in one
+    worker-thread pass at most every ``flush_interval`` seconds, or sooner once
+    ``flush_max_pending`` changes are waiting. ``flush``/``stop`` force the queue out.
+
+    Writers serialize per user on one of ``lock_stripes`` locks; readers take no lock and get
+    the immutable profile snapshot current at the time of the call.
+    """
+
+    def __init__(
+        self,
+        file_path: str = "data/users.json",
+        *,
+        compact_threshold: int = 500,
+        compact_interval: float = 300.0,
+        flush_interval: float = 0.0,
+        flush_max_pending: int = 100,
+        lock_stripes: int = 64,
+        history_cache_users: int = 256,
+        catalog: TrackCatalog | None = None,
+    ) -> None:
         self._store: Dict[str, UserProfile] = {}
-        self._lock = asyncio.Lock()
+        self._locks = [asyncio.Lock() for _ in range(max(1, lock_stripes))]
         self._file_path = file_path
+        self._journal_path = f"{file_path}.journal"
+        self._compacting_path = f"{file_path}.journal.compacting"
+        self._history_dir = history_dir_for(file_path)
+        self._history: OrderedDict[str, StoredHistory] = OrderedDict()
+        self._history_cache_users = max(1, history_cache_users)
+        # user_id -> generation of the newest unwritten history change
+        self._history_dirty: Dict[str, int] = {}
+        self._history_generation = 0
+        self._catalog = catalog
+        self._compact_threshold = compact_threshold
+        self._compact_interval = compact_interval
+        self._compact_lock = asyncio.Lock()
+        self._compaction: asyncio.Task | None = None
+        self._compactor: asyncio.Task | None = None
+        self._flush_interval = flush_interval
+        self._flush_max_pending = flush_max_pending
+        self._pending: list[Dict[str, Any]] = []
+        self._dirty = asyncio.Event()
+        self._backlog_full = asyncio.Event()
+        self._flusher: asyncio.Task | None = None
+        self._io_lock = asyncio.Lock()
+        self._journal = None
+        self._journal_records = 0
+        self._seq = 0
+        self._rewrite_snapshot = False
+        self._credentials_listeners: list[CredentialsListener] = []
         self._load()
 
-    def _load(self):
-        if not os.path.exists(self._file_path):
+    def _load(self) -> None:
+        try:
+            self._store, self._seq = read_snapshot(self._file_path)
+        except Exception as e:
+            logger.error("Failed to load user store snapshot: %s", e)
+            return
+        self._truncate_torn_tail(self._journal_path)
+        for path in (self._compacting_path, self._journal_path):
+            try:
+                for record in read_journal(path):
+                    self._journal_records += 1
+                    if record["seq"] <= self._seq:
+                        continue
+                    apply_record(self._store, record)
+                    self._seq = record["seq"]
+            except Exception as e:
+                logger.error("Failed to replay user store journal %s: %s", path, e)
+        if any(profile.history for profile in self._store.values()):
+            self._adopt_inline_history()
+
+    def _adopt_inline_history(self) -> None:
+        """Take history embedded by older snapshots/journals into memory as unwritten shards.
+
+        Nothing is written here; ``start``/``stop`` persist the shards and then rewrite the
+        snapshot without the inline history.
+        """
+        for user_id, profile in self._store.items():
+            if profile.history:
+                self._history[user_id] = StoredHistory.from_payload(profile.history)
+                self._history_generation += 1
+                self._history_dirty[user_id] = self._history_generation
+                self._store[user_id] = replace(profile, history=[])
+        self._rewrite_snapshot = True
+
+    @staticmethod
+    def _truncate_torn_tail(path: str) -> None:
+        # Appending after a partial line would glue the next record onto it.
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def _write_journal(self, records: list[Dict[str, Any]]) -> None:
+        if self._journal is None:
+            directory = os.path.dirname(self._journal_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._journal = open(self._journal_path, "a")
+        self._journal.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+        self._journal.flush()
+
+    def _write_changes(self, records: list[Dict[str, Any]], histories: Dict[str, StoredHistory]) -> None:
+        for user_id, history in histories.items():
+            write_history_shard(self._history_dir, user_id, history)
+        if records:
+            self._write_journal(records)
+
+    def _write_behind(self) -> bool:
+        return self._flush_interval > 0
+
+    def _schedule_flush(self) -> None:
+        self._dirty.set()
+        if len(self._pending) + len(self._history_dirty) >= self._flush_max_pending:
+            self._backlog_full.set()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        self._seq += 1
+        record["seq"] = self._seq
+        if self._write_behind():
+            self._pending.append(record)
+            self._schedule_flush()
+            return
+        try:
+            self._write_journal([record])
+        except Exception as e:
+            logger.error("Failed to append user store journal: %s", e)
+            return
+        self._journal_written(1)
+
+    def _journal_written(self, count: int) -> None:
+        self._journal_records += count
+        if self._journal_records >= self._compact_threshold and not self._compaction_running():
+            self._compaction = asyncio.create_task(self.compact())
+
+    def _commit(self, record: Dict[str, Any]) -> None:
+        apply_record(self._store, record)
+        self._append(record)
+
+    async def flush(self) -> None:
+        """Write every queued journal record and dirty history shard in one worker-thread pass."""
+        async with self._io_lock:
+            self._dirty.clear()
+            self._backlog_full.clear()
+            if not self._pending and not self._history_dirty:
+                return
+            records, self._pending = self._pending, []
+            generations = dict(self._history_dirty)
+            histories = {user_id: self._history[user_id] for user_id in generations}
+            try:
+                await asyncio.to_thread(self._write_changes, records, histories)
+            except Exception as e:
+                logger.error("Failed to flush user store: %s", e)
+                self._pending[:0] = records
+                self._dirty.set()
+                return
+            for user_id, generation in generations.items():
+                if self._history_dirty.get(user_id) == generation:
+                    del self._history_dirty[user_id]
+        self._journal_written(len(records))
+        self._evict_history()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await self._dirty.wait()
+            try:
+                await asyncio.wait_for(self._backlog_full.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def _compaction_running(self) -> bool:
+        return self._compaction is not None and not self._compaction.done()
+
+    def _rotate_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        # A leftover file from an interrupted compaction is folded in before rotating again.
+        if not os.path.exists(self._compacting_path) and os.path.exists(self._journal_path):
+            os.replace(self._journal_path, self._compacting_path)
+            self._journal_records = 0
+
+    def _compact_files(self) -> None:
+        store, seq = read_snapshot(self._file_path)
+        for record in read_journal(self._compacting_path):
+            if record["seq"] <= seq:
+                continue
+            apply_record(store, record)
+            seq = record["seq"]
+        write_snapshot(self._file_path, store, seq)
+        if os.path.exists(self._compacting_path):
+            os.remove(self._compacting_path)
+
+    async def compact(self) -> None:
+        """Fold the journal into the snapshot without blocking the event loop."""
+        async with self._compact_lock:
+            async with self._io_lock:
+                self._rotate_journal()
+            if not os.path.exists(self._compacting_path) and not self._rewrite_snapshot:
+                return
+            try:
+                await asyncio.to_thread(self._compact_files)
+            except Exception as e:
+                logger.error("Failed to compact user store: %s", e)
+                return
+            self._rewrite_snapshot = False
+
+    async def _migrate_inline_history(self) -> None:
+        if self._catalog is not None:
+            for user_id in self._history_dirty:
+                history = self._history[user_id]
+                items = [self._catalog.intern_item(item) for item in history.items]
+                self._history[user_id] = StoredHistory(items, history.moods)
+        # Shards must be durable before the snapshot stops carrying the history.
+        await self.flush()
+        if not self._history_dirty:
+            await self.compact()
+            logger.info("Moved inline user history into %s", self._history_dir)
+
+    async def _compact_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._compact_interval)
+            if self._journal_records:
+                await self.compact()
+
+    @staticmethod
+    async def _cancel(task: asyncio.Task | None) -> None:
+        if task is None:
             return
+        task.cancel()
         try:
-            with open(self._file_path, "r") as f:
-                data = json.load(f)
-                for user_id, profile_data in data.items():
-                    # Convert datetime strings back to objects if needed, 
-                    # but for simplicity we might keep them as strings or handle conversion.
-                    # Pydantic/Dataclasses might need help.
-                    # For now, let's just load dicts and rely on runtime to handle or convert.
-                    # Actually, UserProfile expects datetimes.
-                    # Let's keep it simple: We will just store the dicts in memory as UserProfile objects.
-                    # We need to handle datetime conversion.
-                    if "joined_date" in profile_data:
-                        profile_data["joined_date"] = datetime.fromisoformat(profile_data["joined_date"])
-                    if "created_on" in profile_data:
-                        profile_data["created_on"] = datetime.fromisoformat(profile_data["created_on"])
-                    if "updated_on" in profile_data:
-                        profile_data["updated_on"] = datetime.fromisoformat(profile_data["updated_on"])
-                    
-                    self._store[user_id] = UserProfile(**profile_data)
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def start(self) -> None:
+        if self._rewrite_snapshot:
+            await self._migrate_inline_history()
+        if self._compactor is None:
+            self._compactor = asyncio.create_task(self._compact_periodically())
+
+    async def stop(self) -> None:
+        await self._cancel(self._compactor)
+        self._compactor = None
+        # Holding the I/O lock guarantees the flusher is not midway through a write.
+        async with self._io_lock:
+            await self._cancel(self._flusher)
+            self._flusher = None
+        await self.flush()
+        if self._compaction is not None:
+            await self._compaction
+        if self._rewrite_snapshot:
+            await self._migrate_inline_history()
+        elif self._journal_records:
+            await self.compact()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _lock_for(self, user_id: str) -> asyncio.Lock:
+        return self._locks[hash(user_id) % len(self._locks)]
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.utcnow().isoformat()
+
+    async def _load_history(self, user_id: str) -> StoredHistory:
+        history = self._history.get(user_id)
+        if history is not None:
+            self._history.move_to_end(user_id)
+            return history
+        try:
+            loaded = await asyncio.to_thread(read_history_shard, self._history_dir, user_id)
         except Exception as e:
-            print(f"Failed to load user store: {e}")
+            # Never stand in an empty history: the next write would replace the shard with it.
+            logger.error("Failed to read history shard for %s: %s", user_id, e)
+            raise
+        # A writer may have installed a newer list while the shard was being read.
+        history = self._history.setdefault(user_id, loaded)
+        self._evict_history()
+        return history
+
+    def _evict_history(self) -> None:
+        overflow = len(self._history) - self._history_cache_users
+        if overflow <= 0:
+            return
+        for user_id in list(self._history):
+            if overflow <= 0:
+                break
+            if user_id not in self._history_dirty:
+                del self._history[user_id]
+                overflow -= 1
 
-    def _save(self):
-        # Synchronous save for simplicity, or async if preferred. 
-        # Given low volume, sync write inside lock is okay-ish, but better to run in thread.
-        # For this MVP, we'll just write directly.
+    async def _replace_history(self, user_id: str, history: StoredHistory) -> None:
+        self._history[user_id] = history
+        self._history.move_to_end(user_id)
+        self._history_generation += 1
+        generation = self._history_dirty[user_id] = self._history_generation
+        self._commit({"op": "touch", "user_id": user_id, "at": self._now()})
+        if self._write_behind():
+            self._schedule_flush()
+            return
         try:
-            os.makedirs(os.path.dirname(self._file_path), exist_ok=True)
-            data = {}
-            for user_id, profile in self._store.items():
-                p_dict = asdict(profile)
-                # Serialize datetimes
-                p_dict["joined_date"] = p_dict["joined_date"].isoformat()
-                p_dict["created_on"] = p_dict["created_on"].isoformat()
-                p_dict["updated_on"] = p_dict["updated_on"].isoformat()
-                data[user_id] = p_dict
-            
-            with open(self._file_path, "w") as f:
-                json.dump(data, f, indent=2)
+            await asyncio.to_thread(write_history_shard, self._history_dir, user_id, history)
         except Exception as e:
-            print(f"Failed to save user store: {e}")
+            logger.error("Failed to write history shard for %s: %s", user_id, e)
+            return
+        if self._history_dirty.get(user_id) == generation:
+            del self._history_dirty[user_id]
+        self._evict_history()
 
     async def upsert_profile(self, profile: UserProfile) -> UserProfile:
-        async with self._lock:
-            now = datetime.utcnow()
-            existing = self._store.get(profile.user_id)
-            if existing:
-                existing.email = profile.email or existing.email
-                existing.name = profile.name or existing.name
-                existing.picture = profile.picture or existing.picture
-                existing.updated_on = now
-                self._save()
-                return existing
-            profile.joined_date = now
-            profile.created_on = now
-            profile.updated_on = now
-            self._store[profile.user_id] = profile
-            self._save()
-            return profile
+        async with self._lock_for(profile.user_id):
+            self._commit(
+                {
+                    "op": "profile",
+                    "user_id": profile.user_id,
+                    "email": profile.email,
+                    "name": profile.name,
+                    "picture": profile.picture,
+                    "at": self._now(),
+                }
+            )
+            return self._store[profile.user_id]
 
     async def set_youtube_credentials(self, user_id: str, credentials: Dict[str, Any]) -> None:
-        async with self._lock:
-            profile = self._store.get(user_id)
-            if not profile:
+        async with self._lock_for(user_id):
+            if user_id not in self._store:
                 raise KeyError("user not registered")
-            profile.youtube_credentials = credentials
-            profile.updated_on = datetime.utcnow()
-            self._save()
+            previous = self._store[user_id].youtube_credentials
+            self._commit({"op": "credentials", "user_id": user_id, "credentials": credentials, "at": self._now()})
+        if previous != credentials:
+            notify_credentials_changed(self._credentials_listeners, user_id, previous, credentials)
+
+    def add_credentials_listener(self, listener: CredentialsListener) -> None:
+        self._credentials_listeners.append(listener)
 
     async def add_history(self, user_id: str, playlist: dict) -> None:
-        async with self._lock:
-            profile = self._store.get(user_id)
-            if not profile:
+        async with self._lock_for(user_id):
+            if user_id not in self._store:
                 return
-            # Prepend new playlist
-            profile.history.insert(0, playlist)
-            # Keep only last 50
-            if len(profile.history) > 50:
-                profile.history = profile.history[:50]
-            profile.updated_on = datetime.utcnow()
-            self._save()
+            if self._catalog is not None:
+                playlist = self._catalog.intern_item(playlist)
+            history = await self._load_history(user_id)
+            await self._replace_history(user_id, history.add(playlist, HISTORY_LIMIT))
 
     async def remove_history_item(self, user_id: str, index: int) -> None:
-        async with self._lock:
-            profile = self._store.get(user_id)
-            if not profile:
+        async with self._lock_for(user_id):
+            if user_id not in self._store:
                 return
-            if 0 <= index < len(profile.history):
-                profile.history.pop(index)
-                profile.updated_on = datetime.utcnow()
-                self._save()
+            history = await self._load_history(user_id)
+            if not 0 <= index < len(history):
+                return
+            await self._replace_history(user_id, history.remove(index))
 
     async def clear_history(self, user_id: str) -> None:
-        async with self._lock:
-            profile = self._store.get(user_id)
-            if not profile:
+        async with self._lock_for(user_id):
+            if user_id not in self._store:
                 return
-            profile.history = []
-            profile.updated_on = datetime.utcnow()
-            self._save()
+            history = await self._load_history(user_id)
+            await self._replace_history(user_id, history.clear())
 
     async def get_profile(self, user_id: str) -> Optional[UserProfile]:
-        async with self._lock:
-            return self._store.get(user_id)
+        return self._store.get(user_id)
+
+    async def get_history(self, user_id: str, *, expand_history: bool = False) -> list[dict]:
+        """Return history items shaped like ``PlaylistResponse``.
+
+        Each item's nested ``history`` moods are only resolved when ``expand_history`` is set.
+        """
+        return (await self.get_history_view(user_id, expand_history=expand_history)).items
+
+    async def get_history_view(self, user_id: str, *, expand_history: bool = False) -> HistoryView:
+        if user_id not in self._store:
+            return HistoryView([], 0, [])
+        history = await self._load_history(user_id)
+        items = history.expand(expand_history)
+        if self._catalog is not None:
+            items = [self._catalog.hydrate_item(item) for item in items]
+        return HistoryView(items, history.version, history.changes)
+
+    async def get_history_version(self, user_id: str) -> int:
+        if user_id not in self._store:
+            return 0
+        return (await self._load_history(user_id)).version
 
     async def get_youtube_credentials(self, user_id: str) -> Optional[Dict[str, Any]]:
         profile = await self.get_profile(user_id)
@@ -1,7 +1,18 @@
 from __future__ import annotations
 
 import asyncio
-from typing import List
+import bisect
+import functools
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+import httpx
 
 try:  # pragma: no cover
     from ytmusicapi import YTMusic  # type: ignore
@@ -9,16 +20,260 @@ except ImportError:  # pragma: no cover
     YTMusic = None  # type: ignore
 
 from ..models.response_models import Track
+from ..utils.cache import TTLCache
 from ..utils.config import Settings
+from ..utils.http import build_http_client
 from ..utils.logger import get_logger
+from ..utils.scheduler import UpstreamBusy, UpstreamScheduler, build_upstream_schedulers
+from ..utils.single_flight import SingleFlight
+from .user_store import credentials_fingerprint
 
 logger = get_logger()
 
+_BRACKETED = re.compile(r"[(\[][^)\]]*[)\]]")
+_NON_WORD = re.compile(r"[^\w]+")
+
+# YouTube Data API answers worth retrying.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# A POST creates something each time it reaches the API, so it is only resent when it was
+# refused outright (429) or never left this process.
+POST_RETRY_STATUSES = frozenset({429})
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+MAX_RETRY_AFTER_SECONDS = 30.0
+
+
+@dataclass(slots=True)
+class PlaylistCreation:
+    playlist_id: str
+    added: List[str]
+    # Videos that could not be inserted; resend with ``playlist_id`` to retry them.
+    failed: List[str]
+
+
+def track_identity(track: Track) -> tuple[str, str]:
+    """Normalized (title, artist), so re-uploads and "(Official Video)" variants collapse."""
+
+    def normalize(text: str) -> str:
+        text = _BRACKETED.sub(" ", unicodedata.normalize("NFKC", text).casefold())
+        return " ".join(_NON_WORD.sub(" ", text).split())
+
+    return normalize(track.title), normalize(track.artist)
+
+
+def interleave_unique(result_sets: Iterable[List[Track]], limit: int) -> List[Track]:
+    """Merge ranked result lists round-robin, dropping repeats by video_id or identity."""
+    result_sets = [results for results in result_sets if results]
+    merged: List[Track] = []
+    seen_ids: set[str] = set()
+    seen_identities: set[tuple[str, str]] = set()
+    for rank in range(max((len(results) for results in result_sets), default=0)):
+        for results in result_sets:
+            if rank >= len(results):
+                continue
+            track = results[rank]
+            identity = track_identity(track)
+            if (track.video_id and track.video_id in seen_ids) or identity in seen_identities:
+                continue
+            if track.video_id:
+                seen_ids.add(track.video_id)
+            seen_identities.add(identity)
+            merged.append(track)
+            if len(merged) >= limit:
+                return merged
+    return merged
+
+
+def _missing_videos(video_ids: List[str], existing: List[tuple[str, str]]) -> List[str]:
+    """The videos of ``video_ids``, in order, that the playlist does not hold yet."""
+    present = Counter(video_id for _, video_id in existing)
+    missing: List[str] = []
+    for video_id in video_ids:
+        if present[video_id]:
+            present[video_id] -= 1
+        else:
+            missing.append(video_id)
+    return missing
+
+
+def _with_appended(
+    items: List[tuple[str, str]], appended: List[tuple[int | None, str, str]]
+) -> List[tuple[str, str]] | None:
+    """The playlist after ``(position, item id, video id)`` appends, or None if their
+    reported positions do not account for exactly the slots after ``items``."""
+    if any(position is None for position, _, _ in appended):
+        return None
+    ordered = sorted(appended, key=lambda item: item[0])
+    if [position for position, _, _ in ordered] != list(range(len(items), len(items) + len(appended))):
+        return None
+    return items + [(item_id, video_id) for _, item_id, video_id in ordered]
+
+
+def reorder_moves(items: List[tuple[str, str]], video_ids: List[str]) -> List[tuple[str, str, int]]:
+    """``(item id, video id, position)`` updates that put the playlist's copies of
+    ``video_ids`` in that order with as few moves as possible.
+
+    Items on the longest run already in order stay put; each other item is moved, in target
+    order, to just after its predecessor. Items that are not in ``video_ids`` are left alone.
+    """
+    ranks: Dict[str, List[int]] = {}
+    for rank, video_id in enumerate(video_ids):
+        ranks.setdefault(video_id, []).append(rank)
+    seen: Counter[str] = Counter()
+    ranked: List[tuple[int, int]] = []  # (index in items, target rank)
+    for index, (_, video_id) in enumerate(items):
+        occurrence = seen[video_id]
+        seen[video_id] += 1
+        if occurrence < len(ranks.get(video_id, ())):
+            ranked.append((index, ranks[video_id][occurrence]))
+
+    # Longest increasing run of ranks (patience sorting), as indexes into ``items``.
+    tails: List[int] = []
+    tail_ranks: List[int] = []
+    previous: Dict[int, int | None] = {}
+    for index, rank in ranked:
+        slot = bisect.bisect_left(tail_ranks, rank)
+        previous[index] = tails[slot - 1] if slot else None
+        if slot == len(tails):
+            tails.append(index)
+            tail_ranks.append(rank)
+        else:
+            tails[slot] = index
+            tail_ranks[slot] = rank
+    rank_of = dict(ranked)
+    placed: Dict[int, int] = {}  # index in items -> rank, for items already where they belong
+    index = tails[-1] if tails else None
+    while index is not None:
+        placed[index] = rank_of[index]
+        index = previous[index]
+
+    order = list(range(len(items)))
+    moves: List[tuple[str, str, int]] = []
+    for index, rank in sorted((pair for pair in ranked if pair[0] not in placed), key=lambda pair: pair[1]):
+        order.remove(index)
+        before = [i for i, r in placed.items() if r < rank]
+        if before:
+            position = order.index(max(before, key=placed.__getitem__)) + 1
+        else:
+            position = order.index(min(placed, key=placed.__getitem__))
+        order.insert(position, index)
+        placed[index] = rank
+        moves.append((items[index][0], items[index][1], position))
+    return moves
+
+
+class YTMusicClientPool:
+    """Bounded LRU pool of per-credential ``YTMusic`` clients.
+
+    Clients are keyed by a fingerprint of the OAuth credentials, so a signed-in user keeps
+    one warm client (and its HTTP session) across searches, and changed credentials never
+    reuse a client built for the old ones. Clients unused for ``idle_seconds`` are dropped
+    on the next access. Searches run in worker threads, hence the lock.
+    """
+
+    def __init__(self, factory: Callable[[Dict[str, Any]], Any], max_size: int, idle_seconds: float) -> None:
+        self._factory = factory
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        # Least recently used first; values are (client, last_used).
+        self._clients: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, credentials: Dict[str, Any]) -> Any:
+        key = credentials_fingerprint(credentials)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                self._clients[key] = (entry[0], now)
+                self._clients.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            self._misses += 1
+        # Build outside the lock; if two threads race, the last one wins and both work.
+        client = self._factory(credentials)
+        with self._lock:
+            self._clients[key] = (client, now)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+                self._evictions += 1
+        return client
+
+    def discard(self, credentials: Optional[Dict[str, Any]]) -> None:
+        if not credentials:
+            return
+        with self._lock:
+            self._clients.pop(credentials_fingerprint(credentials), None)
+
+    def _evict_idle(self, now: float) -> None:
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if now - last_used <= self.idle_seconds:
+                return
+            del self._clients[key]
+            self._evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "clients": len(self._clients),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "evictions": self._evictions,
+        }
+
 
 class YouTubeMusicService:
-    def __init__(self, settings: Settings) -> None:
+    def __init__(
+        self,
+        settings: Settings,
+        *,
+        http: httpx.AsyncClient | None = None,
+        scheduler: UpstreamScheduler | None = None,
+    ) -> None:
         self.settings = settings
+        self._scheduler = scheduler or build_upstream_schedulers(settings)["youtube"]
+        self._owns_http = http is None
+        self._http = http or build_http_client(settings)
         self._default_client = self._build_client(settings.youtube_oauth_json, None)
+        self._search_cache: TTLCache[List[Track]] = TTLCache(
+            settings.youtube_search_cache_ttl_seconds,
+            settings.youtube_search_cache_max_entries,
+            stale_seconds=settings.youtube_search_cache_stale_seconds,
+        )
+        # Misses and background refreshes of the same query share one upstream search.
+        self._search_flights: SingleFlight[List[Track]] = SingleFlight()
+        self._user_clients = YTMusicClientPool(
+            lambda credentials: self._build_client(None, credentials),
+            settings.youtube_client_pool_size,
+            settings.youtube_client_idle_seconds,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "search_cache": self._search_cache.stats(),
+            "search_flights": self._search_flights.stats(),
+            "user_clients": self._user_clients.stats(),
+        }
+
+    def forget_credentials(
+        self, user_id: str, previous: Optional[Dict[str, Any]], credentials: Dict[str, Any]
+    ) -> None:
+        """``UserStore`` credentials listener: drop the client built for the old credentials."""
+        self._user_clients.discard(previous)
+
+    async def close(self) -> None:
+        await self._search_flights.cancel_all()
+        if self._owns_http:
+            await self._http.aclose()
 
     def _build_client(self, auth_headers: str | dict | None, oauth_credentials: dict | None):
         if YTMusic is None:
@@ -35,11 +290,81 @@ class YouTubeMusicService:
 
     def _client_for(self, credentials: dict | None):
         if credentials:
-            return self._build_client(None, credentials)
+            return self._user_clients.get(credentials)
         return self._default_client
 
     async def search_tracks(
         self, keywords: List[str], limit: int = 20, user_credentials: dict | None = None
+    ) -> List[Track]:
+        """Search songs, answering repeated keyword sets from a cache.
+
+        Stale entries are served immediately while a background task refreshes them.
+        """
+        key = (tuple(sorted(keyword.strip().lower() for keyword in keywords)), limit, bool(user_credentials))
+        search = functools.partial(self._search_and_remember, key, keywords, limit, user_credentials)
+        found = self._search_cache.get_stale(key)
+        if found is not None:
+            tracks, fresh = found
+            if not fresh:
+                self._search_flights.start(key, search)
+            return list(tracks)
+        return list(await self._search_flights.do(key, search))
+
+    async def search_fan_out(
+        self, queries: List[str], limit: int = 50, user_credentials: dict | None = None
+    ) -> List[Track]:
+        """Search each query separately and interleave the results.
+
+        At most ``youtube_fan_out_concurrency`` searches run at once and each is bounded by
+        ``youtube_fan_out_timeout_seconds``; a query that fails or times out is skipped. If
+        the scheduler turns a query away, the whole search raises ``UpstreamBusy``, so the
+        caller can answer with Retry-After. Every sub-query goes through ``search_tracks``,
+        so it is cached and coalesced.
+        """
+        unique_queries = list(dict.fromkeys(query.strip().casefold() for query in queries if query.strip()))
+        if not unique_queries:
+            return await self.search_tracks([], limit=limit, user_credentials=user_credentials)
+        semaphore = asyncio.Semaphore(self.settings.youtube_fan_out_concurrency)
+        per_query = self.settings.youtube_fan_out_per_query_limit
+
+        async def search_one(query: str) -> List[Track]:
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        self.search_tracks([query], limit=per_query, user_credentials=user_credentials),
+                        self.settings.youtube_fan_out_timeout_seconds,
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning("Search for %r timed out; leaving it out of the playlist", query)
+                except UpstreamBusy:
+                    raise
+                except Exception as e:
+                    logger.warning("Search for %r failed: %s", query, e)
+                return []
+
+        searches = [asyncio.ensure_future(search_one(query)) for query in unique_queries]
+        try:
+            result_sets = await asyncio.gather(*searches)
+        except UpstreamBusy:
+            for search in searches:
+                search.cancel()
+            raise
+        return interleave_unique(result_sets, limit)
+
+    async def _search_and_remember(
+        self, key: Hashable, keywords: List[str], limit: int, user_credentials: dict | None
+    ) -> List[Track]:
+        try:
+            tracks = await self._search_tracks(keywords, limit, user_credentials)
+        except Exception as e:
+            logger.warning("Search %s failed: %s", key, e)
+            raise
+        if tracks:
+            self._search_cache.set(key, tracks)
+        return tracks
+
+    async def _search_tracks(
+        self, keywords: List[str], limit: int, user_credentials: dict | None
     ) -> List[Track]:
         query = " ".join(keywords) or "mood radio"
         logger.info("Searching Youtube Music: %s", query)
@@ -62,28 +387,41 @@ class YouTubeMusicService:
                 tracks.append(track)
             return tracks
 
-        return await asyncio.to_thread(_search)
+        async with self._scheduler.slot():
+            return await asyncio.to_thread(_search)
 
     async def refresh_auth(self) -> None:
         logger.info("Refreshing YouTube Music headers")
         self._default_client = self._build_client(self.settings.youtube_oauth_json, None)
 
     async def create_playlist(
-        self, title: str, video_ids: List[str], auth_headers: dict | None = None
-    ) -> str:
-        logger.info("Creating playlist '%s' with %d tracks via Official API", title, len(video_ids))
+        self,
+        title: str,
+        video_ids: List[str],
+        auth_headers: dict | None = None,
+        playlist_id: str | None = None,
+    ) -> PlaylistCreation:
+        """Create a private playlist holding ``video_ids`` in order, or complete ``playlist_id``.
 
+        Items are appended ``youtube_api_concurrency`` at a time. Concurrent appends can land
+        out of order; each insert reports where it landed, so the items off the longest
+        in-order run are then moved into place without reading the playlist back. A failed
+        insert may still have landed, so before inserts are retried the playlist is read back
+        and only what is missing is sent again. Videos that could not be added are reported in
+        ``failed``; calling again with the same ``video_ids`` and the returned ``playlist_id``
+        inserts only what is missing.
+        """
         if not auth_headers or "Authorization" not in auth_headers:
             raise RuntimeError("Missing Authorization header for official API call")
 
-        import httpx
-        
-        async with httpx.AsyncClient() as client:
-            # 1. Create Playlist
-            playlist_resp = await client.post(
-                "https://www.googleapis.com/youtube/v3/playlists",
+        items: List[tuple[str, str]] | None = []
+        if playlist_id is None:
+            logger.info("Creating playlist '%s' with %d tracks via Official API", title, len(video_ids))
+            playlist_resp = await self._api(
+                "POST",
+                "playlists",
+                auth_headers,
                 params={"part": "snippet,status"},
-                headers=auth_headers,
                 json={
                     "snippet": {
                         "title": title,
@@ -92,35 +430,155 @@ class YouTubeMusicService:
                     "status": {"privacyStatus": "private"},
                 },
             )
-            
             if playlist_resp.status_code != 200:
                 logger.error("Failed to create playlist: %s", playlist_resp.text)
                 raise RuntimeError(f"YouTube API Error: {playlist_resp.text}")
-                
-            playlist_data = playlist_resp.json()
-            playlist_id = playlist_data["id"]
+            playlist_id = playlist_resp.json()["id"]
             logger.info("Created playlist ID: %s", playlist_id)
+        else:
+            logger.info("Completing playlist %s with %d tracks", playlist_id, len(video_ids))
+            items = await self._playlist_items(playlist_id, auth_headers)
+
+        retries = self.settings.youtube_api_max_retries
+        failed: List[str] = []
+        for attempt in range(retries + 1):
+            appended, failed = await self._append_items(playlist_id, _missing_videos(video_ids, items), auth_headers)
+            items = _with_appended(items, appended)
+            if not failed or attempt >= retries:
+                break
+            # A failed insert may still have landed; check before sending it again.
+            await asyncio.sleep(self._backoff(attempt))
+            try:
+                items = await self._playlist_items(playlist_id, auth_headers)
+            except Exception as e:
+                logger.warning("Could not read back playlist %s to retry failed inserts: %s", playlist_id, e)
+                break
+
+        if failed or items is None:
+            # The playlist's contents are not known for certain; only a read-back tells.
+            try:
+                items = await self._playlist_items(playlist_id, auth_headers)
+            except Exception as e:
+                logger.warning("Could not read back playlist %s to check its order: %s", playlist_id, e)
+                items = None
+            else:
+                failed = _missing_videos(video_ids, items)
+        if items is not None:
+            await self._restore_order(playlist_id, items, video_ids, auth_headers)
+
+        unfinished = Counter(failed)
+        added: List[str] = []
+        for video_id in video_ids:
+            if unfinished[video_id]:
+                unfinished[video_id] -= 1
+            else:
+                added.append(video_id)
+        return PlaylistCreation(playlist_id=playlist_id, added=added, failed=failed)
+
+    async def _append_items(
+        self, playlist_id: str, video_ids: List[str], auth_headers: dict
+    ) -> tuple[List[tuple[int | None, str, str]], List[str]]:
+        """Append ``video_ids`` concurrently.
+
+        Returns ``(position, item id, video id)`` for each insert that succeeded, with the
+        position the API reported (None if it did not), and the videos that failed.
+        """
+        semaphore = asyncio.Semaphore(self.settings.youtube_api_concurrency)
+        appended: List[tuple[int | None, str, str]] = []
+        failed: List[str] = []
 
-            # 2. Add Items (sequentially to avoid rate limits/ordering issues)
-            for video_id in video_ids:
+        async def append(video_id: str) -> None:
+            body = {
+                "snippet": {
+                    "playlistId": playlist_id,
+                    "resourceId": {"kind": "youtube#video", "videoId": video_id},
+                }
+            }
+            async with semaphore:
                 try:
-                    item_resp = await client.post(
-                        "https://www.googleapis.com/youtube/v3/playlistItems",
-                        params={"part": "snippet"},
-                        headers=auth_headers,
-                        json={
-                            "snippet": {
-                                "playlistId": playlist_id,
-                                "resourceId": {
-                                    "kind": "youtube#video",
-                                    "videoId": video_id,
-                                },
-                            }
-                        },
+                    item_resp = await self._api(
+                        "POST", "playlistItems", auth_headers, params={"part": "snippet"}, json=body
                     )
-                    if item_resp.status_code != 200:
-                        logger.warning("Failed to add video %s: %s", video_id, item_resp.text)
-                except Exception as e:
+                except httpx.HTTPError as e:
                     logger.error("Error adding video %s: %s", video_id, e)
+                    failed.append(video_id)
+                    return
+            if item_resp.status_code != 200:
+                logger.warning("Failed to add video %s: %s", video_id, item_resp.text)
+                failed.append(video_id)
+                return
+            try:
+                item = item_resp.json()
+                appended.append((item["snippet"].get("position"), item["id"], video_id))
+            except (ValueError, KeyError, TypeError):
+                appended.append((None, "", video_id))
+
+        await asyncio.gather(*(append(video_id) for video_id in video_ids))
+        order = {video_id: index for index, video_id in enumerate(video_ids)}
+        failed.sort(key=order.__getitem__)
+        return appended, failed
+
+    async def _playlist_items(self, playlist_id: str, auth_headers: dict) -> List[tuple[str, str]]:
+        """``(playlist item id, video id)`` for every item, in playlist order."""
+        items: List[tuple[str, str]] = []
+        params = {"part": "snippet", "playlistId": playlist_id, "maxResults": 50}
+        while True:
+            response = await self._api("GET", "playlistItems", auth_headers, params=params)
+            if response.status_code != 200:
+                raise RuntimeError(f"YouTube API Error: {response.text}")
+            page = response.json()
+            for item in page.get("items", []):
+                items.append((item["id"], item["snippet"]["resourceId"]["videoId"]))
+            if not page.get("nextPageToken"):
+                return items
+            params = {**params, "pageToken": page["nextPageToken"]}
+
+    async def _restore_order(
+        self, playlist_id: str, items: List[tuple[str, str]], video_ids: List[str], auth_headers: dict
+    ) -> None:
+        for item_id, video_id, position in reorder_moves(items, video_ids):
+            body = {
+                "id": item_id,
+                "snippet": {
+                    "playlistId": playlist_id,
+                    "position": position,
+                    "resourceId": {"kind": "youtube#video", "videoId": video_id},
+                },
+            }
+            response = await self._api("PUT", "playlistItems", auth_headers, params={"part": "snippet"}, json=body)
+            if response.status_code != 200:
+                logger.warning("Could not move video %s in playlist %s: %s", video_id, playlist_id, response.text)
+                return
+
+    async def _api(self, method: str, path: str, auth_headers: dict, **kwargs: Any) -> httpx.Response:
+        """Call the YouTube Data API, retrying 429/5xx answers and transport errors with backoff.
+
+        POSTs are not idempotent: they are only retried on 429 and on errors raised before
+        the request was sent, so a create that timed out or got a 5xx is never sent twice.
+        """
+        url = f"{self.settings.youtube_api_base_url}/{path}"
+        retries = self.settings.youtube_api_max_retries
+        idempotent = method != "POST"
+        retry_statuses = RETRY_STATUSES if idempotent else POST_RETRY_STATUSES
+        attempt = 0
+        while True:
+            try:
+                response = await self._http.request(method, url, headers=auth_headers, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= retries or not (idempotent or isinstance(e, UNSENT_ERRORS)):
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if response.status_code not in retry_statuses or attempt >= retries:
+                    return response
+                delay = self._backoff(attempt, response.headers.get("retry-after"))
+            await asyncio.sleep(delay)
+            attempt += 1
 
-            return playlist_id
+    def _backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), MAX_RETRY_AFTER_SECONDS)
+            except ValueError:
+                pass
+        return self.settings.youtube_api_backoff_seconds * 2**attempt * random.uniform(0.5, 1.0)
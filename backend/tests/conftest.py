@@ -20,6 +20,9 @@ from backend.utils.config import Settings
 
 
 class FakeGeminiClient:
+    def has_cached_mood(self, prompt: str) -> bool:
+        return False
+
     async def analyze_mood(self, prompt: str) -> MoodProfile:
         return MoodProfile(
             primary_mood="uplifted",
@@ -54,11 +57,13 @@ class FakeYouTubeMusicService:
 
 
 @pytest.fixture
-def settings() -> Settings:
+def settings(tmp_path) -> Settings:
     return Settings(
         gemini_api_key="test-key",
         google_client_id="test-client-id.apps.googleusercontent.com",
         google_client_secret="test-secret",
+        user_store_path=str(tmp_path / "users.json"),
+        track_catalog_path=str(tmp_path / "tracks.jsonl"),
     )
 
 
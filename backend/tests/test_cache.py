@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import pytest
+
+from backend.utils.cache import ENTRY_OVERHEAD_BYTES, DeviceCache
+
+
+@pytest.mark.asyncio
+async def test_global_budget_evicts_least_recently_used_device():
+    cache = DeviceCache(ttl_seconds=60, max_entries=5, max_total_entries=4)
+    for device_id in ("a", "b"):
+        await cache.remember(device_id, "playlist", device_id)
+        await cache.remember(device_id, "playlist", device_id)
+    assert await cache.get_latest("a") == "a"
+
+    await cache.remember("c", "playlist", "c")
+    assert await cache.get_latest("b") is None
+    assert await cache.get_latest("a") == "a"
+    stats = cache.stats()
+    assert stats["devices"] == 2 and stats["entries"] == 3
+    assert stats["evictions"] == 2
+    assert stats["hits"] == 2 and stats["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_byte_budget_and_sweep(monkeypatch):
+    cache = DeviceCache(ttl_seconds=10, max_entries=5, max_total_bytes=2 * ENTRY_OVERHEAD_BYTES + 150)
+    await cache.remember("a", "playlist", None, payload=b"x" * 100)
+    await cache.remember("b", "playlist", None, payload=b"x" * 100)
+    assert cache.stats()["devices"] == 1
+
+    monkeypatch.setattr("backend.utils.cache.time.time", lambda: 1e12)
+    assert await cache.sweep() == 1
+    stats = cache.stats()
+    assert (stats["devices"], stats["entries"], stats["approx_bytes"]) == (0, 0, 0)
+    assert stats["expirations"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stats_endpoint_reports_device_cache(client):
+    await client.post("/playlists/generate", json={"prompt": "first", "device_id": "d"})
+    stats = (await client.get("/stats")).json()["device_cache"]
+    assert stats["entries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_lookups_by_key_skip_other_keys_and_share_the_device_cap():
+    cache = DeviceCache(ttl_seconds=60, max_entries=3)
+    await cache.remember("d", "playlist", "p1")
+    await cache.remember("d", "mood", "m1")
+    await cache.remember("d", "playlist", "p2")
+    assert [entry.value for entry in await cache.history("d", key="playlist")] == ["p2", "p1"]
+    assert await cache.get_latest("d", key="mood") == "m1"
+
+    await cache.remember("d", "mood", "m2")
+    assert [entry.value for entry in await cache.history("d")] == ["m2", "p2", "m1"]
+    assert [entry.value for entry in await cache.history("d", key="playlist")] == ["p2"]
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from backend.models.response_models import MoodProfile
+from backend.services.gemini_client import GeminiClient, canonical_prompt
+
+MOOD = {"primary_mood": "focused", "narrative": "Heads down.", "keywords": ["lofi"]}
+
+
+class FakeAsyncModels:
+    """Stands in for ``client.aio.models``: streams ``chunks`` text parts, the last carrying the mood JSON."""
+
+    def __init__(self, chunks: int) -> None:
+        self._texts = [f"word{i} " for i in range(chunks - 1)] + ["###JSON_SEPARATOR###" + json.dumps(MOOD)]
+
+    async def generate_content_stream(self, **_):
+        async def stream():
+            for text in self._texts:
+                yield SimpleNamespace(text=text)
+
+        return stream()
+
+
+def test_canonical_prompt_folds_case_punctuation_and_spacing():
+    assert canonical_prompt("  Chill, FOCUS music!! ") == canonical_prompt("chill focus   music")
+    assert canonical_prompt("Ｇｙｍ hype") == "gym hype"
+
+
+@pytest.mark.asyncio
+async def test_analyze_mood_is_cached_by_canonical_prompt(settings, monkeypatch):
+    client = GeminiClient(settings)
+    calls = []
+
+    async def analyze(prompt: str) -> MoodProfile:
+        calls.append(prompt)
+        return MoodProfile(**MOOD)
+
+    monkeypatch.setattr(client, "_analyze_mood", analyze)
+    first = await client.analyze_mood("Chill focus music")
+    first.keywords.append("mutated")
+    second = await client.analyze_mood("chill, focus music!")
+    assert calls == ["Chill focus music"]
+    assert second.keywords == ["lofi"]
+    assert client.stats()["mood_cache"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_hit_replays_narrative_chunks(settings, monkeypatch):
+    client = GeminiClient(settings)
+    calls = []
+
+    async def stream(prompt: str):
+        calls.append(prompt)
+        yield {"type": "narrative_chunk", "text": "Heads "}
+        yield {"type": "narrative_chunk", "text": "down."}
+        yield {"type": "json_full", "data": MOOD}
+
+    monkeypatch.setattr(client, "_analyze_mood_stream", stream)
+    first = [chunk async for chunk in client.analyze_mood_stream("gym hype")]
+    replayed = [chunk async for chunk in client.analyze_mood_stream("GYM hype")]
+    assert calls == ["gym hype"]
+    assert [chunk["type"] for chunk in replayed] == [
+        "narrative_chunk",
+        "narrative_chunk",
+        "keywords_ready",
+        "json_full",
+    ]
+    assert replayed[:2] == first[:2]
+    assert MoodProfile(**replayed[-1]["data"]) == MoodProfile(**MOOD)
+    assert (await client.analyze_mood("gym hype")).primary_mood == "focused"
+
+
+@pytest.mark.asyncio
+async def test_paraphrased_prompt_reuses_mood(settings, monkeypatch):
+    settings.gemini_paraphrase_cache_max_entries = 64
+    client = GeminiClient(settings)
+    calls = []
+
+    async def analyze(prompt: str) -> MoodProfile:
+        calls.append(prompt)
+        return MoodProfile(**MOOD)
+
+    monkeypatch.setattr(client, "_analyze_mood", analyze)
+    await client.analyze_mood("lofi study music")
+    await client.analyze_mood("study music lofi")
+    await client.analyze_mood("80s rock")
+    await client.analyze_mood("90s rock")
+    await client.analyze_mood("not 90s rock")
+    assert calls == ["lofi study music", "80s rock", "90s rock", "not 90s rock"]
+    assert client.stats()["paraphrases"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_prompts_share_one_call(settings, monkeypatch):
+    client = GeminiClient(settings)
+    calls = []
+
+    async def analyze(prompt: str) -> MoodProfile:
+        calls.append(prompt)
+        await asyncio.sleep(0)
+        return MoodProfile(**MOOD)
+
+    monkeypatch.setattr(client, "_analyze_mood", analyze)
+    moods = await asyncio.gather(*(client.analyze_mood("trending vibe") for _ in range(5)))
+    assert calls == ["trending vibe"]
+    assert len({id(mood) for mood in moods}) == 5
+
+
+@pytest.mark.asyncio
+async def test_stream_reads_chunks_from_async_sdk(settings):
+    client = GeminiClient(settings)
+    client._client = SimpleNamespace(aio=SimpleNamespace(models=FakeAsyncModels(5)))
+    chunks = [chunk async for chunk in client.analyze_mood_stream("late night drive")]
+    assert [chunk["type"] for chunk in chunks] == ["narrative_chunk"] * 4 + ["keywords_ready", "json_full"]
+    assert chunks[-1]["data"]["primary_mood"] == "focused"
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from google.auth import crypt, exceptions, jwt
+
+from backend.services.google_auth import GoogleAuthService
+from backend.services.google_certs import cache_lifetime
+
+CREDENTIALS = {"refresh_token": "r", "client_id": "c", "client_secret": "s"}
+
+
+@pytest.fixture
+def google_auth(settings, monkeypatch):
+    service = GoogleAuthService(settings)
+    service.fetches = 0
+    service.now = 1000.0
+    monkeypatch.setattr("backend.services.google_auth.time.time", lambda: service.now)
+
+    def fetch(credentials):
+        service.fetches += 1
+        return f"token-{service.fetches}", service.now + 3600
+
+    monkeypatch.setattr(service, "_fetch_access_token", fetch)
+    return service
+
+
+@pytest.mark.asyncio
+async def test_access_token_is_cached_and_refreshed_once(google_auth):
+    tokens = await asyncio.gather(*(google_auth.get_access_token("u1", CREDENTIALS) for _ in range(5)))
+    assert tokens == ["token-1"] * 5 and google_auth.fetches == 1
+
+    google_auth.now += 3600 - 60
+    assert await google_auth.get_access_token("u1", CREDENTIALS) == "token-1"
+    await asyncio.gather(*google_auth._token_flights._calls.values())
+    assert await google_auth.get_access_token("u1", CREDENTIALS) == "token-2"
+
+    google_auth.now += 7200
+    assert await google_auth.get_access_token("u1", CREDENTIALS) == "token-3"
+
+
+@pytest.mark.asyncio
+async def test_changed_credentials_are_not_served_the_old_token(google_auth):
+    await google_auth.get_access_token("u1", CREDENTIALS)
+    assert await google_auth.get_access_token("u1", {**CREDENTIALS, "refresh_token": "new"}) == "token-2"
+    google_auth.forget_access_token("u1", CREDENTIALS, {})
+    assert await google_auth.get_access_token("u1", CREDENTIALS) == "token-3"
+
+
+@pytest.fixture(scope="module")
+def signing_key():
+    rsa = pytest.importorskip("rsa")
+    public_key, private_key = rsa.newkeys(1024)
+    return private_key.save_pkcs1(), public_key.save_pkcs1().decode()
+
+
+class FakeCertEndpoint:
+    def __init__(self, certs, max_age=3600):
+        self.certs = certs
+        self.max_age = max_age
+        self.requests = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        return httpx.Response(200, json=self.certs, headers={"Cache-Control": f"public, max-age={self.max_age}"})
+
+
+def sign(private_pem, settings, kid="key-1", **claims):
+    signer = crypt.RSASigner.from_string(private_pem, key_id=kid)
+    now = int(time.time())
+    payload = {
+        "iss": "https://accounts.google.com",
+        "aud": settings.google_client_id,
+        "sub": "user-1",
+        "email": "listener@example.com",
+        "name": "Listener",
+        "iat": now,
+        "exp": now + 3600,
+        **claims,
+    }
+    return jwt.encode(signer, payload).decode()
+
+
+def auth_service(settings, endpoint):
+    return GoogleAuthService(settings, http=httpx.AsyncClient(transport=httpx.MockTransport(endpoint)))
+
+
+@pytest.mark.asyncio
+async def test_id_token_verification_reuses_certs_and_verified_tokens(settings, signing_key):
+    private_pem, public_pem = signing_key
+    endpoint = FakeCertEndpoint({"key-1": public_pem})
+    service = auth_service(settings, endpoint)
+
+    token = sign(private_pem, settings)
+    profile = await service.verify_id_token(token)
+    assert (profile.user_id, profile.email, profile.name) == ("user-1", "listener@example.com", "Listener")
+    assert await service.verify_id_token(token) == profile
+    assert (await service.verify_id_token(sign(private_pem, settings, sub="user-2"))).user_id == "user-2"
+    assert endpoint.requests == 1
+    assert service.stats()["verified_tokens"]["hits"] == 1
+
+    with pytest.raises(ValueError):
+        await service.verify_id_token(sign(private_pem, settings, aud="someone-else"))
+    with pytest.raises(exceptions.GoogleAuthError):
+        await service.verify_id_token(sign(private_pem, settings, iss="https://evil.example.com"))
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_certs_follow_max_age_and_pick_up_new_keys(settings, signing_key, monkeypatch):
+    private_pem, public_pem = signing_key
+    endpoint = FakeCertEndpoint({"key-1": public_pem}, max_age=600)
+    service = auth_service(settings, endpoint)
+    tokens = [sign(private_pem, settings, sub="user-1"), sign(private_pem, settings, sub="user-2")]
+    rotated = sign(private_pem, settings, kid="key-2")
+    now = [time.time()]
+    monkeypatch.setattr("backend.services.google_certs.time.time", lambda: now[0])
+
+    await service.verify_id_token(tokens[0])
+    now[0] += 400  # inside the refresh margin: served from cache, refreshed in the background
+    await service.verify_id_token(tokens[1])
+    await asyncio.gather(*service._certs._flights._calls.values())
+    assert endpoint.requests == 2
+
+    endpoint.certs = {"key-1": public_pem, "key-2": public_pem}
+    await service.verify_id_token(rotated)
+    assert endpoint.requests == 3
+    await service.close()
+
+
+def test_cache_lifetime_reads_max_age_and_age():
+    headers = httpx.Headers({"Cache-Control": "public, max-age=19845, must-revalidate", "Age": "45"})
+    assert cache_lifetime(headers, 60) == 19800
+    assert cache_lifetime(httpx.Headers({"Cache-Control": "no-cache"}), 60) == 60
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+
+from backend.services.mood_stream import MoodStreamParser
+
+MOOD = {
+    "primary_mood": "nocturnal",
+    "narrative": 'Say "drive" \\ go',
+    "keywords": ["synthwave", "night [drive]"],
+    "recommended_genres": ["retro"],
+}
+
+
+def _feed_all(parser: MoodStreamParser, chunks: list[str]) -> list[dict]:
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events + parser.close()
+
+
+def test_separator_split_across_chunks_is_detected():
+    text = "Buckle up.###JSON_SEPARATOR###" + json.dumps(MOOD)
+    for size in (1, 3, 7, 16):
+        parser = MoodStreamParser()
+        events = _feed_all(parser, [text[i : i + size] for i in range(0, len(text), size)])
+        narrative = "".join(event["text"] for event in events if event["type"] == "narrative_chunk")
+        assert narrative == "Buckle up."
+        assert json.loads(parser.json_text) == MOOD
+        assert [event["keywords"] for event in events if event["type"] == "keywords_ready"] == [MOOD["keywords"]]
+
+
+def test_keywords_are_ready_before_the_json_completes():
+    parser = MoodStreamParser()
+    tail = json.dumps(MOOD)
+    cut = tail.index("recommended_genres")
+    events = _feed_all(parser, ["Hi ###JSON_", "SEPARATOR###```json\n" + tail[:cut]])
+    assert events[-1] == {"type": "keywords_ready", "keywords": MOOD["keywords"]}
+    assert parser.feed(tail[cut:]) == []
+
+
+def test_stream_without_separator_is_all_narrative():
+    parser = MoodStreamParser()
+    events = _feed_all(parser, ["just words ###", "JSON"])
+    assert "".join(event["text"] for event in events) == "just words ###JSON"
+    assert parser.json_text == ""
+
+
+class StreamingGemini:
+    def __init__(self, log: list[str]) -> None:
+        self.log = log
+
+    def has_cached_mood(self, prompt: str) -> bool:
+        return False
+
+    async def analyze_mood_stream(self, prompt: str):
+        yield {"type": "narrative_chunk", "text": "Night mode."}
+        yield {"type": "keywords_ready", "keywords": MOOD["keywords"]}
+        await asyncio.sleep(0.01)
+        self.log.append("json_full")
+        yield {"type": "json_full", "data": MOOD}
+
+
+@pytest.mark.asyncio
+async def test_stream_endpoint_starts_search_on_keywords(client, test_app):
+    log: list[str] = []
+    test_app.state.gemini_client = StreamingGemini(log)
+    youtube = test_app.state.youtube_service
+    original = youtube.search_tracks
+
+    async def search_tracks(keywords, limit=20, user_credentials=None):
+        log.append("search")
+        return await original(keywords, limit=limit, user_credentials=user_credentials)
+
+    youtube.search_tracks = search_tracks
+    resp = await client.post("/playlists/generate/stream", json={"prompt": "night drive", "device_id": "d"})
+    assert "event: result" in resp.text
+    assert log == ["search", "json_full"]
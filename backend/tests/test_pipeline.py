@@ -36,3 +36,13 @@ async def test_empty_youtube_response_returns_error(client, test_app):
     test_app.state.youtube_service = EmptyYT()
     resp = await client.post("/playlists/generate", json={"prompt": "test", "device_id": "x"})
     assert resp.status_code == 502
+
+
+@pytest.mark.asyncio
+async def test_device_history_replays_rendered_responses(client):
+    first = await client.post("/playlists/generate", json={"prompt": "first", "device_id": "device-3"})
+    second = await client.post("/playlists/generate", json={"prompt": "second", "device_id": "device-3"})
+
+    resp = await client.get("/playlists/history/device-3")
+    assert resp.json() == [second.json(), first.json()]
+    assert second.json()["history"] == [first.json()["mood"]]
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import pytest
+from httpx import AsyncClient
+
+from backend.app import create_app
+
+from backend.services.playlist_history import StoredHistory, build_delta
+from backend.services.sqlite_user_store import SQLiteUserStore
+from backend.services.user_store import UserProfile
+
+
+def _mood(label: str) -> dict:
+    return {"primary_mood": label, "narrative": f"{label} arc"}
+
+
+def _response(index: int) -> dict:
+    # Mirrors the router: every response embeds the moods of the playlists before it.
+    return {
+        "prompt": f"prompt {index}",
+        "mood": _mood(f"mood {index}"),
+        "tracks": [],
+        "history": [_mood(f"mood {earlier}") for earlier in range(index)],
+    }
+
+
+def test_nested_moods_are_stored_once():
+    history = StoredHistory()
+    for index in range(10):
+        history = history.add(_response(index), limit=50)
+
+    assert len(history.moods) == 9
+    assert all("history" not in item for item in history.items)
+    assert history.expand()[0]["history"] == []
+    assert [mood["primary_mood"] for mood in history.expand(True)[0]["history"]] == [
+        f"mood {i}" for i in range(9)
+    ]
+
+
+def test_removing_items_prunes_unreferenced_moods():
+    history = StoredHistory.from_payload([_response(2), _response(1)])
+    assert set(history.moods) == {ref for item in history.items for ref in item["history_refs"]}
+    history = history.remove(0)
+    assert len(history.moods) == 1
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store_expands_history_on_request(tmp_path):
+    store = SQLiteUserStore(str(tmp_path / "users.db"))
+    await store.upsert_profile(UserProfile(user_id="u1", email="", name="Listener", picture=None))
+    for index in range(3):
+        await store.add_history("u1", _response(index))
+
+    assert [item["history"] for item in await store.get_history("u1")] == [[], [], []]
+    expanded = await store.get_history("u1", expand_history=True)
+    assert [len(item["history"]) for item in expanded] == [2, 1, 0]
+
+    await store.remove_history_item("u1", 0)
+    expanded = await store.get_history("u1", expand_history=True)
+    assert [len(item["history"]) for item in expanded] == [1, 0]
+    await store.stop()
+
+
+@pytest.mark.asyncio
+async def test_user_history_endpoint_expands_on_request(client, test_app):
+    store = test_app.state.user_store
+    await store.upsert_profile(UserProfile(user_id="u1", email="", name="Listener", picture=None))
+    await client.post("/playlists/generate", json={"prompt": "first", "device_id": "d", "user_id": "u1"})
+    await client.post("/playlists/generate", json={"prompt": "second", "device_id": "d", "user_id": "u1"})
+
+    compact = (await client.get("/playlists/user/history", params={"user_id": "u1"})).json()
+    assert [item["history"] for item in compact] == [[], []]
+    expanded = (
+        await client.get("/playlists/user/history", params={"user_id": "u1", "expand_history": True})
+    ).json()
+    assert len(expanded[0]["history"]) == 1
+
+
+def test_delta_lists_items_added_and_removed_since_version():
+    history = StoredHistory().add(_response(0), limit=2)
+    first_id = history.items[0]["id"]
+    for index in (1, 2):
+        history = history.add(_response(index), limit=2)
+
+    delta = build_delta(history.expand(), history.version, history.changes, since=1)
+    assert not delta["reset"]
+    assert [item["prompt"] for item in delta["added"]] == ["prompt 2", "prompt 1"]
+    assert delta["removed"] == [first_id]
+    assert build_delta(history.expand(), history.version, history.changes, since=3)["added"] == []
+
+    cleared = history.clear()
+    assert build_delta(cleared.expand(), cleared.version, cleared.changes, since=3)["reset"]
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+@pytest.mark.asyncio
+async def test_user_history_endpoint_pages_and_honours_etag(backend, settings, tmp_path):
+    settings.user_store_backend = backend
+    settings.user_store_sqlite_path = str(tmp_path / "users.db")
+    app = create_app(settings, bootstrap_clients=False)
+    store = app.state.user_store
+    await store.upsert_profile(UserProfile(user_id="u1", email="", name="Listener", picture=None))
+    for index in range(3):
+        await store.add_history("u1", _response(index))
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        first = await client.get("/playlists/user/history", params={"user_id": "u1", "limit": 2})
+        assert [item["prompt"] for item in first.json()] == ["prompt 2", "prompt 1"]
+        assert first.headers["etag"].startswith('"3-')
+        cursor = first.headers["x-next-cursor"]
+
+        rest = await client.get("/playlists/user/history", params={"user_id": "u1", "cursor": cursor})
+        assert [item["prompt"] for item in rest.json()] == ["prompt 0"]
+        assert "x-next-cursor" not in rest.headers
+
+        etag = (await client.get("/playlists/user/history", params={"user_id": "u1"})).headers["etag"]
+        unchanged = await client.get(
+            "/playlists/user/history", params={"user_id": "u1"}, headers={"If-None-Match": f"W/{etag}"}
+        )
+        assert unchanged.status_code == 304
+        # Same version, different view: the client's copy is not the one it is asking for.
+        for params in ({"limit": 2}, {"cursor": cursor}, {"since": 2}, {"expand_history": True}):
+            other = await client.get(
+                "/playlists/user/history", params={"user_id": "u1", **params}, headers={"If-None-Match": etag}
+            )
+            assert other.status_code == 200, params
+
+        await store.remove_history_item("u1", 0)
+        delta = (await client.get("/playlists/user/history", params={"user_id": "u1", "since": 3})).json()
+        assert delta == {"version": 4, "reset": False, "added": [], "removed": [first.json()[0]["id"]]}
+
+        bad = await client.get("/playlists/user/history", params={"user_id": "u1", "cursor": "missing"})
+        assert bad.status_code == 400
+    await store.stop()
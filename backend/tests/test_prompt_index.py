@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import pytest
+
+from backend.benchmarks.prompt_similarity import DISTINCT, PARAPHRASES
+from backend.services.gemini_client import canonical_prompt
+from backend.services.prompt_index import paraphrase_key
+from backend.utils.config import Settings
+
+
+def _key(prompt: str):
+    return paraphrase_key(canonical_prompt(prompt))
+
+
+def test_paraphrase_reuse_is_opt_in():
+    assert Settings().gemini_paraphrase_cache_max_entries == 0
+
+
+def test_paraphrase_key_joins_exactly_the_reworded_pairs():
+    reused = [(a, b) for a, b in PARAPHRASES if _key(a) == _key(b)]
+    assert reused == [
+        ("chill focus music", "chill music for focus"),
+        ("chill focus music", "chill focus music please"),
+        ("sad breakup songs", "sad songs for a breakup"),
+        ("study music lofi", "lofi study music"),
+        ("happy summer vibes", "summer happy vibes"),
+        ("dinner party jazz", "jazz for a dinner party"),
+        ("relaxing piano to sleep", "relaxing piano for sleep"),
+    ]
+    assert [(a, b) for a, b in DISTINCT if _key(a) == _key(b)] == []
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("not sad songs", "sad songs"),
+        ("unhappy music", "happy music"),
+        ("taylor swift covers", "taylor swift"),
+        ("kanye west old", "kanye west"),
+        ("80s rock", "90s rock"),
+    ],
+)
+def test_a_negation_qualifier_or_number_changes_the_key(a, b):
+    assert _key(a) != _key(b)
+
+
+def test_filler_only_prompts_have_no_key():
+    assert _key("for the") is None
+    assert _key("80s rock") == ("80", "rock")
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import pytest
+
+from backend.utils.rate_limiter import RateLimit, RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("backend.utils.rate_limiter.time.time", lambda: now[0])
+    return now
+
+
+@pytest.mark.asyncio
+async def test_gcra_allows_a_burst_then_one_request_per_interval(clock):
+    limiter = RateLimiter(4, 60, routes={"auth": RateLimit(1, 60)})
+    assert [await limiter.acquire("1.2.3.4") for _ in range(4)] == [0.0] * 4
+    assert await limiter.acquire("1.2.3.4") == pytest.approx(15)
+    assert await limiter.acquire("5.6.7.8") == 0.0
+    assert await limiter.acquire("1.2.3.4", "auth") == 0.0
+    assert await limiter.acquire("1.2.3.4", "auth") == pytest.approx(60)
+
+    clock[0] += 15
+    assert await limiter.acquire("1.2.3.4") == 0.0
+    assert await limiter.acquire("1.2.3.4") > 0
+
+    assert len(limiter) == 3
+    clock[0] += 60
+    assert await limiter.sweep() == 3 and len(limiter) == 0
+    assert limiter.stats()["evictions"] == 3
+
+
+@pytest.mark.parametrize("requests", [7, 11, 13])
+@pytest.mark.asyncio
+async def test_burst_is_exact_when_the_window_does_not_divide_evenly(clock, requests):
+    limiter = RateLimiter(requests, 60)
+    assert [await limiter.acquire("1.2.3.4") for _ in range(requests)] == [0.0] * requests
+    assert await limiter.acquire("1.2.3.4") == pytest.approx(60 / requests)
+    # Steady state: exactly one request per interval, however long it runs.
+    for _ in range(100):
+        clock[0] += 60 / requests
+        assert await limiter.acquire("1.2.3.4") == 0.0
+        assert await limiter.acquire("1.2.3.4") > 0
+
+
+@pytest.mark.asyncio
+async def test_zero_requests_disables_the_limit(clock):
+    limiter = RateLimiter(2, 60, routes={"auth": RateLimit(0, 60)})
+    assert [await limiter.acquire("1.2.3.4", "auth") for _ in range(50)] == [0.0] * 50
+    assert len(limiter) == 0
+    with pytest.raises(ValueError):
+        RateLimit(-1, 60)
+
+
+@pytest.mark.asyncio
+async def test_limited_requests_get_429_with_retry_after(client, test_app):
+    test_app.state.rate_limiter.routes["history"] = RateLimit(2, 60)
+    statuses = [(await client.get("/playlists/history/device-1")).status_code for _ in range(2)]
+    response = await client.get("/playlists/history/device-1")
+    assert statuses == [200, 200]
+    assert response.status_code == 429 and response.headers["Retry-After"] == "30"
+    # Other route classes keep their own budget.
+    assert (await client.post("/playlists/generate", json={"prompt": "rainy jazz"})).status_code == 200
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from backend.models.response_models import MoodProfile
+from backend.services.gemini_client import CachedMood, GeminiClient, canonical_prompt
+from backend.utils.scheduler import Priority, UpstreamBusy, UpstreamScheduler, current_priority
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_served_by_priority_then_arrival():
+    scheduler = UpstreamScheduler("gemini", max_concurrency=1)
+    await scheduler.acquire()
+    served: list[str] = []
+
+    async def call(name: str, priority: Priority) -> None:
+        async with scheduler.slot(priority):
+            served.append(name)
+
+    calls = [
+        asyncio.create_task(call(name, priority))
+        for name, priority in [
+            ("analyze", Priority.BACKGROUND),
+            ("generate", Priority.STANDARD),
+            ("stream-1", Priority.INTERACTIVE),
+            ("stream-2", Priority.INTERACTIVE),
+        ]
+    ]
+    await asyncio.sleep(0)
+    assert scheduler.stats()["queued"] == 4
+    scheduler.release()
+    await asyncio.gather(*calls)
+    assert served == ["stream-1", "stream-2", "generate", "analyze"]
+    assert scheduler.stats()["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queue_and_long_waits_are_turned_away():
+    scheduler = UpstreamScheduler("youtube", max_concurrency=1, max_queue=1, max_queue_seconds=0.05)
+    await scheduler.acquire()
+    waiter = asyncio.create_task(scheduler.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(UpstreamBusy) as busy:
+        await scheduler.acquire()
+    assert busy.value.status_code == 503
+
+    with pytest.raises(UpstreamBusy) as busy:
+        await waiter
+    assert busy.value.status_code == 503 and scheduler.stats()["timeouts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_spent_budget_is_refused_with_retry_after():
+    scheduler = UpstreamScheduler("gemini", max_concurrency=8, requests_per_minute=2, max_queue_seconds=1)
+    await scheduler.acquire()
+    await scheduler.acquire()
+    with pytest.raises(UpstreamBusy) as busy:
+        await scheduler.acquire()
+    assert busy.value.status_code == 429
+    assert busy.value.retry_after == pytest.approx(30, abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_routes_set_priorities_and_saturation_maps_to_retry_after(client, test_app, monkeypatch):
+    gemini = test_app.state.gemini_client
+    seen: list[Priority] = []
+
+    async def analyze_mood(prompt: str) -> MoodProfile:
+        seen.append(current_priority())
+        raise UpstreamBusy("gemini", "request budget exhausted", retry_after=12.5, status_code=429)
+
+    monkeypatch.setattr(gemini, "analyze_mood", analyze_mood, raising=False)
+    response = await client.post("/moods/analyze", json={"prompt": "rainy jazz"})
+    assert (response.status_code, response.headers["Retry-After"]) == (429, "13")
+    assert seen == [Priority.BACKGROUND]
+
+    async def analyze_mood_stream(prompt: str):
+        seen.append(current_priority())
+        yield {"type": "narrative_chunk", "text": "Rain on the window."}
+
+    monkeypatch.setattr(gemini, "analyze_mood_stream", analyze_mood_stream, raising=False)
+    await client.post("/playlists/generate/stream", json={"prompt": "rainy jazz"})
+    assert seen[-1] == Priority.INTERACTIVE
+
+    test_app.state.upstreams["gemini"].max_queue = 0
+    response = await client.post("/playlists/generate/stream", json={"prompt": "rainy jazz"})
+    assert response.status_code == 503 and "Retry-After" in response.headers
+
+
+@pytest.mark.asyncio
+async def test_stream_refused_mid_request_reports_the_capacity_error(client, test_app, settings):
+    # The route's up-front check passes, but the slot is gone by the time the stream starts.
+    scheduler = UpstreamScheduler("gemini", max_concurrency=1, max_queue_seconds=0.05)
+    await scheduler.acquire()
+    test_app.state.gemini_client = GeminiClient(settings, scheduler=scheduler)
+
+    response = await client.post("/playlists/generate/stream", json={"prompt": "rainy jazz"})
+    assert response.status_code == 200
+    assert "event: error\ndata: gemini: no capacity within 0.05s" in response.text
+    assert "Failed to generate mood profile" not in response.text
+    assert scheduler.stats()["active"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_prompt_streams_while_gemini_is_saturated(client, test_app, settings):
+    scheduler = test_app.state.upstreams["gemini"]
+    gemini = GeminiClient(settings, scheduler=scheduler)
+    mood = MoodProfile(primary_mood="calm", keywords=["rain"], narrative="Rain on the window.")
+    gemini._remember_mood(canonical_prompt("rainy jazz"), CachedMood(mood, ("Rain on the window.",)))
+    test_app.state.gemini_client = gemini
+    scheduler.max_queue = 0
+
+    cached = await client.post("/playlists/generate/stream", json={"prompt": "Rainy jazz!"})
+    assert cached.status_code == 200 and "event: result" in cached.text
+    assert gemini.stats()["mood_cache"]["hits"] == 1
+
+    missed = await client.post("/playlists/generate/stream", json={"prompt": "sunny pop"})
+    assert missed.status_code == 503 and "Retry-After" in missed.headers
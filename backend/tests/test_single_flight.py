@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from backend.utils.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter_and_clear_the_key():
+    flights: SingleFlight[int] = SingleFlight()
+    calls = 0
+
+    async def fail() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        raise ValueError("upstream down")
+
+    results = await asyncio.gather(*(flights.do("k", fail) for _ in range(3)), return_exceptions=True)
+    assert calls == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_shared_work():
+    flights: SingleFlight[str] = SingleFlight()
+    release = asyncio.Event()
+
+    async def work() -> str:
+        await release.wait()
+        return "done"
+
+    first = asyncio.create_task(flights.do("k", work))
+    second = asyncio.create_task(flights.do("k", work))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await second == "done"
+    assert first.cancelled()
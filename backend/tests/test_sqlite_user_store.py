@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import pytest
+
+from backend.services.sqlite_user_store import SQLiteUserStore
+from backend.services.user_store import UserProfile, UserStore
+
+
+def _profile(user_id: str = "u1") -> UserProfile:
+    return UserProfile(user_id=user_id, email=f"{user_id}@example.com", name="Listener", picture=None)
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store_round_trip(tmp_path):
+    store = SQLiteUserStore(str(tmp_path / "users.db"))
+    stored = await store.upsert_profile(_profile())
+    assert stored.email == "u1@example.com"
+    await store.set_youtube_credentials("u1", {"refresh_token": "r"})
+    for prompt in ("a", "b", "c"):
+        await store.add_history("u1", {"prompt": prompt})
+    await store.remove_history_item("u1", 1)
+
+    assert [item["prompt"] for item in await store.get_history("u1")] == ["c", "a"]
+    assert await store.get_youtube_credentials("u1") == {"refresh_token": "r"}
+    with pytest.raises(KeyError):
+        await store.set_youtube_credentials("missing", {})
+
+    await store.clear_history("u1")
+    assert await store.get_history("u1") == []
+    await store.stop()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store_migrates_json_once(tmp_path):
+    json_path = str(tmp_path / "users.json")
+    legacy = UserStore(json_path)
+    await legacy.upsert_profile(_profile())
+    await legacy.add_history("u1", {"prompt": "old"})
+    await legacy.add_history("u1", {"prompt": "new"})
+
+    db_path = str(tmp_path / "users.db")
+    store = SQLiteUserStore(db_path, migrate_from=json_path)
+    assert [item["prompt"] for item in await store.get_history("u1")] == ["new", "old"]
+    await store.stop()
+
+    again = SQLiteUserStore(db_path, migrate_from=json_path)
+    assert len(await again.get_history("u1")) == 2
+    await again.stop()
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+
+from backend.models.response_models import MoodProfile
+from backend.utils.cache import SharedDeviceCache
+from backend.utils.rate_limiter import RateLimiter
+from backend.utils.state_backend import RedisStateBackend, SQLiteStateBackend, StateConflict
+
+
+class RespStandIn:
+    """In-process server for the slice of the Redis protocol the state backend uses."""
+
+    def __init__(self) -> None:
+        self.values: dict[bytes, tuple[object, float | None]] = {}
+        self.versions: dict[bytes, int] = {}
+        self.execs = 0
+        # Answer every EXEC as if another client had written a watched key.
+        self.always_conflict = False
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return "redis://127.0.0.1:%d/0" % self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        watched: dict[bytes, int] = {}
+        queued: list[list[bytes]] | None = None
+        try:
+            while True:
+                count = int((await reader.readuntil(b"\r\n"))[1:-2])
+                command = []
+                for _ in range(count):
+                    length = int((await reader.readuntil(b"\r\n"))[1:-2])
+                    command.append((await reader.readexactly(length + 2))[:-2])
+                name = command[0].upper()
+                if name == b"MULTI":
+                    queued, reply = [], "OK"
+                elif name == b"EXEC":
+                    self.execs += 1
+                    dirty = self.always_conflict or any(self.versions.get(key, 0) != version for key, version in watched.items())
+                    reply = None if dirty else [self._apply(queued_command) for queued_command in queued]
+                    queued, watched = None, {}
+                elif queued is not None:
+                    queued.append(command)
+                    reply = "QUEUED"
+                elif name == b"WATCH":
+                    watched.update({key: self.versions.get(key, 0) for key in command[1:]})
+                    reply = "OK"
+                elif name == b"UNWATCH":
+                    watched, reply = {}, "OK"
+                else:
+                    reply = self._apply(command)
+                writer.write(self._encode(reply))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    def _get(self, key: bytes) -> object:
+        value, expires_at = self.values.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.time():
+            del self.values[key]
+            return None
+        return value
+
+    def _set(self, key: bytes, value: object, expires_at: float | None) -> None:
+        self.values[key] = (value, expires_at)
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _apply(self, command: list[bytes]) -> object:
+        name, args = command[0].upper(), command[1:]
+        if name in (b"PING", b"SELECT"):
+            return "PONG" if name == b"PING" else "OK"
+        if name == b"GET":
+            return self._get(args[0])
+        if name == b"SET":
+            self._set(args[0], args[1], time.time() + int(args[3]) / 1000 if len(args) > 3 else None)
+            return "OK"
+        items = self._get(args[0]) or []
+        if name == b"LPUSH":
+            self._set(args[0], [args[1], *items], self.values.get(args[0], (None, None))[1])
+            return len(items) + 1
+        if name == b"LTRIM":
+            self._set(args[0], items[int(args[1]) : int(args[2]) + 1], self.values[args[0]][1])
+            return "OK"
+        if name == b"PEXPIRE":
+            self._set(args[0], items, time.time() + int(args[1]) / 1000)
+            return 1
+        if name == b"LRANGE":
+            return items
+        return RuntimeError(f"unknown command {name!r}")
+
+    def _encode(self, reply: object) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, RuntimeError):
+            return b"-ERR %s\r\n" % str(reply).encode()
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(self._encode(item) for item in reply)
+
+
+@pytest.fixture
+def settings(settings, tmp_path):
+    settings.state_backend = "sqlite"
+    settings.state_sqlite_path = str(tmp_path / "state.db")
+    return settings
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+async def backends(request, tmp_path):
+    """Two backend instances on the same shared state, standing in for two uvicorn workers."""
+    server = None
+    if request.param == "sqlite":
+        workers = [SQLiteStateBackend(str(tmp_path / "state.db")) for _ in range(2)]
+    else:
+        server = RespStandIn()
+        url = await server.start()
+        workers = [RedisStateBackend(url) for _ in range(2)]
+    yield workers
+    for worker in workers:
+        await worker.stop()
+    if server is not None:
+        await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_is_shared_across_workers(backends):
+    limiters = [RateLimiter(10, 60, backend=backend) for backend in backends]
+    results = await asyncio.gather(*(limiters[i % 2].acquire("1.2.3.4") for i in range(16)))
+    assert sum(1 for excess in results if excess == 0) == 10
+    assert await limiters[0].acquire("5.6.7.8") == 0.0
+
+
+@pytest.mark.asyncio
+async def test_device_history_is_shared_across_workers(backends):
+    caches = [SharedDeviceCache(backend, ttl_seconds=60, max_entries=3) for backend in backends]
+    mood = MoodProfile(primary_mood="calm", keywords=["rain"], narrative="Slow and soft.")
+    for i in range(4):
+        await caches[i % 2].remember("device-1", "playlist", {"mood": mood}, payload=b'{"n":%d}' % i)
+    await caches[0].remember("device-1", "mood", mood)
+
+    history = await caches[1].history("device-1", key="playlist")
+    assert [entry.payload for entry in history] == [b'{"n":3}', b'{"n":2}']
+    assert MoodProfile.model_validate(history[0].value["mood"]) == mood
+    assert await caches[1].get_latest("device-1") == mood.model_dump(mode="json")
+    assert await caches[0].history("device-2") == []
+
+
+@pytest.mark.asyncio
+async def test_contended_update_gives_up_and_the_limiter_fails_open():
+    server = RespStandIn()
+    backend = RedisStateBackend(await server.start(), max_attempts=3, retry_delay=0)
+    server.always_conflict = True
+    with pytest.raises(StateConflict):
+        await backend.update("rate:stream:1.2.3.4", lambda value: (1.0, time.time() + 60, "done"))
+    assert server.execs == 3
+
+    limiter = RateLimiter(1, 60, backend=backend)
+    assert [await limiter.acquire("1.2.3.4") for _ in range(3)] == [0.0] * 3
+    assert server.execs == 12
+    # The connection went back to the pool in a usable state.
+    server.always_conflict = False
+    assert await limiter.acquire("1.2.3.4") == 0.0
+    assert await limiter.acquire("1.2.3.4") > 0
+    await backend.stop()
+    await asyncio.sleep(0.01)  # let the stand-in see the disconnect
+    await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_app_keeps_device_history_in_the_configured_backend(client, test_app):
+    assert isinstance(test_app.state.device_cache, SharedDeviceCache)
+    payload = {"prompt": "late night drive", "device_id": "device-1"}
+    await client.post("/playlists/generate", json=payload)
+    second = (await client.post("/playlists/generate", json=payload)).json()
+    assert [mood["primary_mood"] for mood in second["history"]] == ["uplifted"]
+
+    history = (await client.get("/playlists/history/device-1")).json()
+    assert [item["prompt"] for item in history] == ["late night drive"] * 2
+    await test_app.state.state_backend.stop()
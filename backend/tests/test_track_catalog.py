@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import pytest
+
+from backend.services.sqlite_user_store import SQLiteUserStore
+from backend.services.track_catalog import TrackCatalog
+from backend.services.user_store import UserProfile, UserStore
+
+
+def _track(index: int, **overrides) -> dict:
+    track = {
+        "title": f"Song {index}",
+        "artist": "Muse",
+        "video_id": f"vid{index}",
+        "duration": "3:30",
+        "thumbnail_url": None,
+        "energy": None,
+    }
+    track.update(overrides)
+    return track
+
+
+def _playlist(prompt: str, tracks: list[dict]) -> dict:
+    return {"prompt": prompt, "mood": {"primary_mood": "calm", "narrative": "."}, "tracks": tracks, "history": []}
+
+
+def test_catalog_interns_and_hydrates(tmp_path):
+    path = str(tmp_path / "tracks.jsonl")
+    catalog = TrackCatalog(path)
+    first = catalog.intern_item(_playlist("a", [_track(1), _track(2)]))
+    second = catalog.intern_item(_playlist("b", [_track(2), _track(3, title="Remix"), {"title": "Live", "artist": "X"}]))
+    catalog.close()
+
+    assert first["track_refs"] == ["vid1", "vid2"]
+    assert second["track_refs"][:2] == ["vid2", "vid3"]
+    assert isinstance(second["track_refs"][2], dict)
+    assert len(catalog) == 3
+
+    conflicting = catalog.intern_item(_playlist("c", [_track(1, title="Other")]))
+    assert isinstance(conflicting["track_refs"][0], dict)
+
+    reloaded = TrackCatalog(path)
+    assert reloaded.hydrate_item(second)["tracks"][1]["title"] == "Remix"
+
+
+@pytest.mark.asyncio
+async def test_user_store_history_references_catalog(tmp_path):
+    catalog = TrackCatalog(str(tmp_path / "tracks.jsonl"))
+    store = UserStore(str(tmp_path / "users.json"), catalog=catalog)
+    await store.upsert_profile(UserProfile(user_id="u1", email="", name="Listener", picture=None))
+    await store.add_history("u1", _playlist("a", [_track(1), _track(2)]))
+
+    assert store._history["u1"].items[0]["track_refs"] == ["vid1", "vid2"]
+    history = await store.get_history("u1")
+    assert [track["video_id"] for track in history[0]["tracks"]] == ["vid1", "vid2"]
+
+
+@pytest.mark.asyncio
+async def test_failed_catalog_write_blocks_the_history_write(tmp_path, monkeypatch):
+    path = str(tmp_path / "tracks.jsonl")
+    catalog = TrackCatalog(path)
+    store = UserStore(str(tmp_path / "users.json"), catalog=catalog)
+    await store.upsert_profile(UserProfile(user_id="u1", email="", name="Listener", picture=None))
+    await store.add_history("u1", _playlist("a", [_track(1)]))
+
+    def fail(fd: int) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr("backend.services.track_catalog.os.fsync", fail)
+    with pytest.raises(OSError):
+        await store.add_history("u1", _playlist("b", [_track(2)]))
+    assert catalog.get("vid2") is None
+    assert [item["prompt"] for item in await store.get_history("u1")] == ["a"]
+
+    monkeypatch.undo()
+    await store.add_history("u1", _playlist("b", [_track(2)]))
+    catalog.close()
+    assert TrackCatalog(path).get("vid2") is not None
+    assert len(TrackCatalog(path)) == 2
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store_interns_tracks(tmp_path):
+    store = SQLiteUserStore(str(tmp_path / "users.db"))
+    await store.upsert_profile(UserProfile(user_id="u1", email="", name="Listener", picture=None))
+    await store.add_history("u1", _playlist("a", [_track(1), _track(2)]))
+    await store.add_history("u1", _playlist("b", [_track(2), _track(1, title="Other")]))
+
+    history = await store.get_history("u1")
+    assert [track["title"] for track in history[0]["tracks"]] == ["Song 2", "Other"]
+    assert [track["title"] for track in history[1]["tracks"]] == ["Song 1", "Song 2"]
+
+    def count(conn):
+        return conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    assert await store._run(count) == 2
+    await store.stop()
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import json
+import os
+
+import pytest
+
+from backend.services.user_store import UserProfile, UserStore, history_dir_for, history_shard_path
+
+
+def _profile(user_id: str = "u1") -> UserProfile:
+    return UserProfile(user_id=user_id, email=f"{user_id}@example.com", name="Listener", picture=None)
+
+
+@pytest.mark.asyncio
+async def test_journal_replays_after_restart(tmp_path):
+    path = str(tmp_path / "users.json")
+    store = UserStore(path)
+    await store.upsert_profile(_profile())
+    await store.set_youtube_credentials("u1", {"refresh_token": "r"})
+    await store.add_history("u1", {"prompt": "first"})
+    await store.add_history("u1", {"prompt": "second"})
+    await store.remove_history_item("u1", 1)
+
+    assert not os.path.exists(path)
+    reloaded = UserStore(path)
+    profile = await reloaded.get_profile("u1")
+    assert profile.youtube_credentials == {"refresh_token": "r"}
+    assert [item["prompt"] for item in await reloaded.get_history("u1")] == ["second"]
+
+
+@pytest.mark.asyncio
+async def test_compaction_folds_journal_into_snapshot(tmp_path):
+    path = str(tmp_path / "users.json")
+    store = UserStore(path)
+    await store.upsert_profile(_profile())
+    await store.add_history("u1", {"prompt": "first"})
+    await store.compact()
+    await store.add_history("u1", {"prompt": "second"})
+
+    with open(path) as f:
+        snapshot = json.load(f)
+    assert snapshot["seq"] == 2
+    assert "history" not in snapshot["users"]["u1"]
+
+    reloaded = UserStore(path)
+    assert [item["prompt"] for item in await reloaded.get_history("u1")] == ["second", "first"]
+
+
+@pytest.mark.asyncio
+async def test_torn_journal_tail_is_discarded(tmp_path):
+    path = str(tmp_path / "users.json")
+    store = UserStore(path)
+    await store.upsert_profile(_profile())
+    await store.stop()
+    with open(f"{path}.journal", "a") as f:
+        f.write('{"op": "history_add", "user_id": "u1"')
+
+    reloaded = UserStore(path)
+    await reloaded.add_history("u1", {"prompt": "after crash"})
+    history = await UserStore(path).get_history("u1")
+    assert [item["prompt"] for item in history] == ["after crash"]
+
+
+@pytest.mark.asyncio
+async def test_legacy_inline_history_moves_to_shards(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text(
+        json.dumps(
+            {
+                "u1": {
+                    "user_id": "u1",
+                    "email": "u1@example.com",
+                    "name": "Listener",
+                    "picture": None,
+                    "joined_date": "2025-11-24T03:08:51",
+                    "created_on": "2025-11-24T03:08:51",
+                    "updated_on": "2025-11-24T03:08:51",
+                    "youtube_credentials": None,
+                    "history": [{"prompt": "legacy"}],
+                }
+            }
+        )
+    )
+    store = UserStore(str(path))
+    assert store._store["u1"].history == []
+    history = await store.get_history("u1")
+    assert [{key: item[key] for key in ("prompt", "history")} for item in history] == [
+        {"prompt": "legacy", "history": []}
+    ]
+    assert "history" in json.loads(path.read_text())["u1"]
+
+    await store.start()
+    await store.stop()
+    assert "history" not in json.loads(path.read_text())["users"]["u1"]
+    assert await UserStore(str(path)).get_history("u1") == history
+
+
+@pytest.mark.asyncio
+async def test_write_behind_coalesces_burst_into_one_flush(tmp_path, monkeypatch):
+    path = str(tmp_path / "users.json")
+    store = UserStore(path, flush_interval=60, flush_max_pending=1000)
+    writes = []
+    original = store._write_journal
+    monkeypatch.setattr(store, "_write_journal", lambda records: (writes.append(len(records)), original(records)))
+
+    await store.upsert_profile(_profile())
+    for i in range(20):
+        await store.add_history("u1", {"prompt": f"p{i}"})
+    assert writes == []
+    assert len(await store.get_history("u1")) == 20
+
+    await store.stop()
+    assert writes == [21]
+    history = await UserStore(path).get_history("u1")
+    assert history[0]["prompt"] == "p19"
+
+
+@pytest.mark.asyncio
+async def test_history_is_loaded_lazily_and_evicted(tmp_path):
+    path = str(tmp_path / "users.json")
+    store = UserStore(path, history_cache_users=2)
+    for user_id in ("a", "b", "c"):
+        await store.upsert_profile(_profile(user_id))
+        await store.add_history(user_id, {"prompt": user_id})
+    assert list(store._history) == ["b", "c"]
+    await store.stop()
+
+    reloaded = UserStore(path, history_cache_users=2)
+    assert not reloaded._history
+    assert [item["prompt"] for item in await reloaded.get_history("a")] == ["a"]
+    assert list(reloaded._history) == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_unreadable_history_shard_is_never_overwritten(tmp_path):
+    path = str(tmp_path / "users.json")
+    store = UserStore(path)
+    await store.upsert_profile(_profile())
+    await store.add_history("u1", {"prompt": "keep me"})
+    await store.stop()
+    shard = history_shard_path(history_dir_for(path), "u1")
+    with open(shard, "rb") as f:
+        original = f.read()
+    with open(shard, "wb") as f:
+        f.write(original[: len(original) // 2])
+
+    reloaded = UserStore(path)
+    with pytest.raises(Exception):
+        await reloaded.add_history("u1", {"prompt": "new"})
+    with pytest.raises(Exception):
+        await reloaded.clear_history("u1")
+    await reloaded.stop()
+    with open(shard, "rb") as f:
+        assert f.read() == original[: len(original) // 2]
+
+    # Once the shard reads again, nothing was lost.
+    with open(shard, "wb") as f:
+        f.write(original)
+    assert [item["prompt"] for item in await UserStore(path).get_history("u1")] == ["keep me"]
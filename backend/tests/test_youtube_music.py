@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import json
+
+import httpx
+import pytest
+
+from backend.models.response_models import Track
+from backend.services.youtube_music import YouTubeMusicService, YTMusicClientPool
+from backend.utils.scheduler import UpstreamBusy, UpstreamScheduler
+
+
+@pytest.fixture
+def youtube(settings, monkeypatch):
+    service = YouTubeMusicService(settings)
+    service.calls = []
+
+    async def search(keywords, limit, user_credentials):
+        service.calls.append(list(keywords))
+        return [Track(title=f"Song {len(service.calls)}", artist="Muse", video_id="v")]
+
+    monkeypatch.setattr(service, "_search_tracks", search)
+    return service
+
+
+@pytest.mark.asyncio
+async def test_search_is_cached_by_normalized_keywords(youtube):
+    first = await youtube.search_tracks(["Lofi", "study"], limit=10)
+    second = await youtube.search_tracks(["study ", "lofi"], limit=10)
+    assert first == second and youtube.calls == [["Lofi", "study"]]
+
+    await youtube.search_tracks(["study", "lofi"], limit=20)
+    await youtube.search_tracks(["study", "lofi"], limit=10, user_credentials={"token": "t"})
+    assert len(youtube.calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_stale_search_is_served_then_refreshed(youtube, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("backend.utils.cache.time.time", lambda: now)
+    await youtube.search_tracks(["gym"])
+
+    now += youtube.settings.youtube_search_cache_ttl_seconds + 1
+    stale = await youtube.search_tracks(["gym"])
+    assert stale[0].title == "Song 1"
+    await asyncio.gather(*youtube._search_flights._calls.values())
+    assert (await youtube.search_tracks(["gym"]))[0].title == "Song 2"
+    assert youtube.stats()["search_cache"]["stale_hits"] == 1
+
+    now += youtube.settings.youtube_search_cache_ttl_seconds + youtube.settings.youtube_search_cache_stale_seconds + 1
+    assert (await youtube.search_tracks(["gym"]))[0].title == "Song 3"
+    await youtube.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_searches_share_one_call(youtube, monkeypatch):
+    release = asyncio.Event()
+
+    async def search(keywords, limit, user_credentials):
+        youtube.calls.append(list(keywords))
+        await release.wait()
+        return [Track(title="Shared", artist="Muse", video_id="v")]
+
+    monkeypatch.setattr(youtube, "_search_tracks", search)
+    waiters = [asyncio.create_task(youtube.search_tracks(["trending"])) for _ in range(5)]
+    await asyncio.sleep(0)
+    waiters[0].cancel()
+    release.set()
+    results = await asyncio.gather(*waiters[1:])
+    assert youtube.calls == [["trending"]]
+    assert all(result[0].title == "Shared" for result in results)
+    assert youtube.stats()["search_flights"]["coalesced"] == 4
+
+
+@pytest.mark.asyncio
+async def test_fan_out_interleaves_dedupes_and_skips_slow_queries(settings, monkeypatch):
+    settings.youtube_fan_out_timeout_seconds = 0.05
+    service = YouTubeMusicService(settings)
+    results = {
+        "synthwave": [
+            Track(title="Nightcall", artist="Kavinsky", video_id="a"),
+            Track(title="Turbo", artist="X", video_id="b"),
+        ],
+        "retro": [
+            Track(title="Nightcall (Official Video)", artist="kavinsky", video_id="c"),
+            Track(title="Turbo", artist="X", video_id="b"),
+            Track(title="Sun", artist="Y", video_id="d"),
+        ],
+    }
+
+    async def search(keywords, limit, user_credentials):
+        query = keywords[0]
+        if query == "slow":
+            await asyncio.sleep(1)
+        if query == "broken":
+            raise RuntimeError("quota")
+        return results[query]
+
+    monkeypatch.setattr(service, "_search_tracks", search)
+    merged = await service.search_fan_out(["Synthwave", "retro", "slow", "broken", "synthwave"], limit=10)
+    assert [track.video_id for track in merged] == ["a", "b", "d"]
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_saturated_fan_out_is_refused_rather_than_empty(settings, client, test_app, monkeypatch):
+    settings.youtube_search_mode = "fanout"
+    scheduler = UpstreamScheduler("youtube", max_concurrency=1, max_queue=0)
+    await scheduler.acquire()
+    service = YouTubeMusicService(settings, scheduler=scheduler)
+    monkeypatch.setattr(service, "_client_for", lambda credentials: pytest.fail("search should not run"))
+
+    with pytest.raises(UpstreamBusy):
+        await service.search_fan_out(["synthwave", "retro"])
+
+    test_app.state.youtube_service = service
+    response = await client.post("/playlists/generate", json={"prompt": "rainy jazz"})
+    assert response.status_code == 503 and "Retry-After" in response.headers
+    await service.close()
+
+
+def test_client_pool_reuses_clients_and_evicts_idle_ones(monkeypatch):
+    built = []
+    pool = YTMusicClientPool(lambda credentials: built.append(credentials) or object(), max_size=2, idle_seconds=60)
+    now = 100.0
+    monkeypatch.setattr("backend.services.youtube_music.time.monotonic", lambda: now)
+
+    first = pool.get({"refresh_token": "a"})
+    assert pool.get({"refresh_token": "a"}) is first
+    pool.get({"refresh_token": "b"})
+    pool.get({"refresh_token": "c"})
+    assert len(pool) == 2 and len(built) == 3
+
+    pool.discard({"refresh_token": "c"})
+    now += 61
+    pool.get({"refresh_token": "b"})
+    stats = pool.stats()
+    assert (stats["clients"], stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 4, 2)
+
+
+@pytest.mark.asyncio
+async def test_changed_credentials_drop_pooled_client(settings, tmp_path):
+    from backend.services.user_store import UserProfile, UserStore
+
+    service = YouTubeMusicService(settings)
+    store = UserStore(str(tmp_path / "users.json"))
+    store.add_credentials_listener(service.forget_credentials)
+    await store.upsert_profile(UserProfile(user_id="u1", email="", name="Listener", picture=None))
+    await store.set_youtube_credentials("u1", {"refresh_token": "old"})
+    service._client_for({"refresh_token": "old"})
+    assert len(service._user_clients) == 1
+
+    await store.set_youtube_credentials("u1", {"refresh_token": "new"})
+    assert len(service._user_clients) == 0
+    await store.stop()
+
+
+class FakeYouTubeDataAPI:
+    """Just enough of the YouTube Data API v3 playlist endpoints, served through httpx.MockTransport."""
+
+    def __init__(self) -> None:
+        self.items: list[tuple[str, str]] = []  # (item id, video id)
+        self.errors: dict[str, list[int]] = {}  # video id -> statuses to answer before succeeding
+        self.lost_replies: dict[str, list[int]] = {}  # video id -> statuses to answer after inserting anyway
+        self.delays: dict[str, float] = {}
+        self.calls: list[str] = []
+        self.landed: list[str] = []  # video ids in the order their inserts were applied
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        assert request.headers["Authorization"] == "Bearer t"
+        route = f"{request.method} {request.url.path.rsplit('/', 1)[-1]}"
+        self.calls.append(route)
+        if route == "POST playlists":
+            return httpx.Response(200, json={"id": "PL1"})
+        if route == "GET playlistItems":
+            start = int(request.url.params.get("pageToken", "0"))
+            page = self.items[start : start + int(request.url.params["maxResults"])]
+            body = {"items": [{"id": item_id, "snippet": {"resourceId": {"videoId": video_id}}} for item_id, video_id in page]}
+            if start + len(page) < len(self.items):
+                body["nextPageToken"] = str(start + len(page))
+            return httpx.Response(200, json=body)
+        snippet = json.loads(request.content)["snippet"]
+        video_id = snippet["resourceId"]["videoId"]
+        if route == "POST playlistItems":
+            await asyncio.sleep(self.delays.get(video_id, 0))
+            if self.errors.get(video_id):
+                return httpx.Response(self.errors[video_id].pop(0), headers={"Retry-After": "0"})
+            position = snippet.get("position", len(self.items))
+            if position > len(self.items):
+                return httpx.Response(400, json={"error": "invalidPlaylistItemPosition"})
+            item_id = f"item-{video_id}-{len(self.calls)}"
+            self.items.insert(position, (item_id, video_id))
+            self.landed.append(video_id)
+            if self.lost_replies.get(video_id):
+                return httpx.Response(self.lost_replies[video_id].pop(0))
+            return httpx.Response(200, json={"id": item_id, "snippet": {"position": position}})
+        item_id = json.loads(request.content)["id"]
+        item = next(item for item in self.items if item[0] == item_id)
+        self.items.remove(item)
+        self.items.insert(snippet["position"], item)
+        return httpx.Response(200, json={})
+
+    @property
+    def video_ids(self) -> list[str]:
+        return [video_id for _, video_id in self.items]
+
+
+@pytest.mark.asyncio
+async def test_create_playlist_inserts_concurrently_in_order_and_resumes(settings):
+    settings.youtube_api_backoff_seconds = 0
+    api = FakeYouTubeDataAPI()
+    service = YouTubeMusicService(settings, http=httpx.AsyncClient(transport=httpx.MockTransport(api)))
+    video_ids = [f"v{i}" for i in range(60)]
+    # Later videos answer first, so inserts land out of order.
+    api.delays = {video_id: (60 - i) / 10000 for i, video_id in enumerate(video_ids)}
+    api.errors = {"v3": [429], "v7": [500, 500, 500, 500]}
+    headers = {"Authorization": "Bearer t"}
+
+    created = await service.create_playlist("Night drive", video_ids, auth_headers=headers)
+    assert created.playlist_id == "PL1" and created.failed == ["v7"]
+    assert created.added == api.video_ids == [video_id for video_id in video_ids if video_id != "v7"]
+    assert "PUT playlistItems" in api.calls  # out-of-order appends were moved into place
+
+    api.calls.clear()
+    resumed = await service.create_playlist("Night drive", video_ids, auth_headers=headers, playlist_id="PL1")
+    assert (resumed.added, resumed.failed) == (video_ids, [])
+    assert api.video_ids == video_ids
+    assert api.calls.count("POST playlistItems") == 1 and "POST playlists" not in api.calls
+
+
+@pytest.mark.asyncio
+async def test_failed_insert_is_checked_before_it_is_sent_again(settings):
+    settings.youtube_api_backoff_seconds = 0
+    api = FakeYouTubeDataAPI()
+    service = YouTubeMusicService(settings, http=httpx.AsyncClient(transport=httpx.MockTransport(api)))
+    video_ids = ["v0", "v1", "v2"]
+    # v1 lands but the reply is lost behind a 503; v2 is refused outright first.
+    api.lost_replies = {"v1": [503]}
+    api.errors = {"v2": [500]}
+
+    created = await service.create_playlist("Night drive", video_ids, auth_headers={"Authorization": "Bearer t"})
+    assert (created.added, created.failed) == (video_ids, [])
+    assert api.video_ids == video_ids
+    # v1 was found on the read-back and not sent again; only v2 was.
+    assert api.calls.count("POST playlistItems") == 4
+    assert api.calls.count("POST playlists") == 1
+
+
+@pytest.mark.asyncio
+async def test_appends_land_in_order_with_few_moves(settings):
+    settings.youtube_api_backoff_seconds = 0
+    settings.youtube_api_concurrency = 4
+    api = FakeYouTubeDataAPI()
+    service = YouTubeMusicService(settings, http=httpx.AsyncClient(transport=httpx.MockTransport(api)))
+    video_ids = [f"v{i}" for i in range(15)]
+    # Every third video answers slowly, so a few appends overtake it.
+    api.delays = {video_id: 0.003 if i % 3 == 1 else 0.001 for i, video_id in enumerate(video_ids)}
+
+    created = await service.create_playlist("Night drive", video_ids, auth_headers={"Authorization": "Bearer t"})
+    assert created.added == api.video_ids == video_ids
+    # No read-back: each insert reported where it landed.
+    assert api.calls.count("POST playlistItems") == 15 and "GET playlistItems" not in api.calls
+    # Only the videos off the longest in-order run of landings were moved.
+    ranks = [video_ids.index(video_id) for video_id in api.landed]
+    in_order: list[int] = []
+    for rank in ranks:
+        slot = bisect.bisect_left(in_order, rank)
+        in_order[slot : slot + 1] = [rank]
+    assert ranks != sorted(ranks)
+    assert api.calls.count("PUT playlistItems") == len(ranks) - len(in_order)
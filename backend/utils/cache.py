@@ -1,10 +1,23 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import time
-from collections import deque
+from collections import OrderedDict, deque
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Generic, Hashable, TypeVar
+
+from pydantic_core import to_jsonable_python
+
+from .logger import get_logger
+from .state_backend import StateBackend
+
+logger = get_logger()
+
+V = TypeVar("V")
+
+# Rough bookkeeping cost of one entry (dataclass, deque slot, value object) on top of its payload.
+ENTRY_OVERHEAD_BYTES = 512
 
 
 @dataclass
@@ -12,52 +25,348 @@ class CacheEntry:
     key: str
     value: Any
     expires_at: float
+    # Pre-rendered JSON for entries that are replayed verbatim (e.g. playlist history).
+    payload: bytes | None = None
+
+    @property
+    def size(self) -> int:
+        return ENTRY_OVERHEAD_BYTES + (len(self.payload) if self.payload is not None else 0)
+
+
+class _DeviceEntries:
+    """One device's entries: newest first overall, and indexed by key for O(results) lookups.
+
+    Each per-key ring is an ordered subsequence of ``ordered``, so the oldest entry overall
+    is always the oldest of its key and both can be popped from the right together.
+    """
+
+    __slots__ = ("ordered", "by_key")
+
+    def __init__(self) -> None:
+        self.ordered: deque[CacheEntry] = deque()
+        self.by_key: dict[str, deque[CacheEntry]] = {}
+
+    def push(self, entry: CacheEntry) -> None:
+        self.ordered.appendleft(entry)
+        ring = self.by_key.get(entry.key)
+        if ring is None:
+            ring = self.by_key[entry.key] = deque()
+        ring.appendleft(entry)
+
+    def pop_oldest(self) -> CacheEntry:
+        entry = self.ordered.pop()
+        ring = self.by_key[entry.key]
+        ring.pop()
+        if not ring:
+            del self.by_key[entry.key]
+        return entry
+
+    def ring(self, key: str | None) -> deque[CacheEntry] | None:
+        return self.ordered if key is None else self.by_key.get(key)
+
+    def __len__(self) -> int:
+        return len(self.ordered)
 
 
 class DeviceCache:
-    """Simple TTL cache scoped per device for playlists and histories."""
+    """TTL cache scoped per device for playlists and histories.
+
+    Besides the per-device ``max_entries`` cap, the cache holds at most ``max_total_entries``
+    entries and roughly ``max_total_bytes`` across all devices; when either budget is
+    exceeded the least recently used devices are dropped. Expired entries are removed when
+    a device is read and by a sweeper task that runs between ``start()`` and ``stop()``.
 
-    def __init__(self, ttl_seconds: int, max_entries: int) -> None:
+    Entries are indexed per ``(device, key)``, so lookups cost O(results). The cache is
+    only used from the event loop and no method awaits while touching its state, so it
+    needs no lock and concurrent devices never queue behind each other.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int,
+        max_entries: int,
+        *,
+        max_total_entries: int = 50_000,
+        max_total_bytes: int = 256 * 1024 * 1024,
+        sweep_interval: float = 60.0,
+    ) -> None:
         self.ttl = ttl_seconds
         self.max_entries = max_entries
-        self._lock = asyncio.Lock()
-        self._store: dict[str, deque[CacheEntry]] = {}
+        self.max_total_entries = max_total_entries
+        self.max_total_bytes = max_total_bytes
+        self.sweep_interval = sweep_interval
+        # Least recently used device first.
+        self._store: OrderedDict[str, _DeviceEntries] = OrderedDict()
+        self._entries = 0
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._sweeper: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._sweeper is None and self.sweep_interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep_periodically())
 
-    async def remember(self, device_id: str, key: str, value: Any) -> None:
-        async with self._lock:
-            queue = self._store.setdefault(device_id, deque(maxlen=self.max_entries))
-            queue.appendleft(CacheEntry(key=key, value=value, expires_at=time.time() + self.ttl))
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def remember(self, device_id: str, key: str, value: Any, payload: bytes | None = None) -> None:
+        device = self._store.get(device_id)
+        if device is None:
+            device = self._store[device_id] = _DeviceEntries()
+        else:
+            self._store.move_to_end(device_id)
+        entry = CacheEntry(key=key, value=value, expires_at=time.time() + self.ttl, payload=payload)
+        device.push(entry)
+        self._entries += 1
+        self._bytes += entry.size
+        while len(device) > self.max_entries:
+            self._discard(device.pop_oldest())
+        self._enforce_budget(device_id)
 
     async def get_latest(self, device_id: str, key: str | None = None) -> Any | None:
-        async with self._lock:
-            self._prune(device_id)
-            queue = self._store.get(device_id)
-            if not queue:
-                return None
-            if key is None:
-                return queue[0].value
-            for entry in queue:
-                if entry.key == key:
-                    return entry.value
-            return None
+        ring = self._ring(device_id, key)
+        self._count(bool(ring))
+        return ring[0].value if ring else None
 
     async def history(self, device_id: str, key: str | None = None) -> list[CacheEntry]:
-        async with self._lock:
+        ring = self._ring(device_id, key)
+        self._count(bool(ring))
+        return list(ring) if ring else []
+
+    async def sweep(self) -> int:
+        """Drop every expired entry and forget devices left empty. Returns the number dropped."""
+        before = self._expirations
+        for device_id in list(self._store):
             self._prune(device_id)
-            queue = self._store.get(device_id)
-            if not queue:
-                return []
-            if key is None:
-                return list(queue)
-            return [entry for entry in queue if entry.key == key]
+        return self._expirations - before
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "devices": len(self._store),
+            "entries": self._entries,
+            "approx_bytes": self._bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+        }
+
+    async def _sweep_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error("Device cache sweep failed: %s", e)
+
+    def _ring(self, device_id: str, key: str | None) -> deque[CacheEntry] | None:
+        self._prune(device_id)
+        device = self._store.get(device_id)
+        if device is None:
+            return None
+        self._store.move_to_end(device_id)
+        return device.ring(key)
+
+    def _count(self, hit: bool) -> None:
+        if hit:
+            self._hits += 1
+        else:
+            self._misses += 1
+
+    def _discard(self, entry: CacheEntry) -> None:
+        self._entries -= 1
+        self._bytes -= entry.size
+
+    def _enforce_budget(self, current: str) -> None:
+        while self._entries > self.max_total_entries or self._bytes > self.max_total_bytes:
+            device_id = next(iter(self._store))
+            device = self._store[device_id]
+            if device_id == current:
+                # Only the device being written is left; trim its own oldest entries.
+                if len(device) <= 1:
+                    return
+                self._discard(device.pop_oldest())
+                self._evictions += 1
+                continue
+            del self._store[device_id]
+            for entry in device.ordered:
+                self._discard(entry)
+            self._evictions += len(device)
 
     def _prune(self, device_id: str) -> None:
-        queue = self._store.get(device_id)
-        if not queue:
+        device = self._store.get(device_id)
+        if device is None:
             return
         now = time.time()
-        while queue and queue[-1].expires_at < now:
-            queue.pop()
+        while device.ordered and device.ordered[-1].expires_at < now:
+            self._discard(device.pop_oldest())
+            self._expirations += 1
+        if not device.ordered:
+            del self._store[device_id]
+
+
+class TTLCache(Generic[V]):
+    """Bounded LRU cache whose entries are fresh for ``ttl_seconds`` after they were stored.
+
+    With ``stale_seconds`` an entry stays available to ``get_stale`` for that much longer,
+    for callers that serve a stale value while refreshing it (stale-while-revalidate).
+    Like ``DeviceCache`` it is only used from the event loop, so it takes no lock.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, *, stale_seconds: float = 0.0) -> None:
+        self.ttl = ttl_seconds
+        self.stale = stale_seconds
+        self.max_entries = max_entries
+        # Least recently used first; values are (stored_at, value).
+        self._entries: OrderedDict[Hashable, tuple[float, V]] = OrderedDict()
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable) -> V | None:
+        """Return the value only while it is fresh."""
+        found = self.get_stale(key)
+        if found is None:
+            return None
+        value, fresh = found
+        return value if fresh else None
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether ``key`` is fresh, without counting a lookup or refreshing its recency."""
+        item = self._entries.get(key)
+        return item is not None and time.time() - item[0] <= self.ttl
+
+    def get_stale(self, key: Hashable) -> tuple[V, bool] | None:
+        """Return ``(value, fresh)`` while the entry is fresh or within its stale window."""
+        item = self._entries.get(key)
+        age = time.time() - item[0] if item is not None else None
+        if age is None or age > self.ttl + self.stale:
+            if item is not None:
+                del self._entries[key]
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        fresh = age <= self.ttl
+        if fresh:
+            self._hits += 1
+        else:
+            self._stale_hits += 1
+        return item[1], fresh
+
+    def set(self, key: Hashable, value: V) -> None:
+        self._entries[key] = (time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self._hits + self._stale_hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "hits": self._hits,
+            "stale_hits": self._stale_hits,
+            "misses": self._misses,
+            "hit_rate": (self._hits + self._stale_hits) / lookups if lookups else 0.0,
+            "evictions": self._evictions,
+        }
+
+
+class SharedDeviceCache:
+    """``DeviceCache`` interface over a ``StateBackend``, so every worker sees one history.
+
+    Each device is one capped list in the backend, newest entry first. An entry is a JSON
+    header line (key, JSON-able value, expiry) followed by the payload bytes unchanged, so
+    replayed payloads are never re-escaped. Values come back as plain JSON data (e.g. a
+    stored ``MoodProfile`` reads back as a dict). The backend expires entries; there are no
+    process-wide budgets beyond ``max_entries`` per device and the TTL.
+    """
+
+    def __init__(self, backend: StateBackend, ttl_seconds: int, max_entries: int) -> None:
+        self.backend = backend
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._hits = 0
+        self._misses = 0
+
+    async def start(self) -> None:
+        return None
+
+    async def stop(self) -> None:
+        return None
+
+    async def remember(self, device_id: str, key: str, value: Any, payload: bytes | None = None) -> None:
+        expires_at = time.time() + self.ttl
+        header = {
+            "key": key,
+            "value": to_jsonable_python(value),
+            "expires_at": expires_at,
+            "payload": payload is not None,
+        }
+        item = json.dumps(header, separators=(",", ":")).encode() + b"\n" + (payload or b"")
+        await self.backend.push(self._list_key(device_id), item, self.max_entries, self.ttl)
+
+    async def get_latest(self, device_id: str, key: str | None = None) -> Any | None:
+        entries = await self._entries(device_id, key, first_only=True)
+        return entries[0].value if entries else None
+
+    async def history(self, device_id: str, key: str | None = None) -> list[CacheEntry]:
+        return await self._entries(device_id, key)
+
+    async def sweep(self) -> int:
+        return await self.backend.sweep()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+        }
+
+    @staticmethod
+    def _list_key(device_id: str) -> str:
+        return f"device:{device_id}"
+
+    async def _entries(self, device_id: str, key: str | None, first_only: bool = False) -> list[CacheEntry]:
+        entries: list[CacheEntry] = []
+        now = time.time()
+        for item in await self.backend.items(self._list_key(device_id)):
+            header_line, _, payload = item.partition(b"\n")
+            header = json.loads(header_line)
+            if header["expires_at"] < now or (key is not None and header["key"] != key):
+                continue
+            entries.append(
+                CacheEntry(
+                    key=header["key"],
+                    value=header["value"],
+                    expires_at=header["expires_at"],
+                    payload=payload if header["payload"] else None,
+                )
+            )
+            if first_only:
+                break
+        if entries:
+            self._hits += 1
+        else:
+            self._misses += 1
+        return entries
 
 
-__all__ = ["DeviceCache", "CacheEntry"]
+__all__ = ["DeviceCache", "CacheEntry", "SharedDeviceCache", "TTLCache"]
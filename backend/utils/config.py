@@ -22,11 +22,39 @@ class Settings:
     gemini_api_key: str = os.getenv("GEMINI_API_KEY", "")
     gemini_model: str = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
     gemini_base_url: str = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+    gemini_cache_ttl_seconds: float = float(os.getenv("GEMINI_CACHE_TTL_SECONDS", "900"))
+    gemini_cache_max_entries: int = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "1024"))
+    # Reuse moods across prompts that differ only in word order and filler words; opt-in,
+    # 0 disables it. See backend/benchmarks/prompt_similarity.py.
+    gemini_paraphrase_cache_max_entries: int = int(os.getenv("GEMINI_PARAPHRASE_CACHE_MAX_ENTRIES", "0"))
+    gemini_max_concurrency: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+    # Match the project's Gemini quota tier; 0 disables the budget.
+    gemini_requests_per_minute: float = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
 
     youtube_oauth_json: str | None = os.getenv("YTMUSIC_OAUTH_JSON")
+    youtube_search_cache_ttl_seconds: float = float(os.getenv("YOUTUBE_SEARCH_CACHE_TTL_SECONDS", "600"))
+    youtube_search_cache_stale_seconds: float = float(os.getenv("YOUTUBE_SEARCH_CACHE_STALE_SECONDS", "3600"))
+    youtube_search_cache_max_entries: int = int(os.getenv("YOUTUBE_SEARCH_CACHE_MAX_ENTRIES", "1024"))
+    # "single" joins all keywords into one query; "fanout" searches each keyword and genre.
+    youtube_search_mode: str = os.getenv("YOUTUBE_SEARCH_MODE", "single")
+    youtube_fan_out_concurrency: int = int(os.getenv("YOUTUBE_FAN_OUT_CONCURRENCY", "4"))
+    youtube_fan_out_per_query_limit: int = int(os.getenv("YOUTUBE_FAN_OUT_PER_QUERY_LIMIT", "20"))
+    youtube_fan_out_timeout_seconds: float = float(os.getenv("YOUTUBE_FAN_OUT_TIMEOUT_SECONDS", "8"))
+    youtube_client_pool_size: int = int(os.getenv("YOUTUBE_CLIENT_POOL_SIZE", "128"))
+    youtube_client_idle_seconds: float = float(os.getenv("YOUTUBE_CLIENT_IDLE_SECONDS", "900"))
+    youtube_max_concurrency: int = int(os.getenv("YOUTUBE_MAX_CONCURRENCY", "8"))
+    youtube_requests_per_minute: float = float(os.getenv("YOUTUBE_REQUESTS_PER_MINUTE", "120"))
+    youtube_api_base_url: str = os.getenv("YOUTUBE_API_BASE_URL", "https://www.googleapis.com/youtube/v3")
+    youtube_api_concurrency: int = int(os.getenv("YOUTUBE_API_CONCURRENCY", "4"))
+    youtube_api_max_retries: int = int(os.getenv("YOUTUBE_API_MAX_RETRIES", "3"))
+    youtube_api_backoff_seconds: float = float(os.getenv("YOUTUBE_API_BACKOFF_SECONDS", "0.5"))
     google_client_id: str | None = os.getenv("GOOGLE_CLIENT_ID")
     google_client_secret: str | None = os.getenv("GOOGLE_CLIENT_SECRET")
     google_redirect_uri: str = os.getenv("GOOGLE_REDIRECT_URI", "postmessage")
+    google_certs_url: str = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+    google_id_token_cache_ttl_seconds: float = float(os.getenv("GOOGLE_ID_TOKEN_CACHE_TTL_SECONDS", "300"))
+    google_id_token_cache_max_entries: int = int(os.getenv("GOOGLE_ID_TOKEN_CACHE_MAX_ENTRIES", "1024"))
+    google_token_refresh_margin_seconds: float = float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
     google_scopes: tuple[str, ...] = tuple(
         os.getenv(
             "GOOGLE_SCOPES",
@@ -34,18 +62,48 @@ class Settings:
         ).split()
     )
 
+    # Callers queued per upstream before new ones are turned away, and how long one may wait.
+    upstream_max_queue: int = int(os.getenv("UPSTREAM_MAX_QUEUE", "32"))
+    upstream_max_queue_seconds: float = float(os.getenv("UPSTREAM_MAX_QUEUE_SECONDS", "10"))
+
     http_timeout: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+    http_max_connections: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    http_max_keepalive_connections: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
     playlist_min_tracks: int = int(os.getenv("PLAYLIST_MIN_TRACKS", "8"))
     playlist_max_tracks: int = int(os.getenv("PLAYLIST_MAX_TRACKS", "15"))
 
     rate_limit_requests: int = int(os.getenv("RATE_LIMIT_REQUESTS", "20"))
     rate_limit_window: int = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+    # Per route class, within the same window; each class is limited separately. 0 disables a limit.
+    rate_limit_stream_requests: int = int(os.getenv("RATE_LIMIT_STREAM_REQUESTS", "20"))
+    rate_limit_history_requests: int = int(os.getenv("RATE_LIMIT_HISTORY_REQUESTS", "60"))
+    rate_limit_auth_requests: int = int(os.getenv("RATE_LIMIT_AUTH_REQUESTS", "10"))
+    rate_limit_sweep_interval: float = float(os.getenv("RATE_LIMIT_SWEEP_INTERVAL_SECONDS", "60"))
 
     cache_ttl_seconds: int = int(os.getenv("CACHE_TTL_SECONDS", "1800"))
     cache_max_entries: int = int(os.getenv("CACHE_MAX_ENTRIES", "20"))
+    cache_max_total_entries: int = int(os.getenv("CACHE_MAX_TOTAL_ENTRIES", "50000"))
+    cache_max_total_bytes: int = int(os.getenv("CACHE_MAX_TOTAL_BYTES", str(256 * 1024 * 1024)))
+    cache_sweep_interval: float = float(os.getenv("CACHE_SWEEP_INTERVAL_SECONDS", "60"))
+
+    # Where rate limits and device histories live: "memory" (per worker), or shared by all
+    # workers through "sqlite" (one host) or "redis" (any server speaking the Redis protocol).
+    state_backend: str = os.getenv("STATE_BACKEND", "memory")
+    state_sqlite_path: str = os.getenv("STATE_SQLITE_PATH", "data/state.db")
+    state_redis_url: str = os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")
 
     agent_memory: int = int(os.getenv("AGENT_MEMORY", "10"))
 
+    user_store_backend: str = os.getenv("USER_STORE_BACKEND", "json")
+    user_store_path: str = os.getenv("USER_STORE_PATH", "data/users.json")
+    user_store_compact_threshold: int = int(os.getenv("USER_STORE_COMPACT_THRESHOLD", "500"))
+    user_store_compact_interval: float = float(os.getenv("USER_STORE_COMPACT_INTERVAL_SECONDS", "300"))
+    user_store_flush_interval_ms: int = int(os.getenv("USER_STORE_FLUSH_INTERVAL_MS", "0"))
+    user_store_flush_max_pending: int = int(os.getenv("USER_STORE_FLUSH_MAX_PENDING", "100"))
+    user_store_history_cache_users: int = int(os.getenv("USER_STORE_HISTORY_CACHE_USERS", "256"))
+    user_store_sqlite_path: str = os.getenv("USER_STORE_SQLITE_PATH", "data/users.db")
+    track_catalog_path: str = os.getenv("TRACK_CATALOG_PATH", "data/tracks.jsonl")
+
 
 @lru_cache(1)
 def get_settings() -> Settings:
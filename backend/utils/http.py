@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import importlib.util
+
+import httpx
+
+from .config import Settings
+
+
+def http2_available() -> bool:
+    """httpx only speaks HTTP/2 when the optional ``h2`` package is installed."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_http_client(settings: Settings) -> httpx.AsyncClient:
+    """Connection-pooled client shared by outbound API calls for the lifetime of the app."""
+    return httpx.AsyncClient(
+        http2=http2_available(),
+        timeout=settings.http_timeout,
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+        ),
+    )
+
+
+__all__ = ["build_http_client", "http2_available"]
@@ -1,35 +1,159 @@
 from __future__ import annotations
 
 import asyncio
+import math
 import time
-from collections import defaultdict, deque
-from typing import Deque
+from dataclasses import dataclass
+from typing import Any, Mapping
 
 from fastapi import HTTPException, Request, status
 
+from .logger import get_logger
+from .state_backend import StateBackend, StateConflict
+
+logger = get_logger()
+
+# Slack for float rounding: with 7 requests per 60 s, seven intervals of 60/7 s add up to a
+# hair over 60 s, which would otherwise turn the last request of a full burst away.
+_EPSILON = 1e-9
+
+
+@dataclass(frozen=True, slots=True)
+class RateLimit:
+    """``requests`` per ``window_seconds``; 0 requests disables the limit."""
+
+    requests: int
+    window_seconds: float
+
+    def __post_init__(self) -> None:
+        if self.requests < 0 or self.window_seconds <= 0:
+            raise ValueError(f"Invalid rate limit: {self.requests} requests per {self.window_seconds}s")
+
+    @property
+    def interval(self) -> float:
+        """Steady-state spacing between requests once a burst is spent."""
+        return self.window_seconds / self.requests if self.requests else 0.0
+
+
+def _gcra(limit: RateLimit, tat: float | None) -> tuple[float | None, float, float]:
+    """One GCRA step: ``(new TAT or None when rejected, when it expires, seconds to wait)``."""
+    if not limit.requests:
+        return None, 0.0, 0.0
+    now = time.time()
+    new_tat = (now if tat is None else max(tat, now)) + limit.interval
+    excess = new_tat - now - limit.window_seconds
+    if excess > _EPSILON:
+        return None, 0.0, excess
+    return new_tat, new_tat, 0.0
+
 
 class RateLimiter:
-    """Token bucket style limiter per client IP."""
+    """GCRA (generic cell rate algorithm) limiter per client IP and route class.
+
+    Each client keeps one float per route class, its theoretical arrival time (TAT): when
+    its bucket would be full again. A request is admitted unless it would push the TAT more
+    than one window past now, so a client gets a burst of ``requests`` and then one request
+    every ``window / requests`` seconds. A local check never awaits, so on the single event
+    loop it needs no lock. A TAT in the past carries no information; the periodic sweep drops it.
 
-    def __init__(self, max_requests: int, window_seconds: int) -> None:
-        self.max_requests = max_requests
-        self.window = window_seconds
-        self._entries: dict[str, Deque[float]] = defaultdict(deque)
-        self._lock = asyncio.Lock()
+    With a ``backend`` the TATs live there instead and are updated atomically, so every
+    worker process enforces one shared limit. If the backend gives up on a contended key,
+    the request is let through.
+    """
 
-    async def __call__(self, request: Request) -> None:
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: float,
+        *,
+        routes: Mapping[str, RateLimit] | None = None,
+        sweep_interval: float = 60.0,
+        backend: StateBackend | None = None,
+    ) -> None:
+        self.default = RateLimit(max_requests, window_seconds)
+        self.routes = dict(routes or {})
+        self.sweep_interval = sweep_interval
+        self.backend = backend
+        self._tats: dict[tuple[str, str], float] = {}
+        self._sweeper: asyncio.Task[None] | None = None
+        self._allowed = 0
+        self._limited = 0
+        self._evictions = 0
+
+    async def start(self) -> None:
+        if self._sweeper is None and self.sweep_interval > 0 and self.backend is None:
+            self._sweeper = asyncio.create_task(self._sweep_periodically())
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    def limit_for(self, route: str) -> RateLimit:
+        return self.routes.get(route, self.default)
+
+    async def __call__(self, request: Request, route: str = "default") -> None:
         identifier = request.client.host if request.client else "anonymous"
-        async with self._lock:
-            now = time.time()
-            queue = self._entries[identifier]
-            while queue and now - queue[0] > self.window:
-                queue.popleft()
-            if len(queue) >= self.max_requests:
-                raise HTTPException(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail="Muse is vibing too hard right now. Please try again shortly.",
-                )
-            queue.append(now)
-
-
-__all__ = ["RateLimiter"]
+        retry_after = await self.acquire(identifier, route)
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Muse is vibing too hard right now. Please try again shortly.",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    async def acquire(self, identifier: str, route: str = "default") -> float:
+        """Admit one request. Returns 0 when it is allowed, else the seconds until it would be."""
+        limit = self.limit_for(route)
+        if self.backend is not None:
+            try:
+                excess = await self.backend.update(f"rate:{route}:{identifier}", lambda tat: _gcra(limit, tat))
+            except StateConflict as e:
+                # Fail open: a contended key is a busy client, not a reason to refuse everyone.
+                logger.warning("Rate limit not enforced for %s on %s: %s", identifier, route, e)
+                excess = 0.0
+        else:
+            key = (route, identifier)
+            tat, _, excess = _gcra(limit, self._tats.get(key))
+            if tat is not None:
+                self._tats[key] = tat
+        if excess > 0:
+            self._limited += 1
+        else:
+            self._allowed += 1
+        return excess
+
+    async def sweep(self) -> int:
+        """Forget clients that have been idle long enough to be back at a full burst."""
+        now = time.time()
+        idle = [key for key, tat in self._tats.items() if tat <= now]
+        for key in idle:
+            del self._tats[key]
+        self._evictions += len(idle)
+        return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "clients": len(self._tats),
+            "allowed": self._allowed,
+            "limited": self._limited,
+            "evictions": self._evictions,
+        }
+
+    async def _sweep_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error("Rate limiter sweep failed: %s", e)
+
+
+__all__ = ["RateLimit", "RateLimiter"]
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, AsyncIterator
+
+from fastapi import status
+
+from .config import Settings
+
+
+class Priority(IntEnum):
+    """Lower values are served first."""
+
+    INTERACTIVE = 0  # a user is watching a stream
+    STANDARD = 1
+    BACKGROUND = 2
+
+
+_priority: ContextVar[Priority] = ContextVar("upstream_priority", default=Priority.STANDARD)
+
+
+def set_priority(priority: Priority) -> None:
+    """Set the priority of upstream calls made from the current request."""
+    _priority.set(priority)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+class UpstreamBusy(RuntimeError):
+    """An upstream call was turned away instead of queueing past its limits."""
+
+    def __init__(self, upstream: str, message: str, *, retry_after: float, status_code: int) -> None:
+        super().__init__(f"{upstream}: {message}")
+        self.upstream = upstream
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class UpstreamScheduler:
+    """Admission control in front of one upstream API.
+
+    At most ``max_concurrency`` calls run at once, and with ``requests_per_minute`` set they
+    also draw from a token bucket holding one minute's budget. Callers that cannot start
+    right away wait in a queue ordered by ``Priority``, then arrival. Rather than letting a
+    burst pile up until upstream calls time out, a call is refused with ``UpstreamBusy``
+    when the queue already holds ``max_queue`` callers (503), when the budget could not
+    cover it within ``max_queue_seconds`` (429), or when it has waited that long (503).
+
+    The scheduler is only used from the event loop, so it takes no lock.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        max_concurrency: int,
+        requests_per_minute: float = 0,
+        max_queue: int = 32,
+        max_queue_seconds: float = 10.0,
+    ) -> None:
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.max_queue = max_queue
+        self.max_queue_seconds = max_queue_seconds
+        self._rate = requests_per_minute / 60
+        self._tokens = float(requests_per_minute)
+        self._refilled_at = time.monotonic()
+        self._active = 0
+        # (priority, arrival, future); entries whose future is done were abandoned.
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._arrivals = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self._admitted = 0
+        self._rejected = 0
+        self._timeouts = 0
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: Priority | None = None) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: Priority | None = None) -> None:
+        priority = current_priority() if priority is None else priority
+        self._refill()
+        if not self._queued() and self._active < self.max_concurrency and self._has_token():
+            self._take()
+            return
+        self.check(priority)
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, self.max_queue_seconds)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise UpstreamBusy(
+                self.name,
+                f"no capacity within {self.max_queue_seconds:g}s",
+                retry_after=self.max_queue_seconds,
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            ) from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller went away; hand the slot on.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self._active -= 1
+        self._dispatch()
+
+    def check(self, priority: Priority | None = None) -> None:
+        """Raise ``UpstreamBusy`` if a call at ``priority`` would be refused right now."""
+        priority = current_priority() if priority is None else priority
+        self._refill()
+        queued = self._queued()
+        if queued >= self.max_queue:
+            self._rejected += 1
+            raise UpstreamBusy(
+                self.name,
+                "queue is full",
+                retry_after=self._budget_wait(queued) or self.max_queue_seconds,
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        ahead = sum(1 for waiter in self._waiters if waiter[0] <= priority and not waiter[2].done())
+        wait = self._budget_wait(ahead)
+        if wait > self.max_queue_seconds:
+            self._rejected += 1
+            raise UpstreamBusy(
+                self.name,
+                "request budget exhausted",
+                retry_after=wait,
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            )
+
+    def stats(self) -> dict[str, Any]:
+        self._refill()
+        return {
+            "active": self._active,
+            "queued": self._queued(),
+            "tokens": self._tokens if self.requests_per_minute else None,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "timeouts": self._timeouts,
+        }
+
+    def _queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter[2].done())
+
+    def _has_token(self) -> bool:
+        return not self.requests_per_minute or self._tokens >= 1
+
+    def _budget_wait(self, ahead: int) -> float:
+        """Seconds until the budget covers ``ahead`` queued calls plus one more."""
+        if not self.requests_per_minute:
+            return 0.0
+        return max(ahead + 1 - self._tokens, 0.0) / self._rate
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.requests_per_minute:
+            self._tokens = min(self._tokens + (now - self._refilled_at) * self._rate, self.requests_per_minute)
+        self._refilled_at = now
+
+    def _take(self) -> None:
+        self._active += 1
+        self._admitted += 1
+        if self.requests_per_minute:
+            self._tokens -= 1
+
+    def _dispatch(self) -> None:
+        self._refill()
+        while self._waiters and self._active < self.max_concurrency:
+            _, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._has_token():
+                if self._timer is None:
+                    delay = (1 - self._tokens) / self._rate
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+                return
+            heapq.heappop(self._waiters)
+            self._take()
+            future.set_result(None)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+
+def build_upstream_schedulers(settings: Settings) -> dict[str, UpstreamScheduler]:
+    return {
+        "gemini": UpstreamScheduler(
+            "gemini",
+            max_concurrency=settings.gemini_max_concurrency,
+            requests_per_minute=settings.gemini_requests_per_minute,
+            max_queue=settings.upstream_max_queue,
+            max_queue_seconds=settings.upstream_max_queue_seconds,
+        ),
+        "youtube": UpstreamScheduler(
+            "youtube",
+            max_concurrency=settings.youtube_max_concurrency,
+            requests_per_minute=settings.youtube_requests_per_minute,
+            max_queue=settings.upstream_max_queue,
+            max_queue_seconds=settings.upstream_max_queue_seconds,
+        ),
+    }
+
+
+__all__ = [
+    "Priority",
+    "UpstreamBusy",
+    "UpstreamScheduler",
+    "build_upstream_schedulers",
+    "current_priority",
+    "set_priority",
+]
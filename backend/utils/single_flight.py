@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Coalesce concurrent calls that share a key into one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it runs await the
+    same task and receive its result or exception. Each caller awaits through
+    ``asyncio.shield``, so a caller that is cancelled (e.g. its client disconnected) stops
+    waiting without cancelling the shared work for the others.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Task[T]] = {}
+        self._started = 0
+        self._coalesced = 0
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> asyncio.Task[T]:
+        """Return the in-flight task for ``key``, starting ``fn()`` if there is none."""
+        task = self._calls.get(key)
+        if task is not None:
+            self._coalesced += 1
+            return task
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        self._started += 1
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return task
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        return await asyncio.shield(self.start(key, fn))
+
+    def _finish(self, key: Hashable, task: asyncio.Task[T]) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Every waiter may have been cancelled; mark the exception as retrieved anyway.
+            task.exception()
+
+    async def cancel_all(self) -> None:
+        tasks = list(self._calls.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._calls), "started": self._started, "coalesced": self._coalesced}
+
+
+__all__ = ["SingleFlight"]
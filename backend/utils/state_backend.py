@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Optional, Tuple, TypeVar, Union
+from urllib.parse import unquote, urlparse
+
+from .logger import get_logger
+
+logger = get_logger()
+
+T = TypeVar("T")
+
+# Called with a key's current number (None when absent or expired); returns the number to
+# store (None leaves the key as it is), when that number expires, and the caller's result.
+Updater = Callable[[Optional[float]], Tuple[Optional[float], float, T]]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS numbers (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS list_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    item BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS list_items_key ON list_items(key, id DESC);
+"""
+
+
+class SQLiteStateBackend:
+    """Cross-worker state in one SQLite file, for several uvicorn workers on one host.
+
+    ``update`` runs its read-modify-write inside a ``BEGIN IMMEDIATE`` transaction, so two
+    workers never interleave on the same key. ``push`` prepends to a capped list whose items
+    expire individually. Expired rows are deleted by a sweeper between ``start()`` and
+    ``stop()``. Like ``SQLiteUserStore``, queries run in worker threads with one connection
+    each.
+    """
+
+    def __init__(self, db_path: str = "data/state.db", *, sweep_interval: float = 60.0) -> None:
+        self._db_path = db_path
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._sweeper: asyncio.Task[None] | None = None
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        return await asyncio.to_thread(lambda: fn(self._connection()))
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, fn: Callable[[sqlite3.Connection], T]) -> T:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    async def start(self) -> None:
+        if self._sweeper is None and self.sweep_interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep_periodically())
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    async def update(self, key: str, fn: Updater[T]) -> T:
+        def update(conn: sqlite3.Connection) -> T:
+            row = conn.execute(
+                "SELECT value FROM numbers WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+            value, expires_at, result = fn(row[0] if row else None)
+            if value is not None:
+                conn.execute(
+                    "INSERT INTO numbers (key, value, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                    (key, value, expires_at),
+                )
+            return result
+
+        return await self._run(lambda conn: self._write(conn, update))
+
+    async def push(self, key: str, item: bytes, max_items: int, ttl_seconds: float) -> None:
+        def push(conn: sqlite3.Connection) -> None:
+            conn.execute(
+                "INSERT INTO list_items (key, item, expires_at) VALUES (?, ?, ?)",
+                (key, item, time.time() + ttl_seconds),
+            )
+            conn.execute(
+                "DELETE FROM list_items WHERE key = ? AND id <= "
+                "(SELECT id FROM list_items WHERE key = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (key, key, max_items),
+            )
+
+        await self._run(lambda conn: self._write(conn, push))
+
+    async def items(self, key: str) -> list[bytes]:
+        """The list's unexpired items, newest first."""
+
+        def items(conn: sqlite3.Connection) -> list[bytes]:
+            rows = conn.execute(
+                "SELECT item FROM list_items WHERE key = ? AND expires_at > ? ORDER BY id DESC",
+                (key, time.time()),
+            ).fetchall()
+            return [bytes(row[0]) for row in rows]
+
+        return await self._run(items)
+
+    async def sweep(self) -> int:
+        def sweep(conn: sqlite3.Connection) -> int:
+            now = time.time()
+            numbers = conn.execute("DELETE FROM numbers WHERE expires_at <= ?", (now,)).rowcount
+            return numbers + conn.execute("DELETE FROM list_items WHERE expires_at <= ?", (now,)).rowcount
+
+        return await self._run(lambda conn: self._write(conn, sweep))
+
+    async def _sweep_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error("State backend sweep failed: %s", e)
+
+
+class RespError(RuntimeError):
+    """Error reply from a Redis-protocol server."""
+
+
+class StateConflict(RuntimeError):
+    """An ``update`` kept losing to concurrent writers of the same key and gave up."""
+
+
+class _RespConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._reader = reader
+        self._writer = writer
+
+    async def execute(self, *args: Any) -> Any:
+        return (await self.pipeline(args))[0]
+
+    async def pipeline(self, *commands: Tuple[Any, ...]) -> list[Any]:
+        """Send several commands in one write and read their replies in order."""
+        self._writer.write(b"".join(self._encode(command) for command in commands))
+        await self._writer.drain()
+        replies = [await self._read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def close(self) -> None:
+        self._writer.close()
+
+    @staticmethod
+    def _encode(command: Tuple[Any, ...]) -> bytes:
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def _read(self) -> Any:
+        line = await self._reader.readuntil(b"\r\n")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            # Returned rather than raised so the rest of a pipeline or EXEC reply is still read.
+            return RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            return None if length == -1 else (await self._reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length == -1 else [await self._read() for _ in range(length)]
+        raise RespError(f"Unexpected reply: {line!r}")
+
+
+class RedisStateBackend:
+    """Cross-worker state on any server speaking the Redis protocol (RESP).
+
+    ``update`` is an optimistic transaction (``WATCH``, ``GET``, then ``SET`` inside
+    ``MULTI``/``EXEC``), retried when another client wrote the key in between; keys expire
+    through ``PX``. Lists are ``LPUSH`` + ``LTRIM`` + ``PEXPIRE`` in one ``MULTI``, so the
+    list's TTL is refreshed on each push and callers that need per-item expiry store it in
+    the item. Up to ``max_connections`` connections are kept open; ``WATCH`` is
+    per-connection, so each transaction holds one for its duration. Timestamps come from the
+    workers' clocks, which are assumed to agree.
+    """
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        *,
+        max_connections: int = 8,
+        max_attempts: int = 5,
+        retry_delay: float = 0.002,
+    ) -> None:
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise RuntimeError(f"Unsupported state backend URL: {url}")
+        self._host = parsed.hostname or "localhost"
+        self._port = parsed.port or 6379
+        self._password = unquote(parsed.password) if parsed.password else None
+        self._db = int(parsed.path.lstrip("/") or 0)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle: list[_RespConnection] = []
+
+    async def start(self) -> None:
+        async with self._connection() as conn:
+            await conn.execute("PING")
+
+    async def stop(self) -> None:
+        while self._idle:
+            self._idle.pop().close()
+
+    @contextlib.asynccontextmanager
+    async def _connection(self) -> AsyncIterator[_RespConnection]:
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await self._connect()
+            try:
+                yield conn
+            except BaseException:
+                # The connection may be mid-reply or mid-transaction; don't hand it out again.
+                conn.close()
+                raise
+            self._idle.append(conn)
+
+    async def _connect(self) -> _RespConnection:
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+        conn = _RespConnection(reader, writer)
+        if self._password:
+            await conn.execute("AUTH", self._password)
+        if self._db:
+            await conn.execute("SELECT", self._db)
+        return conn
+
+    async def update(self, key: str, fn: Updater[T]) -> T:
+        async with self._connection() as conn:
+            for attempt in range(self.max_attempts):
+                if attempt:
+                    # Jittered, so workers contending for one key stop colliding in lockstep.
+                    await asyncio.sleep(random.uniform(0, self.retry_delay * 2**attempt))
+                _, raw = await conn.pipeline(("WATCH", key), ("GET", key))
+                value, expires_at, result = fn(float(raw) if raw is not None else None)
+                if value is None:
+                    await conn.execute("UNWATCH")
+                    return result
+                ttl_ms = max(int((expires_at - time.time()) * 1000), 1)
+                *_, committed = await conn.pipeline(("MULTI",), ("SET", key, repr(value), "PX", ttl_ms), ("EXEC",))
+                if committed is not None:
+                    return result
+        raise StateConflict(f"{key} was written concurrently on each of {self.max_attempts} attempts")
+
+    async def push(self, key: str, item: bytes, max_items: int, ttl_seconds: float) -> None:
+        async with self._connection() as conn:
+            await conn.pipeline(
+                ("MULTI",),
+                ("LPUSH", key, item),
+                ("LTRIM", key, 0, max_items - 1),
+                ("PEXPIRE", key, max(int(ttl_seconds * 1000), 1)),
+                ("EXEC",),
+            )
+
+    async def items(self, key: str) -> list[bytes]:
+        """The list's items, newest first."""
+        async with self._connection() as conn:
+            return await conn.execute("LRANGE", key, 0, -1)
+
+    async def sweep(self) -> int:
+        # Keys expire on the server.
+        return 0
+
+
+StateBackend = Union[SQLiteStateBackend, RedisStateBackend]
+
+__all__ = ["RedisStateBackend", "RespError", "SQLiteStateBackend", "StateBackend", "StateConflict", "Updater"]